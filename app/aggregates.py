@@ -0,0 +1,90 @@
+from typing import Optional
+from sqlalchemy import text
+from app import models, schemas
+from app.database import upsert
+
+STAR_COLUMNS = ["stars_1", "stars_2", "stars_3", "stars_4", "stars_5"]
+
+stats_table = models.MovieRatingStats.__table__
+
+
+def star_bucket(rating: float) -> int:
+    """Histogram bucket for a rating: the nearest whole star, clamped to 1..5."""
+    for stars, upper in enumerate((1.5, 2.5, 3.5, 4.5), start=1):
+        if rating < upper:
+            return stars
+    return 5
+
+
+def rating_stats_delta(movie_id: int, rating: float, sign: int = 1, dialect: Optional[str] = None,
+                       previous: Optional[float] = None):
+    """Upsert that adds (sign=1) or removes (sign=-1) one rating from a movie's stats.
+
+    With ``previous``, the rating ``previous`` is replaced by ``rating`` instead.
+    """
+    stars = dict.fromkeys(STAR_COLUMNS, 0)
+    stars[STAR_COLUMNS[star_bucket(rating) - 1]] += sign
+    count, total = sign, sign * rating
+    if previous is not None:
+        stars[STAR_COLUMNS[star_bucket(previous) - 1]] -= 1
+        count, total = 0, rating - previous
+    query = upsert(stats_table, dialect).values(movie_id=movie_id, rating_count=count, rating_sum=total, **stars)
+    return query.on_conflict_do_update(
+        index_elements=[stats_table.c.movie_id],
+        set_={
+            "rating_count": stats_table.c.rating_count + count,
+            "rating_sum": stats_table.c.rating_sum + total,
+            **{column: stats_table.c[column] + delta for column, delta in stars.items() if delta},
+        },
+    )
+
+
+def with_rating_stats(query, movie_id_column):
+    """Outer-join a movie query onto its precomputed rating stats."""
+    return query.add_columns(
+        stats_table.c.rating_count,
+        stats_table.c.rating_sum,
+        *[stats_table.c[column] for column in STAR_COLUMNS],
+    ).outerjoin(stats_table, stats_table.c.movie_id == movie_id_column)
+
+
+def summary_dict(movie_id: int, row) -> dict:
+    count = (row["rating_count"] if row is not None else None) or 0
+    return {
+        "movie_id": movie_id,
+        "count": count,
+        "mean": row["rating_sum"] / count if count else None,
+        "histogram": {
+            stars: (row[column] if count else 0) or 0
+            for stars, column in enumerate(STAR_COLUMNS, start=1)
+        },
+    }
+
+
+def summary_fields(movie_id: int, row, included: bool = True) -> dict:
+    """``rating_summary`` for a movie dict, or nothing when it was not asked for."""
+    return {"rating_summary": summary_dict(movie_id, row)} if included else {}
+
+
+def summary_from_row(movie_id: int, row) -> schemas.RatingSummary:
+    return schemas.RatingSummary(**summary_dict(movie_id, row))
+
+
+BACKFILL_RATING_STATS = """
+    INSERT INTO movie_rating_stats
+        (movie_id, rating_count, rating_sum, stars_1, stars_2, stars_3, stars_4, stars_5)
+    SELECT movie_id, COUNT(*), SUM(rating),
+           SUM(CASE WHEN rating < 1.5 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN rating >= 1.5 AND rating < 2.5 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN rating >= 2.5 AND rating < 3.5 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN rating >= 3.5 AND rating < 4.5 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN rating >= 4.5 THEN 1 ELSE 0 END)
+    FROM ratings
+    WHERE movie_id IS NOT NULL
+    GROUP BY movie_id
+"""
+
+
+def backfill_rating_stats(connection):
+    connection.execute(text("DELETE FROM movie_rating_stats"))
+    connection.execute(text(BACKFILL_RATING_STATS))
@@ -0,0 +1,184 @@
+"""Streaming bulk import of movies from NDJSON or CSV.
+
+Input is consumed line by line and written in chunks of ``chunk_size`` rows,
+each chunk in its own transaction with a single ``executemany``. Memory use is
+bounded by the chunk size, not the size of the upload. Invalid rows are
+skipped and reported by line number; only the first ``max_errors`` are kept.
+"""
+import codecs
+import csv
+import os
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Tuple
+
+import orjson
+from pydantic import ValidationError
+
+from app import models, schemas
+from app.database import database
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+
+FORMATS = ("ndjson", "csv")
+CONTENT_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+
+class ImportReport:
+    def __init__(self, max_errors: int = IMPORT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def format_for(content_type: Optional[str]) -> Optional[str]:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return CONTENT_TYPES.get(media_type)
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Split a stream of byte chunks into decoded lines without the newline."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_text_lines(lines: Iterable[str]) -> AsyncIterator[str]:
+    """Adapt a text file (or any iterable of lines) for ``import_movies``."""
+    for line in lines:
+        yield line.rstrip("\r\n")
+
+
+async def parse_ndjson(lines: AsyncIterable[str]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield ``(line_number, record)``; ``record`` is an error message for bad JSON."""
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as exc:
+            yield number, f"Invalid JSON: {exc}"
+            continue
+        yield number, record if isinstance(record, dict) else "Expected a JSON object"
+
+
+async def parse_csv(lines: AsyncIterable[str]) -> AsyncIterator[Tuple[int, object]]:
+    """Yield ``(line_number, record)`` keyed by the header row.
+
+    A quoted field may span several lines; physical lines are joined until
+    the quotes balance, so only one record is ever buffered.
+    """
+    header = None
+    number = start = 0
+    buffered: List[str] = []
+    async for line in lines:
+        number += 1
+        if not buffered:
+            start = number
+        buffered.append(line)
+        text = "\n".join(buffered)
+        if text.count('"') % 2:
+            continue
+        buffered = []
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as exc:
+            yield start, f"Invalid CSV: {exc}"
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, f"Expected {len(header)} fields, got {len(values)}"
+            continue
+        yield start, {name: value or None for name, value in zip(header, values)}
+    if buffered:
+        yield start, "Invalid CSV: unterminated quoted field"
+
+
+def validate(record: dict, owner_id: int, now: datetime) -> dict:
+    """Validate one record the same way ``create_movie`` does and build its row."""
+    movie = schemas.MovieCreate(**record)
+    if not movie.title:
+        raise ValueError("Title is required.")
+    if not movie.description:
+        raise ValueError("Description is required.")
+    return {
+        "title": movie.title,
+        "description": movie.description,
+        "release_date": movie.release_date or now,
+        "user_id": owner_id,
+        "version": 1,
+        "updated_at": now,
+    }
+
+
+def error_message(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+        )
+    return str(exc)
+
+
+async def import_movies(lines: AsyncIterable[str], fmt: str, owner_id: int, db=None,
+                        chunk_size: int = IMPORT_CHUNK_SIZE, max_errors: int = IMPORT_MAX_ERRORS) -> dict:
+    db = database if db is None else db
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+    parser = parse_ndjson if fmt == "ndjson" else parse_csv
+    table = models.Movie.__table__
+    report = ImportReport(max_errors)
+    chunk: List[dict] = []
+
+    async def flush():
+        async with db.transaction():
+            await db.insert_many(table, chunk)
+        report.inserted += len(chunk)
+        chunk.clear()
+
+    now = datetime.utcnow()
+    async for number, record in parser(lines):
+        if isinstance(record, str):
+            report.error(number, record)
+            continue
+        try:
+            chunk.append(validate(record, owner_id, now))
+        except (ValidationError, ValueError, TypeError) as exc:
+            report.error(number, error_message(exc))
+            continue
+        if len(chunk) >= chunk_size:
+            await flush()
+    if chunk:
+        await flush()
+    return report.dict()
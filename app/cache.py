@@ -0,0 +1,292 @@
+"""Read-through cache for hot read endpoints.
+
+The default backend is an in-process LRU. Setting RESPONSE_CACHE_URL to a
+``redis://`` URL shares the cache between workers through anything that
+speaks the Redis protocol (GET/MGET/SET/DEL/INCR).
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import orjson
+
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "")
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+
+class LRUCacheBackend:
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        # Kept apart from the entries so LRU trimming can never reset a counter.
+        self._counters: Dict[str, int] = {}
+
+    async def get(self, key: str):
+        if key in self._counters:
+            return self._counters[key]
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def get_many(self, keys: List[str]) -> list:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value, ttl: float):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def set_many(self, values: Dict[str, Any], ttl: float):
+        for key, value in values.items():
+            await self.set(key, value, ttl)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+        self._counters.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        # Counters never expire and are not subject to LRU eviction.
+        value = self._counters[key] = self._counters.get(key, 0) + 1
+        return value
+
+    async def close(self):
+        self._entries.clear()
+        self._counters.clear()
+
+
+class RedisCacheBackend:
+    """Minimal RESP client; values are stored as orjson-encoded strings."""
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip("AUTH", self.password)
+        if self.db:
+            await self._roundtrip("SELECT", self.db)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Cache server closed the connection")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RuntimeError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            return [await self._read_reply() for _ in range(int(payload))]
+        raise RuntimeError(f"Unexpected cache reply: {line!r}")
+
+    async def _roundtrip(self, *args):
+        return (await self._pipeline([args]))[0]
+
+    async def _pipeline(self, commands: List[tuple]) -> list:
+        """Send every command in one write, then read their replies in order."""
+        parts = []
+        for args in commands:
+            parts.append(f"*{len(args)}\r\n".encode())
+            for arg in args:
+                data = arg if isinstance(arg, bytes) else str(arg).encode()
+                parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._writer.write(b"".join(parts))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def _command(self, *args):
+        return (await self._commands([args]))[0]
+
+    async def _commands(self, commands: List[tuple]) -> list:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._writer is None:
+                await self._connect()
+            try:
+                return await self._pipeline(commands)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # One reconnect; a restarted cache server should not take the API down.
+                await self._connect()
+                return await self._pipeline(commands)
+
+    async def get(self, key: str):
+        data = await self._command("GET", key)
+        return orjson.loads(data) if data is not None else None
+
+    async def get_many(self, keys: List[str]) -> list:
+        if not keys:
+            return []
+        return [orjson.loads(data) if data is not None else None for data in await self._command("MGET", *keys)]
+
+    async def set(self, key: str, value, ttl: float):
+        await self._command("SET", key, orjson.dumps(value), "PX", int(ttl * 1000))
+
+    async def set_many(self, values: Dict[str, Any], ttl: float):
+        if values:
+            await self._commands([("SET", key, orjson.dumps(value), "PX", int(ttl * 1000))
+                                  for key, value in values.items()])
+
+    async def delete(self, key: str):
+        await self._command("DEL", key)
+
+    async def incr(self, key: str) -> int:
+        return await self._command("INCR", key)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+
+class ResponseCache:
+    """Read-through cache with single-flight loading and hit-ratio counters.
+
+    Concurrent misses for the same key share one loader call instead of all
+    hitting the database. Values stored by a loader that raced with an
+    invalidation are discarded. List pages live under a namespace whose
+    generation number is bumped to drop every page at once.
+    """
+
+    def __init__(self, backend, ttl: float = 300):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Per key with loads running: how many, and how often it was invalidated meanwhile.
+        self._loading: Dict[str, int] = {}
+        self._epochs: Dict[str, int] = {}
+
+    async def get(self, key: str):
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]):
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        epoch = self._start_loading(key)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+            if value is not None and self._epochs.get(key, 0) == epoch:
+                await self.backend.set(key, value, self.ttl)
+            future.set_result(value)
+            return value
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            self._finish_loading(key)
+
+    async def get_or_load_many(self, keys: List[str],
+                               loader: Callable[[List[str]], Awaitable[Dict[str, Any]]]) -> list:
+        """Values for ``keys`` in order: one backend read, then one ``loader`` call for every miss.
+
+        ``loader`` receives the missing keys and returns the values it found by
+        key; they are written back together. Misses are not coalesced with
+        other callers' loads, but invalidations during the load still win.
+        """
+        values = await self.backend.get_many(keys)
+        missing = [key for key, value in zip(keys, values) if value is None]
+        self.hits += len(keys) - len(missing)
+        if not missing:
+            return values
+
+        self.misses += len(missing)
+        epochs = {key: self._start_loading(key) for key in missing}
+        try:
+            loaded = await loader(missing)
+            fresh = {key: value for key, value in loaded.items()
+                     if value is not None and self._epochs.get(key, 0) == epochs.get(key)}
+            await self.backend.set_many(fresh, self.ttl)
+        finally:
+            for key in missing:
+                self._finish_loading(key)
+        return [loaded.get(key) if value is None else value for key, value in zip(keys, values)]
+
+    def _start_loading(self, key: str) -> int:
+        self._loading[key] = self._loading.get(key, 0) + 1
+        return self._epochs.get(key, 0)
+
+    def _finish_loading(self, key: str):
+        self._loading[key] -= 1
+        if not self._loading[key]:
+            # Epochs only matter to running loads, so they go with the last one.
+            del self._loading[key]
+            self._epochs.pop(key, None)
+
+    async def invalidate(self, key: str):
+        if key in self._loading:
+            self._epochs[key] = self._epochs.get(key, 0) + 1
+        self._inflight.pop(key, None)
+        await self.backend.delete(key)
+
+    async def generation(self, namespace: str) -> int:
+        return await self.backend.get(f"{namespace}:generation") or 0
+
+    async def bump(self, namespace: str):
+        await self.backend.incr(f"{namespace}:generation")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_backend(url: str = RESPONSE_CACHE_URL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+    if url.startswith("redis://"):
+        return RedisCacheBackend(url)
+    return LRUCacheBackend(max_entries)
+
+
+response_cache = ResponseCache(create_backend(), ttl=RESPONSE_CACHE_TTL_SECONDS)
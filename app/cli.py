@@ -0,0 +1,155 @@
+"""Command-line maintenance tasks.
+
+    python -m app.cli import movies.ndjson --owner tester
+    python -m app.cli import movies.csv --owner tester --chunk-size 5000
+    python -m app.cli export ratings --format csv --output ratings.csv
+    python -m app.cli export movies --after-id 250000 >> movies.ndjson
+    python -m app.cli recommend [--full]
+    python -m app.cli content-index [--rebuild]
+    python -m app.cli leaderboard [--rebuild]
+    python -m app.cli reconcile-counts [--batch-size 1000]
+    python -m app.cli slow-queries [--top 10]
+"""
+import argparse
+import asyncio
+import sys
+from contextlib import nullcontext
+from typing import Optional
+
+import orjson
+from sqlalchemy import select
+
+from app import bulk, counters, export, leaderboard, models, recommender, slow_queries
+from app.content_index import content_index
+from app.database import create_tables, database
+
+
+async def owner_id(username: str) -> int:
+    user_id = await database.fetch_val(select(models.User.id).where(models.User.username == username))
+    if user_id is None:
+        raise SystemExit(f"No user named {username!r}")
+    return user_id
+
+
+async def import_command(args) -> dict:
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    source = nullcontext(sys.stdin) if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+    with source as lines:
+        return await bulk.import_movies(
+            bulk.iter_text_lines(lines), fmt, await owner_id(args.owner),
+            chunk_size=args.chunk_size, max_errors=args.max_errors,
+        )
+
+
+async def export_command(args) -> Optional[dict]:
+    if args.format not in export.formats():
+        raise SystemExit("Parquet export needs pyarrow installed")
+    progress = {}
+    with (nullcontext(sys.stdout.buffer) if args.output == "-" else open(args.output, "wb")) as target:
+        async for data in export.export_stream(args.table, args.format, args.after_id, args.chunk_size,
+                                               progress=progress):
+            target.write(data)
+    if args.output == "-":
+        return None
+    # Pass last_id back as --after-id to resume an interrupted export.
+    return {"table": args.table, "rows": progress["rows"], "last_id": progress["last_id"]}
+
+
+async def recommend_command(args) -> dict:
+    return await recommender.refresh_similar(k=args.k, full=args.full, adjusted=not args.plain_cosine)
+
+
+async def content_index_command(args) -> dict:
+    stats = await content_index.catch_up(rebuild=args.rebuild)
+    return {**stats, "movies": len(content_index.rows), "path": content_index.path}
+
+
+async def leaderboard_command(args) -> dict:
+    today = leaderboard.day_number()
+    async with database.transaction():
+        for sql, params in leaderboard.roll_statements(today, rebuild_all_time=args.rebuild):
+            await database.execute(sql, params)
+    return {"rolled_day": today, "rebuilt_all_time": args.rebuild}
+
+
+async def reconcile_counts_command(args) -> dict:
+    return await counters.reconcile(batch_size=args.batch_size, after_id=args.after_id)
+
+
+async def slow_queries_command(args) -> dict:
+    return {"path": args.path, "top": slow_queries.summarize(args.path, args.top)}
+
+
+COMMANDS = {
+    "import": import_command,
+    "export": export_command,
+    "recommend": recommend_command,
+    "content-index": content_index_command,
+    "leaderboard": leaderboard_command,
+    "reconcile-counts": reconcile_counts_command,
+    "slow-queries": slow_queries_command,
+}
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="bulk import movies from NDJSON or CSV")
+    import_parser.add_argument("path", help="file to import, or - for stdin")
+    import_parser.add_argument("--owner", required=True, help="username the movies are created for")
+    import_parser.add_argument("--format", choices=bulk.FORMATS, help="defaults to the file extension")
+    import_parser.add_argument("--chunk-size", type=int, default=bulk.IMPORT_CHUNK_SIZE)
+    import_parser.add_argument("--max-errors", type=int, default=bulk.IMPORT_MAX_ERRORS)
+
+    export_parser = commands.add_parser("export", help="stream a table as NDJSON, CSV or Parquet")
+    export_parser.add_argument("table", choices=export.EXPORTS)
+    export_parser.add_argument("--format", choices=list(export.MEDIA_TYPES), default="ndjson")
+    export_parser.add_argument("--output", default="-", help="file to write, or - for stdout")
+    export_parser.add_argument("--after-id", type=int, default=0, help="resume after this id")
+    export_parser.add_argument("--chunk-size", type=int, default=export.EXPORT_CHUNK_SIZE)
+
+    recommend_parser = commands.add_parser("recommend", help="refresh the similar-movies table from ratings")
+    recommend_parser.add_argument("--full", action="store_true",
+                                  help="recompute every movie, not just changed ones")
+    recommend_parser.add_argument("--k", type=int, default=recommender.SIMILAR_TOP_K, help="neighbours per movie")
+    recommend_parser.add_argument("--plain-cosine", action="store_true",
+                                  help="skip centring ratings on each user's mean")
+
+    content_parser = commands.add_parser("content-index",
+                                         help="index new, changed and deleted movies for content similarity")
+    content_parser.add_argument("--rebuild", action="store_true",
+                                help="start over, re-weighting every movie with current IDF")
+
+    leaderboard_parser = commands.add_parser("leaderboard", help="roll the leaderboards forward and rescore them")
+    leaderboard_parser.add_argument("--rebuild", action="store_true",
+                                    help="also rebuild the all-time board from movie_rating_stats")
+
+    reconcile_parser = commands.add_parser("reconcile-counts", help="repair drifted movie comment counts")
+    reconcile_parser.add_argument("--batch-size", type=int, default=counters.RECONCILE_BATCH_SIZE)
+    reconcile_parser.add_argument("--after-id", type=int, default=0, help="resume after this movie id")
+
+    slow_parser = commands.add_parser("slow-queries", help="summarise the slow-query log by total time")
+    slow_parser.add_argument("--path", default=slow_queries.SLOW_QUERY_LOG_PATH)
+    slow_parser.add_argument("--top", type=int, default=10, help="how many statement shapes to show")
+    return parser
+
+
+async def run(args):
+    await database.connect()
+    try:
+        await create_tables()
+        return await COMMANDS[args.command](args)
+    finally:
+        await database.disconnect()
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    result = asyncio.run(run(args))
+    if result is not None:
+        sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2) + b"\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""Content-based similarity over movie titles and descriptions.
+
+Each movie becomes a hashed TF-IDF vector of its words and word bigrams
+(title terms count double), folded into ``CONTENT_INDEX_DIM`` signed buckets
+and L2-normalised. Vectors live in a float32 memory-mapped file, one row per
+movie, so the index costs ``4 * dim`` bytes per movie on disk and the OS page
+cache decides how much of it stays in memory.
+
+IDF weights are taken from the document frequencies at the time a movie is
+indexed, so older vectors drift slightly as the catalogue grows;
+``catch_up(rebuild=True)`` re-weights everything, building a fresh copy next to
+the index and swapping it in.
+
+``catch_up`` is the only writer: it indexes movies with a higher id than its
+last scan reached, re-indexes those updated since, drops deleted ones, and
+holds a file lock so two runs never write at once. It works on a copy of the
+files and swaps the copy in, so readers never see a half-written row. The app
+runs it every ``CONTENT_INDEX_CATCH_UP_SECONDS`` and soon after any movie
+write (``catch_up_periodically``); ``python -m app.cli content-index`` runs it
+by hand. Request handlers only read, reloading the matrix whenever a run has
+written a new ``meta.json``.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app import models
+from app.database import database
+from app.export import EXPORT_CHUNK_SIZE, iter_chunks
+
+try:
+    import fcntl
+except ImportError:  # no cross-process lock on Windows; run one catch_up at a time there
+    fcntl = None
+
+CONTENT_INDEX_PATH = os.getenv("CONTENT_INDEX_PATH", "./content_index")
+CONTENT_INDEX_DIM = int(os.getenv("CONTENT_INDEX_DIM", "512"))
+# Rows scored per block by ``scan``; bounds the temporary score matrix.
+CONTENT_INDEX_BLOCK_ROWS = int(os.getenv("CONTENT_INDEX_BLOCK_ROWS", "65536"))
+# Longest wait between background catch-ups; 0 leaves updates to the CLI.
+CONTENT_INDEX_CATCH_UP_SECONDS = float(os.getenv("CONTENT_INDEX_CATCH_UP_SECONDS", "60"))
+
+logger = logging.getLogger("uvicorn.error")
+
+TITLE_WEIGHT = 2
+TOKEN = re.compile(r"\w+")
+# Updates stamped just before a scan may commit just after it; re-reading a
+# minute of them is cheap and catches those.
+UPDATE_OVERLAP = timedelta(minutes=1)
+
+
+def features(title: Optional[str], description: Optional[str]) -> Counter:
+    counts = Counter()
+    for text, weight in ((title, TITLE_WEIGHT), (description, 1)):
+        words = TOKEN.findall((text or "").lower())
+        for term in words + [f"{first} {second}" for first, second in zip(words, words[1:])]:
+            counts[term] += weight
+    return counts
+
+
+def bucket(term: str, dim: int) -> Tuple[int, float]:
+    # A stable hash (unlike hash()) keeps vectors valid across processes.
+    digest = zlib.crc32(term.encode())
+    return digest % dim, 1.0 if digest & 0x80000000 else -1.0
+
+
+def scan(vectors: np.ndarray, ids: np.ndarray, count: int, queries: np.ndarray, k: int,
+         exclude: Optional[List[Optional[int]]] = None,
+         block_rows: int = CONTENT_INDEX_BLOCK_ROWS) -> List[List[Tuple[int, float]]]:
+    """Best ``k`` ``(movie_id, score)`` per query vector, scanning the first ``count`` rows in blocks.
+
+    ``exclude[i]`` is a row to leave out of query i's results (its own movie).
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    for start in range(0, count, block_rows):
+        stop = min(start + block_rows, count)
+        scores = queries @ vectors[start:stop].T
+        scores[:, ids[start:stop] == 0] = -np.inf
+        for query, row in enumerate(exclude or []):
+            if row is not None and start <= row < stop:
+                scores[query, row - start] = -np.inf
+        scores = np.concatenate([best_scores, scores], axis=1)
+        block = np.broadcast_to(np.arange(start, stop), (len(queries), stop - start))
+        rows = np.concatenate([best_rows, block], axis=1)
+        keep = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+
+    results = []
+    for scores, rows in zip(best_scores, best_rows):
+        order = np.argsort(-scores, kind="stable")
+        results.append([(int(ids[rows[i]]), float(scores[i])) for i in order if scores[i] > 0])
+    return results
+
+
+class ContentIndex:
+    """Memory-mapped matrix of unit vectors, with movie ids and bucket document frequencies."""
+
+    def __init__(self, path: str = CONTENT_INDEX_PATH, dim: int = CONTENT_INDEX_DIM):
+        self.path = path
+        self.dim = dim
+        self.count = 0
+        self.docs = 0
+        self.scanned_id = 0
+        self.indexed_at: Optional[datetime] = None
+        self.generation = 0  # bumped by every flush, so readers can tell when to remap
+        self.vectors = self.ids = self.df = None
+        self.rows: Dict[int, int] = {}
+        self.writable = False
+        self._reading = threading.Lock()
+        self._lock: Optional[asyncio.Lock] = None
+        self._wanted: Optional[asyncio.Event] = None
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self._file("meta.json")) as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return {}
+
+    def _open(self, writable: bool = True):
+        """Map the files; writers create them, readers see an empty index until a writer has run."""
+        if self.vectors is not None and (self.writable or not writable):
+            return
+        meta = self._read_meta()
+        if meta.get("dim", self.dim) != self.dim:
+            if writable:
+                raise ValueError(f"{self.path} was built with dim={meta['dim']}; rebuild it for dim={self.dim}")
+            meta = {}
+        if not meta and not writable:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self.count = meta.get("count", 0)
+        self.docs = meta.get("docs", 0)
+        self.scanned_id = meta.get("scanned_id", 0)
+        self.indexed_at = datetime.fromisoformat(meta["indexed_at"]) if meta.get("indexed_at") else None
+        self.generation = meta.get("generation", 0)
+        self.writable = writable
+        self._map(max(1024, self.count), fresh=not meta)
+        self.rows = {movie_id: row for row, movie_id in enumerate(self.ids[:self.count].tolist()) if movie_id}
+
+    def refresh(self):
+        """Reload the mapping if a writer has flushed since it was read."""
+        if self.writable:
+            return
+        generation = self._read_meta().get("generation")
+        if self.vectors is None or generation != self.generation:
+            self.vectors = None
+            self._open(writable=False)
+
+    def _map(self, capacity: int, fresh: bool = False):
+        if self.writable:
+            for name, itemsize in (("vectors.f32", 4 * self.dim), ("ids.i64", 8), ("df.i64", 8)):
+                size = (self.dim if name == "df.i64" else capacity) * itemsize
+                mode = "r+b" if not fresh and os.path.exists(self._file(name)) else "w+b"
+                with open(self._file(name), mode) as handle:
+                    if fresh:
+                        handle.truncate(0)
+                    if os.fstat(handle.fileno()).st_size < size:
+                        handle.truncate(size)
+        else:
+            # Readers map only the rows the meta.json they read vouches for.
+            capacity = max(self.count, 1)
+        mode = "r+" if self.writable else "r"
+        self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+        self.ids = np.memmap(self._file("ids.i64"), dtype=np.int64, mode=mode, shape=(capacity,))
+        self.df = np.memmap(self._file("df.i64"), dtype=np.int64, mode=mode, shape=(self.dim,))
+
+    def flush(self):
+        self.vectors.flush()
+        self.ids.flush()
+        self.df.flush()
+        self.generation += 1
+        meta = {"dim": self.dim, "count": self.count, "docs": self.docs, "scanned_id": self.scanned_id,
+                "indexed_at": self.indexed_at.isoformat() if self.indexed_at else None, "generation": self.generation}
+        with open(self._file("meta.json.tmp"), "w") as handle:
+            json.dump(meta, handle)
+        os.replace(self._file("meta.json.tmp"), self._file("meta.json"))
+
+    def hashed(self, title: Optional[str], description: Optional[str]) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for term, count in features(title, description).items():
+            index, sign = bucket(term, self.dim)
+            vector[index] += sign * (1 + math.log(count))
+        return vector
+
+    def vectorize(self, title: Optional[str], description: Optional[str], count: bool = True) -> np.ndarray:
+        """Unit TF-IDF vector; with ``count`` the document is first added to ``df``."""
+        vector = self.hashed(title, description)
+        present = vector != 0
+        if count:
+            self.df[present] += 1
+            self.docs += 1
+        idf = np.log((1 + self.docs) / (1 + self.df[present])) + 1
+        vector[present] *= idf.astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _forget(self, row: int):
+        present = self.vectors[row] != 0
+        self.df[present] -= 1
+        self.docs -= 1
+        self.vectors[row] = 0
+
+    def upsert(self, movie_id: int, title: Optional[str], description: Optional[str], flush: bool = True,
+               count: bool = True):
+        """Write one movie's vector. Only ``catch_up`` (or a test owning the files) should call this."""
+        self._open()
+        row = self.rows.get(movie_id)
+        if row is None:
+            row = self.count
+            if row >= len(self.ids):
+                self.flush()
+                self._map(2 * len(self.ids))
+            self.count += 1
+            self.ids[row] = movie_id
+            self.rows[movie_id] = row
+        elif count:
+            self._forget(row)
+        self.vectors[row] = self.vectorize(title, description, count)
+        if flush:
+            self.flush()
+
+    def remove(self, movie_id: int, flush: bool = True):
+        self._open()
+        row = self.rows.pop(movie_id, None)
+        if row is not None:
+            self._forget(row)
+            self.ids[row] = 0
+            if flush:
+                self.flush()
+
+    def similar(self, movie_ids: Iterable[int], k: int) -> Dict[int, List[Tuple[int, float]]]:
+        """Neighbours of already-indexed movies, computed in one batched pass.
+
+        Never writes: movies created since the last ``catch_up`` have no
+        neighbours until it runs again. Safe to call from executor threads.
+        """
+        with self._reading:
+            self.refresh()
+            if self.vectors is None:
+                return {}
+            # A refresh on another thread swaps these out rather than changing them.
+            vectors, ids, count = self.vectors, self.ids, self.count
+            movie_ids = [movie_id for movie_id in movie_ids if movie_id in self.rows]
+            rows = [self.rows[movie_id] for movie_id in movie_ids]
+        if not rows:
+            return {}
+        return dict(zip(movie_ids, scan(vectors, ids, count, vectors[rows], k, exclude=rows)))
+
+    def _index(self, movies: List[Dict], count: bool = True):
+        for movie in movies:
+            self.upsert(movie["id"], movie["title"], movie["description"], flush=False, count=count)
+
+    def _count_documents(self, movies: List[Dict]):
+        for movie in movies:
+            self.df[self.hashed(movie["title"], movie["description"]) != 0] += 1
+            self.docs += 1
+
+    async def catch_up(self, rebuild: bool = False, db=None) -> Dict[str, int]:
+        """Bring the index up to date with the movies table; the index's only writer.
+
+        New movies are those above ``scanned_id``, the end of the last scan;
+        updated ones have ``updated_at`` past the last run; deleted ones are
+        found by checking every indexed id. Changes are written to a copy of
+        the index, which is swapped in whole so readers never see it half
+        written; a run that finds nothing to do copies nothing. A rebuild
+        fills an empty copy instead, reading the movies twice (document
+        frequencies first, then vectors weighted by the final IDF). Vector
+        maths runs in the default executor.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path.rstrip(os.sep) + ".lock", "w") as lock:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        raise RuntimeError(f"another process is already updating {self.path}") from None
+                db = database if db is None else db
+                if rebuild:
+                    return await self._rebuild(db)
+                return await self._catch_up(db)
+
+    async def _catch_up(self, db) -> Dict[str, int]:
+        loop = asyncio.get_running_loop()
+        with self._reading:
+            self.refresh()  # what the last writer left
+        started = datetime.utcnow()
+        stats = {"indexed": 0, "updated": 0, "removed": 0}
+
+        changed = []
+        if self.indexed_at is not None:
+            changed = await db.fetch_all(
+                select(models.Movie.id, models.Movie.title, models.Movie.description)
+                .where(models.Movie.id <= self.scanned_id, models.Movie.updated_at > self.indexed_at - UPDATE_OVERLAP)
+                .order_by(models.Movie.id)
+            )
+        gone = []
+        indexed = sorted(self.rows)
+        for start in range(0, len(indexed), EXPORT_CHUNK_SIZE):
+            chunk = indexed[start:start + EXPORT_CHUNK_SIZE]
+            rows = await db.fetch_all(select(models.Movie.id).where(models.Movie.id.in_(chunk)))
+            gone += sorted(set(chunk) - {row["id"] for row in rows})
+        new = await db.fetch_val(select(models.Movie.id).where(models.Movie.id > self.scanned_id).limit(1))
+        if self.vectors is not None and not changed and not gone and new is None:
+            return stats
+
+        staging = ContentIndex(self._staging_path(".staging"), self.dim)
+        if self.vectors is not None:
+            await loop.run_in_executor(None, shutil.copytree, self.path, staging.path)
+        staging._open()
+        await loop.run_in_executor(None, staging._index, [dict(movie._mapping) for movie in changed])
+        stats["updated"] = len(changed)
+        for movie_id in gone:
+            staging.remove(movie_id, flush=False)
+        stats["removed"] = len(gone)
+        async for movies in iter_chunks("movies", after_id=staging.scanned_id, db=db):
+            await loop.run_in_executor(None, staging._index, movies)
+            stats["indexed"] += len(movies)
+            staging.scanned_id = movies[-1]["id"]
+        staging.indexed_at = started
+        staging.flush()
+        self._swap_in(staging.path)
+        return stats
+
+    async def _rebuild(self, db) -> Dict[str, int]:
+        loop = asyncio.get_running_loop()
+        fresh = ContentIndex(self._staging_path(".rebuild"), self.dim)
+        fresh._open()
+        fresh.indexed_at = datetime.utcnow()
+        fresh.generation = self._read_meta().get("generation", 0)
+        async for movies in iter_chunks("movies", db=db):
+            await loop.run_in_executor(None, fresh._count_documents, movies)
+        async for movies in iter_chunks("movies", db=db):
+            await loop.run_in_executor(None, fresh._index, movies, False)
+            fresh.scanned_id = movies[-1]["id"]
+        fresh.flush()
+        self._swap_in(fresh.path)
+        return {"indexed": len(fresh.rows), "updated": 0, "removed": 0}
+
+    def _staging_path(self, suffix: str) -> str:
+        staging = self.path.rstrip(os.sep) + suffix
+        shutil.rmtree(staging, ignore_errors=True)
+        return staging
+
+    def _swap_in(self, staging: str):
+        # Readers keep their mappings of the old files until they notice the new meta.json.
+        retired = self._staging_path(".old")
+        if os.path.exists(self.path):
+            os.rename(self.path, retired)
+        os.rename(staging, self.path)
+        shutil.rmtree(retired, ignore_errors=True)
+        if self.writable:
+            self.vectors = None
+            self._open()
+
+    def request_catch_up(self):
+        """Ask ``catch_up_periodically`` to run soon; called after movie writes."""
+        if self._wanted is not None:
+            self._wanted.set()
+
+    async def catch_up_periodically(self, interval: float = CONTENT_INDEX_CATCH_UP_SECONDS):
+        """Catch up now, then every ``interval`` seconds or as soon as a movie write asks for it.
+
+        Writes made while a run is in progress wake the loop again, so they are
+        picked up by the next run rather than lost. With several workers only
+        one holds the lock at a time; the others retry on their next wake-up.
+        """
+        self._wanted = asyncio.Event()
+        self._wanted.set()
+        while True:
+            try:
+                await asyncio.wait_for(self._wanted.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wanted.clear()
+            try:
+                await self.catch_up()
+            except RuntimeError as e:
+                logger.info(f"Content index catch-up skipped: {str(e)}")
+            except Exception as e:
+                logger.error(f"Content index catch-up failed: {str(e)}")
+
+
+content_index = ContentIndex()
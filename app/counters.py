@@ -0,0 +1,61 @@
+"""Denormalised comment counts on ``movies``.
+
+``comment_count`` is adjusted in the same transaction as the comment write
+that changes it (through ``bump_comments_version``), so list pages can show it
+without counting. ``reconcile`` recomputes it in id-ordered batches and
+repairs any drift (rows written outside the API, manual fixes, older code
+paths). Rating counts need no counter of their own: ``movie_rating_stats``
+(app.aggregates) already keeps them exact.
+"""
+import os
+
+from sqlalchemy import func, select, update
+
+from app import models
+from app.database import database
+
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "1000"))
+
+
+def with_comment_count(query):
+    """Add the comment counter to a movie query; read it back with ``counts_dict``."""
+    return query.add_columns(models.Movie.comment_count)
+
+
+def counts_dict(row, comments: bool = False, ratings: bool = False) -> dict:
+    """The requested counts; ``ratings`` needs the columns ``aggregates.with_rating_stats`` adds."""
+    counts = {}
+    if comments:
+        counts["comment_count"] = row["comment_count"]
+    if ratings:
+        counts["rating_count"] = row["rating_count"] or 0
+    return counts
+
+
+def actual_comment_count():
+    """Correlated subquery counting a movie's comments."""
+    return select(func.count()).where(models.Comment.movie_id == models.Movie.id).scalar_subquery()
+
+
+async def reconcile(batch_size: int = RECONCILE_BATCH_SIZE, after_id: int = 0, db=None) -> dict:
+    """Check every movie after ``after_id`` and rewrite the counters that drifted."""
+    db = database if db is None else db
+    comments = actual_comment_count()
+    checked = repaired = 0
+    while True:
+        rows = await db.fetch_all(
+            select(models.Movie.id, models.Movie.comment_count, comments.label("comments"))
+            .where(models.Movie.id > after_id)
+            .order_by(models.Movie.id)
+            .limit(batch_size)
+        )
+        if not rows:
+            break
+        drifted = [row["id"] for row in rows if row["comment_count"] != row["comments"]]
+        if drifted:
+            # Recount while writing, so concurrent comments are not overwritten.
+            await db.execute(update(models.Movie).where(models.Movie.id.in_(drifted)).values(comment_count=comments))
+        checked += len(rows)
+        repaired += len(drifted)
+        after_id = rows[-1]["id"]
+    return {"movies": checked, "repaired": repaired, "last_id": after_id}
@@ -0,0 +1,168 @@
+"""Streaming export of movies, ratings and comments.
+
+Rows are read in id order, ``chunk_size`` at a time, each chunk seeking past
+the last id of the one before. No connection or read transaction is held
+between chunks, memory stays bounded by one chunk, and an interrupted export
+resumes by passing the last id received as ``after_id``.
+
+Parquet output needs pyarrow; NDJSON and CSV are always available.
+"""
+import csv
+import io
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+import orjson
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import DateTime, Float, Integer, select
+
+from app import models
+from app.database import database
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+EXPORTS = ("movies", "ratings", "comments")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def export_columns(name: str) -> List:
+    if name == "movies":
+        movie = models.Movie
+        return [movie.id, movie.title, movie.description, movie.release_date, movie.user_id.label("owner_id")]
+    if name == "ratings":
+        rating = models.Rating
+        return [rating.id, rating.rating, rating.movie_id, rating.user_id]
+    if name == "comments":
+        comment = models.Comment
+        return [comment.id, comment.content, comment.movie_id, comment.user_id, comment.parent_comment_id,
+                comment.created_at]
+    raise ValueError(f"Unknown export {name!r}")
+
+
+def formats() -> List[str]:
+    return [fmt for fmt in MEDIA_TYPES if fmt != "parquet" or pyarrow is not None]
+
+
+async def iter_chunks(name: str, after_id: int = 0, chunk_size: int = EXPORT_CHUNK_SIZE,
+                      db=None) -> AsyncIterator[List[Dict]]:
+    db = database if db is None else db
+    columns = export_columns(name)
+    id_column = columns[0]
+    last_id = after_id
+    while True:
+        query = select(*columns).where(id_column > last_id).order_by(id_column).limit(chunk_size)
+        rows = [dict(row._mapping) for row in await db.fetch_all(query)]
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+def encode_ndjson(rows: List[Dict]) -> bytes:
+    return b"".join(orjson.dumps(row) + b"\n" for row in rows)
+
+
+def encode_csv(rows: List) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        values = row.values() if isinstance(row, dict) else row
+        writer.writerow(value.isoformat() if isinstance(value, datetime) else value for value in values)
+    return buffer.getvalue().encode()
+
+
+class ChunkSink:
+    """Write-only file for ParquetWriter that hands back what was written so far."""
+
+    closed = False
+
+    def __init__(self):
+        self.position = 0
+        self.parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def arrow_schema(name: str):
+    types = {Integer: pyarrow.int64(), Float: pyarrow.float64(), DateTime: pyarrow.timestamp("us")}
+    fields = []
+    for column in export_columns(name):
+        arrow_type = next((value for kind, value in types.items() if isinstance(column.type, kind)),
+                          pyarrow.string())
+        fields.append(pyarrow.field(column.key, arrow_type))
+    return pyarrow.schema(fields)
+
+
+async def export_stream(name: str, fmt: str, after_id: int = 0, chunk_size: int = EXPORT_CHUNK_SIZE,
+                        db=None, progress: Optional[dict] = None) -> AsyncIterator[bytes]:
+    """Yield the encoded export; ``progress`` (if given) tracks rows and the last id."""
+    if progress is None:
+        progress = {}
+    progress.update(rows=0, last_id=after_id)
+
+    writer = sink = None
+    if fmt == "csv":
+        yield encode_csv([[column.key for column in export_columns(name)]])
+    elif fmt == "parquet":
+        sink = ChunkSink()
+        writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode="w"), arrow_schema(name))
+
+    async for rows in iter_chunks(name, after_id, chunk_size, db):
+        if fmt == "ndjson":
+            yield encode_ndjson(rows)
+        elif fmt == "csv":
+            yield encode_csv(rows)
+        else:
+            writer.write_table(pyarrow.Table.from_pylist(rows, schema=writer.schema))
+            yield sink.drain()
+        progress["rows"] += len(rows)
+        progress["last_id"] = rows[-1]["id"]
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def export_response(name: str, fmt: str, after_id: int = 0) -> StreamingResponse:
+    if fmt not in formats():
+        detail = "Parquet export needs pyarrow installed" if fmt == "parquet" else \
+            f"Unsupported format; expected one of {', '.join(formats())}"
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    filename = f"{name}.{fmt}" if not after_id else f"{name}-after-{after_id}.{fmt}"
+    return StreamingResponse(
+        export_stream(name, fmt, after_id),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
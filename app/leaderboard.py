@@ -0,0 +1,233 @@
+"""Top-rated leaderboards ranked by Bayesian average.
+
+A movie's score is ``(C * m + sum) / (C + count)``: its ratings plus ``C``
+pseudo-ratings at the window's mean ``m``, so a single 5-star rating does not
+outrank hundreds of 4.8s. The prior is frozen between daily rolls, which
+makes a new rating one upsert (one index update, O(log n)) per window.
+
+The 7- and 30-day windows are rebuilt from per-day buckets once per UTC day,
+dropping ratings that have aged out; each window's prior is then refreshed
+and its rows rescored. All-time rows are only ever rescored. Rolling happens
+at startup and from a background check (``roll_periodically``), never inside
+a request.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+
+from app import models
+from app.database import database, upsert
+from app.pagination import decode_key_cursor, encode_key_cursor
+
+LEADERBOARD_PRIOR_WEIGHT = float(os.getenv("LEADERBOARD_PRIOR_WEIGHT", "10"))
+LEADERBOARD_ROLL_CHECK_SECONDS = float(os.getenv("LEADERBOARD_ROLL_CHECK_SECONDS", "300"))
+
+logger = logging.getLogger("uvicorn.error")
+
+# Window name -> length in days; 0 is all time.
+WINDOWS = {"all": 0, "30d": 30, "7d": 7}
+KEEP_DAYS = max(WINDOWS.values())
+
+daily_table = models.MovieRatingDaily.__table__
+leaderboard_table = models.Leaderboard.__table__
+state_table = models.LeaderboardState.__table__
+
+Priors = Dict[int, Tuple[float, float]]
+
+REFRESH_PRIOR = """
+    INSERT INTO leaderboard_state (window_days, rolled_day, prior_mean, prior_weight)
+    SELECT CAST(:window_days AS INTEGER), CAST(:today AS INTEGER),
+           COALESCE(SUM(rating_sum) / SUM(rating_count), 0), CAST(:prior_weight AS FLOAT)
+    FROM leaderboard
+    WHERE window_days = :window_days AND rating_count > 0
+    ON CONFLICT (window_days) DO UPDATE SET
+        rolled_day = excluded.rolled_day, prior_mean = excluded.prior_mean, prior_weight = excluded.prior_weight
+"""
+
+RESCORE = """
+    UPDATE leaderboard SET score = (
+        (SELECT prior_weight * prior_mean FROM leaderboard_state
+         WHERE leaderboard_state.window_days = leaderboard.window_days) + rating_sum
+    ) / (
+        (SELECT prior_weight FROM leaderboard_state
+         WHERE leaderboard_state.window_days = leaderboard.window_days) + rating_count
+    )
+    WHERE window_days = :window_days
+"""
+
+# A window that has never been rolled gets a placeholder state row for CLAIM to move.
+ADD_STATE = """
+    INSERT INTO leaderboard_state (window_days, rolled_day, prior_mean, prior_weight)
+    VALUES (:window_days, 0, 0, :prior_weight)
+    ON CONFLICT (window_days) DO NOTHING
+"""
+
+# Compare-and-set: of several workers rolling at once, only one sees each window come back.
+CLAIM = """
+    UPDATE leaderboard_state SET rolled_day = :today
+    WHERE rolled_day < :today
+    RETURNING window_days
+"""
+
+REBUILD_ALL_TIME = """
+    INSERT INTO leaderboard (window_days, movie_id, rating_count, rating_sum, score)
+    SELECT 0, movie_id, rating_count, rating_sum, 0
+    FROM movie_rating_stats
+    WHERE rating_count > 0
+"""
+
+REBUILD_WINDOW = """
+    INSERT INTO leaderboard (window_days, movie_id, rating_count, rating_sum, score)
+    SELECT CAST(:window_days AS INTEGER), movie_id, SUM(rating_count), SUM(rating_sum), 0
+    FROM movie_rating_daily
+    WHERE day >= :first_day
+    GROUP BY movie_id
+"""
+
+
+def day_number(moment: Optional[datetime] = None) -> int:
+    return (moment or datetime.utcnow()).date().toordinal()
+
+
+def in_window(window_days: int, day: int, today: int) -> bool:
+    return window_days == 0 or day > today - window_days
+
+
+def roll_statements(today: int, windows=None, prior_weight: float = LEADERBOARD_PRIOR_WEIGHT,
+                    rebuild_all_time: bool = False) -> List[Tuple[str, dict]]:
+    """SQL and parameters that roll ``windows`` (default: all) forward to ``today``."""
+    statements = []
+    for window_days in (WINDOWS.values() if windows is None else windows):
+        params = {"window_days": window_days, "today": today, "prior_weight": prior_weight,
+                  "first_day": today - window_days + 1}
+        sqls = [REFRESH_PRIOR, RESCORE]
+        if window_days or rebuild_all_time:
+            sqls[:0] = ["DELETE FROM leaderboard WHERE window_days = :window_days",
+                        REBUILD_WINDOW if window_days else REBUILD_ALL_TIME]
+        # Only pass the parameters each statement uses; text() rejects the rest.
+        statements += [(sql, {key: value for key, value in params.items() if f":{key}" in sql}) for sql in sqls]
+    statements.append(("DELETE FROM movie_rating_daily WHERE day <= :oldest", {"oldest": today - KEEP_DAYS}))
+    return statements
+
+
+def rating_statements(movie_id: int, rating: float, priors: Priors, day: int, today: int, sign: int = 1,
+                      dialect: Optional[str] = None) -> list:
+    """Upserts adding (sign=1) or removing (sign=-1) one rating made on ``day``."""
+    statements = []
+    if day > today - KEEP_DAYS:
+        statements.append(
+            upsert(daily_table, dialect)
+            .values(movie_id=movie_id, day=day, rating_count=sign, rating_sum=sign * rating)
+            .on_conflict_do_update(
+                index_elements=[daily_table.c.movie_id, daily_table.c.day],
+                set_={
+                    "rating_count": daily_table.c.rating_count + sign,
+                    "rating_sum": daily_table.c.rating_sum + sign * rating,
+                },
+            )
+        )
+    for window_days, (prior_mean, prior_weight) in priors.items():
+        if not in_window(window_days, day, today):
+            continue
+        base = prior_weight * prior_mean
+        statements.append(
+            upsert(leaderboard_table, dialect)
+            .values(window_days=window_days, movie_id=movie_id, rating_count=sign, rating_sum=sign * rating,
+                    score=(base + sign * rating) / (prior_weight + sign) if prior_weight + sign else 0)
+            .on_conflict_do_update(
+                index_elements=[leaderboard_table.c.window_days, leaderboard_table.c.movie_id],
+                set_={
+                    "rating_count": leaderboard_table.c.rating_count + sign,
+                    "rating_sum": leaderboard_table.c.rating_sum + sign * rating,
+                    "score": (base + leaderboard_table.c.rating_sum + sign * rating)
+                    / (prior_weight + leaderboard_table.c.rating_count + sign),
+                },
+            )
+        )
+    return statements
+
+
+async def priors(db=None) -> Priors:
+    db = database if db is None else db
+    rows = await db.fetch_all(select(state_table))
+    return {row["window_days"]: (row["prior_mean"], row["prior_weight"]) for row in rows}
+
+
+async def apply_rating(movie_id: int, rating: float, created_at: Optional[datetime] = None, sign: int = 1,
+                       db=None):
+    """Record a rating change; call inside the transaction that writes the rating."""
+    db = database if db is None else db
+    for statement in rating_statements(movie_id, rating, await priors(db), day_number(created_at), day_number(),
+                                       sign):
+        await db.execute(statement)
+
+
+_rolling: Optional[asyncio.Lock] = None
+
+
+async def ensure_rolled(db=None) -> List[int]:
+    """Roll any window not yet rolled today; returns the windows this call rolled.
+
+    Cheap when there is nothing to do. Concurrent callers in one process queue
+    on a lock; across processes, the windows are claimed with ``CLAIM`` inside
+    the rolling transaction, so each is rolled once.
+    """
+    global _rolling
+    db = database if db is None else db
+    if _rolling is None:
+        _rolling = asyncio.Lock()
+    async with _rolling:
+        today = day_number()
+        rows = await db.fetch_all(select(state_table.c.window_days, state_table.c.rolled_day))
+        if len(rows) == len(WINDOWS) and all(row["rolled_day"] >= today for row in rows):
+            return []
+        return await roll(today, db)
+
+
+async def roll(today: int, db=None) -> List[int]:
+    """Claim and roll, in one transaction, the windows not yet rolled to ``today``."""
+    db = database if db is None else db
+    async with db.transaction():
+        for window_days in WINDOWS.values():
+            await db.execute(ADD_STATE, {"window_days": window_days, "prior_weight": LEADERBOARD_PRIOR_WEIGHT})
+        claimed = sorted(row["window_days"] for row in await db.fetch_all(CLAIM, {"today": today}))
+        for sql, params in roll_statements(today, claimed):
+            await db.execute(sql, params)
+    return claimed
+
+
+async def roll_periodically(interval: float = LEADERBOARD_ROLL_CHECK_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await ensure_rolled()
+        except Exception as e:
+            logger.error(f"Leaderboard roll failed: {str(e)}")
+
+
+def page_query(columns: list, window_days: int, skip: int = 0, limit: int = 10,
+               cursor: Optional[str] = None) -> Tuple[object, int]:
+    """Leaderboard page ordered by score; returns the query and the rank of its first row."""
+    board = leaderboard_table
+    query = (
+        select(*columns, board.c.score, board.c.rating_count, board.c.rating_sum)
+        .join(board, board.c.movie_id == models.Movie.id)
+        .where(board.c.window_days == window_days, board.c.rating_count > 0)
+        .order_by(board.c.score.desc(), board.c.movie_id.desc())
+        .limit(limit)
+    )
+    if cursor is not None:
+        key = decode_key_cursor(cursor, score=(int, float), id=int, rank=int)
+        return query.where(tuple_(board.c.score, board.c.movie_id) < tuple_(key["score"], key["id"])), key["rank"] + 1
+    return query.offset(skip), skip + 1
+
+
+def next_rank_cursor(items: List[dict], limit: int) -> Optional[str]:
+    if items and len(items) >= limit:
+        last = items[-1]
+        return encode_key_cursor(score=last["score"], id=last["id"], rank=last["rank"])
+    return None
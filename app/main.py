@@ -1,23 +1,53 @@
 # app/main.py
+import asyncio
+
 from fastapi import FastAPI
-from starlette.responses import RedirectResponse
+from starlette.responses import PlainTextResponse, RedirectResponse
 
+from app import leaderboard, metrics, profiler, trending
+from app.content_index import CONTENT_INDEX_CATCH_UP_SECONDS, content_index
+from app.slow_queries import SLOW_QUERY_THRESHOLD_MS, slow_query_log
 from app.routes import auth, movies, comments, ratings
+from app.cache import response_cache
 from app.database import database, create_tables
+from app.utils import password_hasher
 
 app = FastAPI(debug=True)
+app.add_middleware(metrics.MetricsMiddleware)
+database.query_listeners.append(metrics.observe_query)
+if SLOW_QUERY_THRESHOLD_MS > 0:
+    database.query_listeners.append(slow_query_log.observe)
+if profiler.QUERY_PROFILING:
+    database.query_listeners.append(profiler.observe_query)
+    app.add_middleware(profiler.ProfilerMiddleware)
 
 
 @app.on_event("startup")
 async def startup():
     await database.connect()
 
-    create_tables()
+    await create_tables()
+    await leaderboard.ensure_rolled()
+    await trending.restore()
+    app.state.leaderboard_rolls = asyncio.create_task(leaderboard.roll_periodically())
+    app.state.trending_checkpoints = asyncio.create_task(trending.checkpoint_periodically())
+    app.state.content_index_catch_ups = None
+    if CONTENT_INDEX_CATCH_UP_SECONDS > 0:
+        app.state.content_index_catch_ups = asyncio.create_task(content_index.catch_up_periodically())
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    app.state.leaderboard_rolls.cancel()
+    app.state.trending_checkpoints.cancel()
+    if app.state.content_index_catch_ups is not None:
+        app.state.content_index_catch_ups.cancel()
+    await trending.checkpoint()
+    await slow_query_log.drain()
+    slow_query_log.close()
     await database.disconnect()
+    await response_cache.backend.close()
+    password_hasher.shutdown()
 
 
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
@@ -30,3 +60,8 @@ app.include_router(ratings.router, prefix="/ratings", tags=["Ratings"])
 async def redirect():
     response = RedirectResponse(url='/docs')
     return response
+
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,179 @@
+"""Request and database metrics in the Prometheus text format.
+
+``MetricsMiddleware`` labels every request with its route template (the
+``/movies/{movie_id}`` a request matched, never the raw path, so label
+cardinality stays bounded) and records its count, latency, response size
+and the number and duration of the database queries it made. Queries are
+attributed to a request through a context variable set by the middleware
+and read by ``observe_query``, a ``Storage`` query listener.
+
+Counters are plain ints and lists updated without locks: every update runs
+on the event loop thread and never spans an ``await``.
+"""
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.cache import response_cache
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        lines = []
+        total = 0
+        for bound, count in zip([*self.bounds, "+Inf"], self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {total}")
+        return lines
+
+
+class RouteMetrics:
+    __slots__ = ("responses", "latency", "size", "queries", "query_seconds")
+
+    def __init__(self):
+        self.responses: Dict[int, int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.query_seconds = Histogram(LATENCY_BUCKETS)
+
+
+class RequestQueries:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+class Registry:
+    def __init__(self):
+        self.routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self.in_flight = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def route(self, method: str, route: str) -> RouteMetrics:
+        metrics = self.routes.get((method, route))
+        if metrics is None:
+            metrics = self.routes[(method, route)] = RouteMetrics()
+        return metrics
+
+    def record(self, method: str, route: str, status: int, seconds: float, size: int, queries: RequestQueries):
+        metrics = self.route(method, route)
+        metrics.responses[status] = metrics.responses.get(status, 0) + 1
+        metrics.latency.observe(seconds)
+        metrics.size.observe(size)
+        metrics.queries.observe(queries.count)
+        metrics.query_seconds.observe(queries.seconds)
+
+    def render(self) -> str:
+        lines = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+
+        routes = sorted(self.routes.items())
+        family("http_requests_total", "counter", "Requests by route template and status.")
+        for (method, route), metrics in routes:
+            for status, count in sorted(metrics.responses.items()):
+                lines.append(f'http_requests_total{{{route_labels(method, route)},status="{status}"}} {count}')
+        for name, attribute, help_text in (
+            ("http_request_duration_seconds", "latency", "Time to the end of the response body."),
+            ("http_response_size_bytes", "size", "Response body size."),
+            ("http_request_db_queries", "queries", "Database queries made while handling a request."),
+            ("http_request_db_seconds", "query_seconds", "Time spent in database queries per request."),
+        ):
+            family(name, "histogram", help_text)
+            for (method, route), metrics in routes:
+                lines.extend(getattr(metrics, attribute).samples(name, route_labels(method, route)))
+
+        family("http_requests_in_flight", "gauge", "Requests currently being handled.")
+        lines.append(f"http_requests_in_flight {self.in_flight}")
+        family("db_queries_total", "counter", "Database queries, inside requests or not.")
+        lines.append(f"db_queries_total {self.queries}")
+        family("db_query_seconds_total", "counter", "Time spent in database queries.")
+        lines.append(f"db_query_seconds_total {self.query_seconds}")
+
+        cache = response_cache.stats()
+        for key in ("hits", "misses", "coalesced"):
+            family(f"response_cache_{key}_total", "counter", f"Response cache {key}.")
+            lines.append(f"response_cache_{key}_total {cache[key]}")
+        return "\n".join(lines) + "\n"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def route_labels(method: str, route: str) -> str:
+    return f'method="{escape(method)}",route="{escape(route)}"'
+
+
+registry = Registry()
+request_queries: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+def observe_query(query, values, seconds: float):
+    registry.queries += 1
+    registry.query_seconds += seconds
+    current = request_queries.get()
+    if current is not None:
+        current.count += 1
+        current.seconds += seconds
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed to their last byte."""
+
+    def __init__(self, app, registry: Registry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        queries = RequestQueries()
+        token = request_queries.set(queries)
+        response = {"status": 500, "size": 0}
+
+        async def send_and_measure(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        self.registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_and_measure)
+        finally:
+            self.registry.in_flight -= 1
+            request_queries.reset(token)
+            # The router stores the matched route in the scope.
+            route = scope.get("route")
+            self.registry.record(scope["method"], getattr(route, "path", UNMATCHED_ROUTE), response["status"],
+                                 time.perf_counter() - started, response["size"], queries)
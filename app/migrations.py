@@ -0,0 +1,426 @@
+"""Versioned schema migrations.
+
+Each migration is applied once, in order, inside its own transaction, and
+recorded in ``schema_migrations``. Migrations describe the schema as it was
+at that version (not the current models), so a fresh database and an old
+one end up identical. They never call application code, whose later changes
+would silently change what an old migration does. Add new migrations to the
+end of ``MIGRATIONS``; never edit one that has shipped.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import (Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table,
+                        inspect, select, text)
+
+logger = logging.getLogger("uvicorn.error")
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+
+def _initial_schema(connection):
+    # The schema as originally created by Base.metadata.create_all.
+    metadata = MetaData()
+    Table(
+        "users", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("username", String, unique=True, index=True),
+        Column("email", String, unique=True, index=True),
+        Column("hashed_password", String),
+    )
+    Table(
+        "movies", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("title", String, index=True),
+        Column("description", String),
+        Column("release_date", DateTime),
+        Column("user_id", Integer, ForeignKey("users.id")),
+    )
+    Table(
+        "ratings", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("rating", Float, nullable=False),
+        Column("movie_id", Integer, ForeignKey("movies.id")),
+        Column("user_id", Integer, ForeignKey("users.id")),
+    )
+    Table(
+        "comments", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("content", String, nullable=False),
+        Column("movie_id", Integer, ForeignKey("movies.id")),
+        Column("user_id", Integer, ForeignKey("users.id")),
+        Column("parent_comment_id", Integer, ForeignKey("comments.id"), nullable=True),
+        Column("created_at", DateTime),
+    )
+    metadata.create_all(bind=connection)
+
+
+# External-content FTS5 index over movies; the triggers keep it in step with
+# every insert, update and delete so the search endpoint never reads stale rows.
+FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+        title, description,
+        content='movies', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_fts_ai AFTER INSERT ON movies BEGIN
+        INSERT INTO movies_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_fts_ad AFTER DELETE ON movies BEGIN
+        INSERT INTO movies_fts(movies_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_fts_au AFTER UPDATE ON movies BEGIN
+        INSERT INTO movies_fts(movies_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO movies_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+# PostgreSQL has no FTS5. The expression must stay identical to
+# app.search.SEARCH_DOCUMENT for the search query to use the index.
+POSTGRES_SEARCH_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_movies_search ON movies USING GIN ("
+    "(setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')))"
+)
+
+
+def _movie_search_index(connection):
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(POSTGRES_SEARCH_INDEX))
+        return
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movies_fts'")
+    ).first()
+    for statement in FTS_SCHEMA:
+        connection.execute(text(statement))
+    if not exists:
+        # Index the movies that were inserted before the FTS table existed.
+        connection.execute(text("INSERT INTO movies_fts(movies_fts) VALUES ('rebuild')"))
+
+
+BACKFILL_RATING_STATS = """
+    INSERT INTO movie_rating_stats
+        (movie_id, rating_count, rating_sum, stars_1, stars_2, stars_3, stars_4, stars_5)
+    SELECT movie_id, COUNT(*), SUM(rating),
+           SUM(CASE WHEN rating < 1.5 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN rating >= 1.5 AND rating < 2.5 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN rating >= 2.5 AND rating < 3.5 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN rating >= 3.5 AND rating < 4.5 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN rating >= 4.5 THEN 1 ELSE 0 END)
+    FROM ratings
+    WHERE movie_id IS NOT NULL
+    GROUP BY movie_id
+"""
+
+
+def _backfill_rating_stats(connection):
+    connection.execute(text("DELETE FROM movie_rating_stats"))
+    connection.execute(text(BACKFILL_RATING_STATS))
+
+
+def _movie_rating_stats(connection):
+    metadata = MetaData()
+    Table("movies", metadata, autoload_with=connection)
+    stats = Table(
+        "movie_rating_stats", metadata,
+        Column("movie_id", Integer, ForeignKey("movies.id"), primary_key=True),
+        Column("rating_count", Integer, nullable=False, server_default="0"),
+        Column("rating_sum", Float, nullable=False, server_default="0"),
+        *[Column(f"stars_{stars}", Integer, nullable=False, server_default="0") for stars in range(1, 6)],
+    )
+    metadata.create_all(bind=connection, tables=[stats])
+    _backfill_rating_stats(connection)
+
+
+def _foreign_key_indexes(connection):
+    for statement in [
+        "CREATE INDEX IF NOT EXISTS ix_movies_user_id ON movies (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_ratings_movie_id ON ratings (movie_id)",
+        "CREATE INDEX IF NOT EXISTS ix_ratings_user_id ON ratings (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_comments_movie_id ON comments (movie_id)",
+        "CREATE INDEX IF NOT EXISTS ix_comments_user_id ON comments (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_comments_parent_comment_id ON comments (parent_comment_id)",
+        "CREATE INDEX IF NOT EXISTS ix_comments_movie_id_created_at_id ON comments (movie_id, created_at, id)",
+    ]:
+        connection.execute(text(statement))
+
+
+def _add_column(connection, table_name: str, column: Column):
+    column_type = column.type.compile(dialect=connection.dialect)
+    ddl = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    connection.execute(text(ddl))
+
+
+def _row_versions(connection):
+    _add_column(connection, "movies", Column("version", Integer, nullable=False, server_default="1"))
+    _add_column(connection, "movies", Column("updated_at", DateTime))
+    _add_column(connection, "movies", Column("comments_version", Integer, nullable=False, server_default="0"))
+
+
+def _movie_similar(connection):
+    metadata = MetaData()
+    Table(
+        "movie_similar", metadata,
+        Column("movie_id", Integer, primary_key=True),
+        Column("similar_movie_id", Integer, primary_key=True),
+        Column("score", Float, nullable=False),
+    )
+    Table(
+        "movie_similar_dirty", metadata,
+        Column("movie_id", Integer, primary_key=True, autoincrement=False),
+        Column("version", Integer, nullable=False, server_default="1"),
+    )
+    metadata.create_all(bind=connection)
+    # Every rated movie starts out dirty, so the first refresh is a full build.
+    connection.execute(text(
+        "INSERT INTO movie_similar_dirty (movie_id) "
+        "SELECT DISTINCT movie_id FROM ratings WHERE movie_id IS NOT NULL"
+    ))
+
+
+# Leaderboard windows in days (0 is all time) and the prior weight, as they
+# were when the leaderboard was added; the next daily roll applies the
+# configured weight.
+LEADERBOARD_WINDOWS = (0, 30, 7)
+LEADERBOARD_KEEP_DAYS = 30
+LEADERBOARD_PRIOR_WEIGHT = 10.0
+
+LEADERBOARD_REBUILD_ALL_TIME = """
+    INSERT INTO leaderboard (window_days, movie_id, rating_count, rating_sum, score)
+    SELECT 0, movie_id, rating_count, rating_sum, 0
+    FROM movie_rating_stats
+    WHERE rating_count > 0
+"""
+
+LEADERBOARD_REBUILD_WINDOW = """
+    INSERT INTO leaderboard (window_days, movie_id, rating_count, rating_sum, score)
+    SELECT CAST(:window_days AS INTEGER), movie_id, SUM(rating_count), SUM(rating_sum), 0
+    FROM movie_rating_daily
+    WHERE day >= :first_day
+    GROUP BY movie_id
+"""
+
+LEADERBOARD_REFRESH_PRIOR = """
+    INSERT INTO leaderboard_state (window_days, rolled_day, prior_mean, prior_weight)
+    SELECT CAST(:window_days AS INTEGER), CAST(:today AS INTEGER),
+           COALESCE(SUM(rating_sum) / SUM(rating_count), 0), CAST(:prior_weight AS FLOAT)
+    FROM leaderboard
+    WHERE window_days = :window_days AND rating_count > 0
+    ON CONFLICT (window_days) DO UPDATE SET
+        rolled_day = excluded.rolled_day, prior_mean = excluded.prior_mean, prior_weight = excluded.prior_weight
+"""
+
+LEADERBOARD_RESCORE = """
+    UPDATE leaderboard SET score = (
+        (SELECT prior_weight * prior_mean FROM leaderboard_state
+         WHERE leaderboard_state.window_days = leaderboard.window_days) + rating_sum
+    ) / (
+        (SELECT prior_weight FROM leaderboard_state
+         WHERE leaderboard_state.window_days = leaderboard.window_days) + rating_count
+    )
+    WHERE window_days = :window_days
+"""
+
+
+def _today() -> int:
+    return datetime.utcnow().date().toordinal()
+
+
+def _rebuild_leaderboards(connection, today: int):
+    """Rebuild every window from movie_rating_stats and the day buckets, then score it."""
+    for window_days in LEADERBOARD_WINDOWS:
+        connection.execute(text("DELETE FROM leaderboard WHERE window_days = :window_days"),
+                           {"window_days": window_days})
+        if window_days:
+            connection.execute(text(LEADERBOARD_REBUILD_WINDOW),
+                               {"window_days": window_days, "first_day": today - window_days + 1})
+        else:
+            connection.execute(text(LEADERBOARD_REBUILD_ALL_TIME))
+        connection.execute(text(LEADERBOARD_REFRESH_PRIOR), {"window_days": window_days, "today": today,
+                                                             "prior_weight": LEADERBOARD_PRIOR_WEIGHT})
+        connection.execute(text(LEADERBOARD_RESCORE), {"window_days": window_days})
+    connection.execute(text("DELETE FROM movie_rating_daily WHERE day <= :oldest"),
+                       {"oldest": today - LEADERBOARD_KEEP_DAYS})
+
+
+def _leaderboard(connection):
+    _add_column(connection, "ratings", Column("created_at", DateTime))
+    metadata = MetaData()
+    Table(
+        "movie_rating_daily", metadata,
+        Column("movie_id", Integer, primary_key=True),
+        Column("day", Integer, primary_key=True),
+        Column("rating_count", Integer, nullable=False, server_default="0"),
+        Column("rating_sum", Float, nullable=False, server_default="0"),
+    )
+    Table(
+        "leaderboard", metadata,
+        Column("window_days", Integer, primary_key=True),
+        Column("movie_id", Integer, primary_key=True),
+        Column("rating_count", Integer, nullable=False, server_default="0"),
+        Column("rating_sum", Float, nullable=False, server_default="0"),
+        Column("score", Float, nullable=False, server_default="0"),
+        Index("ix_leaderboard_window_days_score_movie_id", "window_days", "score", "movie_id"),
+    )
+    Table(
+        "leaderboard_state", metadata,
+        Column("window_days", Integer, primary_key=True, autoincrement=False),
+        Column("rolled_day", Integer, nullable=False),
+        Column("prior_mean", Float, nullable=False, server_default="0"),
+        Column("prior_weight", Float, nullable=False),
+    )
+    metadata.create_all(bind=connection)
+    # Existing ratings have no timestamp, so they only count towards all time.
+    _rebuild_leaderboards(connection, _today())
+
+
+def _movie_trending(connection):
+    metadata = MetaData()
+    Table(
+        "movie_trending", metadata,
+        Column("movie_id", Integer, primary_key=True, autoincrement=False),
+        Column("score", Float, nullable=False),
+        Column("updated_at", DateTime, nullable=False),
+    )
+    metadata.create_all(bind=connection)
+
+
+DUPLICATE_RATINGS = """
+    FROM ratings WHERE EXISTS (
+        SELECT 1 FROM ratings AS newer
+        WHERE newer.user_id = ratings.user_id AND newer.movie_id = ratings.movie_id AND newer.id > ratings.id
+    )
+"""
+
+
+def _unique_ratings(connection):
+    # Keep each user's latest rating of a movie.
+    movie_ids = [row[0] for row in connection.execute(text(f"SELECT DISTINCT movie_id {DUPLICATE_RATINGS}"))]
+    connection.execute(text(f"DELETE {DUPLICATE_RATINGS}"))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_ratings_user_id_movie_id ON ratings (user_id, movie_id)"
+    ))
+    if not movie_ids:
+        return
+
+    _backfill_rating_stats(connection)
+    # Rebuild the recent day buckets from the surviving ratings, then every window from those.
+    ratings = Table(
+        "ratings", MetaData(),
+        Column("movie_id", Integer), Column("rating", Float), Column("created_at", DateTime),
+    )
+    today = _today()
+    buckets = {}
+    for movie_id, rating, created_at in connection.execute(
+        select(ratings.c.movie_id, ratings.c.rating, ratings.c.created_at)
+        .where(ratings.c.movie_id.isnot(None), ratings.c.created_at.isnot(None))
+    ):
+        day = created_at.date().toordinal()
+        if day > today - LEADERBOARD_KEEP_DAYS:
+            bucket = buckets.setdefault((movie_id, day), [0, 0.0])
+            bucket[0] += 1
+            bucket[1] += rating
+    connection.execute(text("DELETE FROM movie_rating_daily"))
+    if buckets:
+        connection.execute(
+            text("INSERT INTO movie_rating_daily (movie_id, day, rating_count, rating_sum) "
+                 "VALUES (:movie_id, :day, :rating_count, :rating_sum)"),
+            [{"movie_id": movie_id, "day": day, "rating_count": count, "rating_sum": total}
+             for (movie_id, day), (count, total) in buckets.items()],
+        )
+    _rebuild_leaderboards(connection, today)
+    for movie_id in movie_ids:
+        if movie_id is not None:
+            connection.execute(text(
+                "INSERT INTO movie_similar_dirty (movie_id, version) VALUES (:movie_id, 1) "
+                "ON CONFLICT (movie_id) DO UPDATE SET version = movie_similar_dirty.version + 1"
+            ), {"movie_id": movie_id})
+
+
+def _movie_counters(connection):
+    _add_column(connection, "movies", Column("comment_count", Integer, nullable=False, server_default="0"))
+    _add_column(connection, "movies", Column("rating_count", Integer, nullable=False, server_default="0"))
+    connection.execute(text(
+        "UPDATE movies SET "
+        "comment_count = (SELECT COUNT(*) FROM comments WHERE comments.movie_id = movies.id), "
+        "rating_count = (SELECT COUNT(*) FROM ratings WHERE ratings.movie_id = movies.id)"
+    ))
+
+
+def _comment_paging_index(connection):
+    # Comment pages are ordered by id, not created_at. (movie_id, id) serves
+    # them on every backend and makes the single-column movie_id index redundant.
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_comments_movie_id_id ON comments (movie_id, id)"))
+    connection.execute(text("DROP INDEX IF EXISTS ix_comments_movie_id_created_at_id"))
+    connection.execute(text("DROP INDEX IF EXISTS ix_comments_movie_id"))
+
+
+def _drop_movie_rating_count(connection):
+    # movie_rating_stats.rating_count already holds the same number.
+    connection.execute(text("ALTER TABLE movies DROP COLUMN rating_count"))
+
+
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "movie full-text search index", _movie_search_index),
+    (3, "movie rating stats", _movie_rating_stats),
+    (4, "foreign key and paging indexes", _foreign_key_indexes),
+    (5, "movie row and comment-list versions", _row_versions),
+    (6, "item-item movie similarity", _movie_similar),
+    (7, "rating timestamps and leaderboards", _leaderboard),
+    (8, "trending score checkpoints", _movie_trending),
+    (9, "one rating per user and movie", _unique_ratings),
+    (10, "movie comment and rating counters", _movie_counters),
+    (11, "comment paging index on (movie_id, id)", _comment_paging_index),
+    (12, "drop movies.rating_count", _drop_movie_rating_count),
+]
+
+
+def _ensure_migrations_table(engine):
+    metadata = MetaData()
+    table = Table(
+        MIGRATIONS_TABLE, metadata,
+        Column("version", Integer, primary_key=True, autoincrement=False),
+        Column("name", String, nullable=False),
+        Column("applied_at", DateTime, nullable=False),
+    )
+    metadata.create_all(bind=engine)
+    return table
+
+
+def current_version(engine) -> int:
+    if not inspect(engine).has_table(MIGRATIONS_TABLE):
+        return 0
+    with engine.connect() as connection:
+        return connection.execute(text(f"SELECT MAX(version) FROM {MIGRATIONS_TABLE}")).scalar() or 0
+
+
+def run_migrations(engine, target: int = None) -> int:
+    """Apply every pending migration up to ``target`` and return the new version."""
+    table = _ensure_migrations_table(engine)
+    version = current_version(engine)
+    for number, name, migrate in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        logger.info(f"Applying migration {number}: {name}")
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(table.insert().values(version=number, name=name, applied_at=datetime.utcnow()))
+        version = number
+    return version
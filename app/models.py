@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -23,7 +23,13 @@ class Movie(Base):
     title = Column(String, index=True)
     description = Column(String)
     release_date = Column(DateTime, default=datetime.utcnow)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    # Bumped on every change to the row / to the movie's comments; used for ETags.
+    version = Column(Integer, nullable=False, server_default="1")
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    comments_version = Column(Integer, nullable=False, server_default="0")
+    # Kept in step by every comment write; see app.counters.
+    comment_count = Column(Integer, nullable=False, server_default="0")
     owner = relationship("User", back_populates="movies")
     comments = relationship("Comment", back_populates="movie")
     ratings = relationship("Rating", back_populates="movie")
@@ -31,24 +37,105 @@ class Movie(Base):
 
 class Rating(Base):
     __tablename__ = "ratings"
+    # One rating per user and movie; re-rating replaces it.
+    __table_args__ = (
+        Index("ux_ratings_user_id_movie_id", "user_id", "movie_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     rating = Column(Float, nullable=False)
-    movie_id = Column(Integer, ForeignKey("movies.id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
+    movie_id = Column(Integer, ForeignKey("movies.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
     movie = relationship("Movie", back_populates="ratings")
     user = relationship("User", back_populates="ratings")
 
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        Index("ix_comments_movie_id_id", "movie_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String, nullable=False)
-    movie_id = Column(Integer, ForeignKey("movies.id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
-    parent_comment_id = Column(Integer, ForeignKey("comments.id"), nullable=True)
+    movie_id = Column(Integer, ForeignKey("movies.id"))  # indexed by ix_comments_movie_id_id
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    parent_comment_id = Column(Integer, ForeignKey("comments.id"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     movie = relationship("Movie", back_populates="comments")
     user = relationship("User", back_populates="comments")
     replies = relationship("Comment", backref="parent", remote_side=[id])
+
+
+class MovieRatingStats(Base):
+    __tablename__ = "movie_rating_stats"
+
+    movie_id = Column(Integer, ForeignKey("movies.id"), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Float, nullable=False, default=0, server_default="0")
+    stars_1 = Column(Integer, nullable=False, default=0, server_default="0")
+    stars_2 = Column(Integer, nullable=False, default=0, server_default="0")
+    stars_3 = Column(Integer, nullable=False, default=0, server_default="0")
+    stars_4 = Column(Integer, nullable=False, default=0, server_default="0")
+    stars_5 = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class MovieSimilar(Base):
+    """Precomputed item-item neighbours, rebuilt by app.recommender."""
+    __tablename__ = "movie_similar"
+
+    movie_id = Column(Integer, primary_key=True)
+    similar_movie_id = Column(Integer, primary_key=True)
+    score = Column(Float, nullable=False)
+
+
+class MovieSimilarDirty(Base):
+    """Movies whose ratings changed since their neighbours were last computed."""
+    __tablename__ = "movie_similar_dirty"
+
+    movie_id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False, server_default="1")
+
+
+class MovieRatingDaily(Base):
+    """Ratings per movie per UTC day (``date.toordinal()``), the source of the windowed leaderboards."""
+    __tablename__ = "movie_rating_daily"
+
+    movie_id = Column(Integer, primary_key=True)
+    day = Column(Integer, primary_key=True)
+    rating_count = Column(Integer, nullable=False, server_default="0")
+    rating_sum = Column(Float, nullable=False, server_default="0")
+
+
+class Leaderboard(Base):
+    """Bayesian-average score per movie for each window (0 means all time)."""
+    __tablename__ = "leaderboard"
+    __table_args__ = (
+        Index("ix_leaderboard_window_days_score_movie_id", "window_days", "score", "movie_id"),
+    )
+
+    window_days = Column(Integer, primary_key=True)
+    movie_id = Column(Integer, primary_key=True)
+    rating_count = Column(Integer, nullable=False, server_default="0")
+    rating_sum = Column(Float, nullable=False, server_default="0")
+    score = Column(Float, nullable=False, server_default="0")
+
+
+class LeaderboardState(Base):
+    """Per window: the prior used for scores and the day the window was last rolled forward."""
+    __tablename__ = "leaderboard_state"
+
+    window_days = Column(Integer, primary_key=True, autoincrement=False)
+    rolled_day = Column(Integer, nullable=False)
+    prior_mean = Column(Float, nullable=False, server_default="0")
+    prior_weight = Column(Float, nullable=False)
+
+
+class MovieTrending(Base):
+    """Checkpoint of the in-memory trending scores (app.trending), decayed to ``updated_at``."""
+    __tablename__ = "movie_trending"
+
+    movie_id = Column(Integer, primary_key=True, autoincrement=False)
+    score = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
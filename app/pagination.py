@@ -0,0 +1,60 @@
+import base64
+import binascii
+import json
+from typing import Optional, Sequence
+
+from fastapi import HTTPException, Response, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_key_cursor(**key) -> str:
+    """Opaque cursor for an arbitrary sort key, e.g. ``score`` and ``id``."""
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_key_cursor(cursor: str, **types) -> dict:
+    """Decode a cursor made by ``encode_key_cursor``, checking each field against ``types``."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded))
+        for field, expected in types.items():
+            if not isinstance(key[field], expected) or isinstance(key[field], bool):
+                raise ValueError(key[field])
+        return key
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def encode_cursor(last_id: int) -> str:
+    return encode_key_cursor(id=last_id)
+
+
+def decode_cursor(cursor: str) -> int:
+    return decode_key_cursor(cursor, id=int)["id"]
+
+
+def paginate(query, id_column, skip: int = 0, limit: int = 10, cursor: Optional[str] = None):
+    """Order ``query`` by ``id_column`` and apply either keyset or offset paging.
+
+    A cursor seeks straight past the last id the client saw, so every page
+    costs the same however deep it is; ``skip`` is kept for older clients.
+    """
+    query = query.order_by(id_column)
+    if cursor is not None:
+        return query.where(id_column > decode_cursor(cursor)).limit(limit)
+    return query.offset(skip).limit(limit)
+
+
+def next_cursor(rows: Sequence, limit: int, id_key: str = "id") -> Optional[str]:
+    # A short page means we reached the end, so there is nothing to continue from.
+    if rows and len(rows) >= limit:
+        return encode_cursor(rows[-1][id_key])
+    return None
+
+
+def set_next_cursor(response: Response, rows: Sequence, limit: int, id_key: str = "id"):
+    cursor = next_cursor(rows, limit, id_key)
+    if cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
@@ -0,0 +1,157 @@
+"""Per-request SQL profiling and N+1 detection, for debugging.
+
+With ``QUERY_PROFILING`` on, ``ProfilerMiddleware`` records every statement a
+request runs: its shape (the SQL with parameters left as placeholders), the
+shape of its parameters and its duration. A shape seen at least
+``QUERY_REPEAT_THRESHOLD`` times in one request is the usual sign of a query
+issued per row (N+1) and is logged. Totals go out in a ``Server-Timing``
+header, which browser dev tools display next to the request.
+
+``query_budget`` does the same for a block of test code and fails when it
+runs more queries than allowed.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, List, Optional
+
+from sqlalchemy.sql import ClauseElement
+
+from app.database import database
+
+QUERY_PROFILING = os.getenv("QUERY_PROFILING", "false").lower() in ("1", "true", "yes")
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "3"))
+
+logger = logging.getLogger("uvicorn.error")
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(query, dialect=None) -> str:
+    """SQL text with parameters as placeholders, so repeats of one statement compare equal.
+
+    Pass the storage's ``dialect`` to get the SQL as it was sent to the database.
+    """
+    sql = query.compile(dialect=dialect) if isinstance(query, ClauseElement) else query
+    return WHITESPACE.sub(" ", str(sql)).strip()
+
+
+def value_shape(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def params_shape(query, values, dialect=None) -> str:
+    if isinstance(values, list):  # execute_many / insert_many rows
+        return f"{len(values)} x ({params_shape(query, values[0], dialect) if values else ''})"
+    if values is None and isinstance(query, ClauseElement):
+        values = query.compile(dialect=dialect).params
+    return ", ".join(f"{name}: {value_shape(value)}" for name, value in sorted((values or {}).items()))
+
+
+class QueryRecord:
+    __slots__ = ("shape", "params", "seconds")
+
+    def __init__(self, shape: str, params: str, seconds: float):
+        self.shape = shape
+        self.params = params
+        self.seconds = seconds
+
+
+class QueryProfile:
+    def __init__(self, dialect=None):
+        self.dialect = dialect
+        self.queries: List[QueryRecord] = []
+
+    def record(self, query, values, seconds: float):
+        self.queries.append(QueryRecord(statement_shape(query, self.dialect), params_shape(query, values, self.dialect),
+                                        seconds))
+
+    @property
+    def seconds(self) -> float:
+        return sum(record.seconds for record in self.queries)
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> List[tuple]:
+        """``(shape, count)`` for every statement shape run at least ``threshold`` times."""
+        counts = Counter(record.shape for record in self.queries)
+        return [(shape, count) for shape, count in counts.most_common() if count >= threshold]
+
+    def report(self) -> str:
+        lines = [f"{len(self.queries)} queries, {self.seconds * 1000:.1f} ms"]
+        lines += [f"  {record.seconds * 1000:7.2f} ms  {record.shape}  [{record.params}]" for record in self.queries]
+        return "\n".join(lines)
+
+    def server_timing(self) -> str:
+        repeated = self.repeated()
+        description = f"{len(self.queries)} queries"
+        if repeated:
+            description += f", {repeated[0][1]}x one shape"
+        return f'db;dur={self.seconds * 1000:.2f};desc="{description}"'
+
+
+current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("current_profile", default=None)
+
+
+def observe_query(query, values, seconds: float):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record(query, values, seconds)
+
+
+class ProfilerMiddleware:
+    """Profiles each request; ``observe_query`` must be among the storage's query listeners."""
+
+    def __init__(self, app, storage=database):
+        self.app = app
+        self.storage = storage
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile(self.storage.dialect)
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_profile.reset(token)
+            for shape, count in profile.repeated():
+                logger.warning(f"Possible N+1: {scope['method']} {scope['path']} ran {count}x: {shape}")
+            logger.debug(f"{scope['method']} {scope['path']} in {(time.perf_counter() - started) * 1000:.1f} ms, "
+                         f"{profile.report()}")
+
+
+@contextmanager
+def query_budget(max_queries: int, max_repeats: Optional[int] = None, storage=database):
+    """Fail if the block runs more than ``max_queries`` statements, or one shape more than ``max_repeats`` times.
+
+        with query_budget(2):
+            await client.get("/movies/1")
+    """
+    profile = QueryProfile(storage.dialect)
+    storage.query_listeners.append(profile.record)
+    try:
+        yield profile
+    finally:
+        storage.query_listeners.remove(profile.record)
+    assert len(profile.queries) <= max_queries, (
+        f"expected at most {max_queries} queries, ran {profile.report()}"
+    )
+    if max_repeats is not None:
+        repeated = profile.repeated(max_repeats + 1)
+        assert not repeated, f"statement repeated more than {max_repeats} times: {repeated[0]}\n{profile.report()}"
@@ -0,0 +1,208 @@
+"""Item-item collaborative filtering over ``ratings``.
+
+Ratings form a sparse movie x user matrix. With adjusted cosine every rating
+is first centred on its user's mean, so generous and harsh raters compare
+fairly. Rows are L2-normalised and similarities come from a sparse matrix
+product, a block of movies at a time so that only a bounded dense block of
+scores is ever in memory. The top ``k`` neighbours per movie are stored in
+``movie_similar``.
+
+Rating writes mark their movie in ``movie_similar_dirty``. ``refresh``
+recomputes the lists of dirty movies and merges their new scores into the
+lists of the movies that share raters with them. Scores between two clean
+movies are kept, and drift slowly as user means move; run a ``full`` refresh
+now and then for an exact rebuild.
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app import models
+from app.database import engine, upsert
+
+SIMILAR_TOP_K = int(os.getenv("SIMILAR_TOP_K", "20"))
+# Upper bound on the dense block of scores (movies in block x all movies).
+SIMILARITY_BLOCK_CELLS = int(os.getenv("SIMILARITY_BLOCK_CELLS", str(8 * 1024 * 1024)))
+
+similar_table = models.MovieSimilar.__table__
+dirty_table = models.MovieSimilarDirty.__table__
+
+Neighbours = Dict[int, List[Tuple[int, float]]]
+
+
+def mark_dirty(movie_id: int, dialect: Optional[str] = None):
+    """Upsert flagging a movie for recomputation; run it in the rating write's transaction."""
+    query = upsert(dirty_table, dialect).values(movie_id=movie_id, version=1)
+    return query.on_conflict_do_update(
+        index_elements=[dirty_table.c.movie_id],
+        set_={"version": dirty_table.c.version + 1},
+    )
+
+
+def item_vectors(users: np.ndarray, movies: np.ndarray, ratings: np.ndarray, adjusted: bool = True):
+    """Return ``(movie_ids, matrix)``: the sorted movie ids and their unit-length rating rows."""
+    movie_ids, movie_index = np.unique(movies, return_inverse=True)
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    values = ratings.astype(np.float32)
+    if adjusted:
+        counts = np.bincount(user_index, minlength=len(user_ids))
+        sums = np.bincount(user_index, weights=values, minlength=len(user_ids))
+        values = values - (sums / counts).astype(np.float32)[user_index]
+
+    matrix = sparse.csr_matrix((values, (movie_index, user_index)), shape=(len(movie_ids), len(user_ids)))
+    matrix.eliminate_zeros()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float32).ravel())
+    norms[norms == 0] = 1
+    return movie_ids, (sparse.diags(1 / norms) @ matrix).astype(np.float32).tocsr()
+
+
+def similarity_blocks(matrix, rows: np.ndarray, block_cells: int = SIMILARITY_BLOCK_CELLS):
+    """Yield ``(block, scores)``: dense cosine scores of the movies in ``block`` against all movies."""
+    transposed = matrix.T.tocsc()
+    step = max(1, block_cells // max(1, matrix.shape[0]))
+    for start in range(0, len(rows), step):
+        block = rows[start:start + step]
+        scores = (matrix[block] @ transposed).toarray()
+        scores[np.arange(len(block)), block] = 0  # a movie is not its own neighbour
+        yield block, scores
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column indices and values of each row's ``k`` highest scores, best first."""
+    k = min(k, scores.shape[1])
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    picked = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-picked, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(picked, order, axis=1)
+
+
+def compute_neighbours(movie_ids: np.ndarray, matrix, rows: np.ndarray, k: int = SIMILAR_TOP_K,
+                       block_cells: int = SIMILARITY_BLOCK_CELLS,
+                       collect_candidates: bool = False) -> Tuple[Neighbours, Neighbours]:
+    """Top-``k`` lists for ``rows``, plus (optionally) their scores against every other movie.
+
+    The second result maps each movie outside ``rows`` to the positive scores
+    it has with movies in ``rows``; ``refresh`` merges those into stored lists.
+    """
+    lists: Neighbours = {}
+    candidates: Neighbours = {}
+    if matrix.shape[0] < 2 or not len(rows):
+        return {int(movie_ids[row]): [] for row in rows}, candidates
+
+    in_rows = np.zeros(len(movie_ids), dtype=bool)
+    in_rows[rows] = True
+    for block, scores in similarity_blocks(matrix, rows, block_cells):
+        neighbours, best = top_k(scores, k)
+        for row, columns, values in zip(block.tolist(), neighbours, best):
+            keep = values > 0
+            lists[int(movie_ids[row])] = list(zip(movie_ids[columns[keep]].tolist(), values[keep].tolist()))
+        if collect_candidates:
+            scores[:, in_rows] = 0
+            block_rows, columns = np.nonzero(scores > 0)
+            for source, target, score in zip(movie_ids[block[block_rows]].tolist(), movie_ids[columns].tolist(),
+                                             scores[block_rows, columns].tolist()):
+                candidates.setdefault(target, []).append((source, score))
+    return lists, candidates
+
+
+def load_ratings(connection, chunk_size: int = 100000):
+    """Read every rating as ``(users, movies, ratings)`` arrays without building row objects for all of them."""
+    result = connection.execution_options(stream_results=True).execute(text(
+        "SELECT user_id, movie_id, rating FROM ratings WHERE user_id IS NOT NULL AND movie_id IS NOT NULL"
+    ))
+    parts = [np.asarray(part, dtype=np.float64).reshape(-1, 3) for part in result.partitions(chunk_size)]
+    data = np.concatenate(parts) if parts else np.empty((0, 3))
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2]
+
+
+def _in_chunks(values: List[int], size: int = 500):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _current_lists(connection, movie_ids: List[int]) -> Neighbours:
+    lists: Neighbours = {}
+    query = select(similar_table).where(similar_table.c.movie_id.in_(bindparam("ids", expanding=True)))
+    for chunk in _in_chunks(movie_ids):
+        for row in connection.execute(query, {"ids": chunk}):
+            lists.setdefault(row.movie_id, []).append((row.similar_movie_id, row.score))
+    return lists
+
+
+def _referencing(connection, movie_ids: List[int]) -> set:
+    query = select(similar_table.c.movie_id).where(
+        similar_table.c.similar_movie_id.in_(bindparam("ids", expanding=True))
+    ).distinct()
+    return {row[0] for chunk in _in_chunks(movie_ids) for row in connection.execute(query, {"ids": chunk})}
+
+
+def refresh(connection, k: int = SIMILAR_TOP_K, full: bool = False, adjusted: bool = True,
+            block_cells: int = SIMILARITY_BLOCK_CELLS) -> dict:
+    """Bring ``movie_similar`` up to date on a synchronous SQLAlchemy connection."""
+    dirty = dict(connection.execute(select(dirty_table.c.movie_id, dirty_table.c.version)).all())
+    if not dirty and not full:
+        return {"full": False, "movies": None, "recomputed": 0, "updated": 0, "pairs": 0}
+    users, movies, ratings = load_ratings(connection)
+    # Nothing is written while the similarities are computed, so release the
+    # read snapshot now rather than holding it for the whole computation.
+    connection.commit()
+
+    movie_ids, matrix = item_vectors(users, movies, ratings, adjusted)
+    position = {movie_id: index for index, movie_id in enumerate(movie_ids.tolist())}
+    full = full or len(dirty) * 2 >= len(movie_ids)
+    if full:
+        rows = np.arange(len(movie_ids))
+    else:
+        rows = np.array(sorted(position[movie_id] for movie_id in dirty if movie_id in position), dtype=np.int64)
+    lists, candidates = compute_neighbours(movie_ids, matrix, rows, k, block_cells, collect_candidates=not full)
+    # Dirty movies that no longer have ratings lose their neighbours.
+    lists.update({movie_id: [] for movie_id in dirty if movie_id not in position})
+
+    # Marks made after ``dirty`` was read have a newer version and survive.
+    # Deleting first also takes SQLite's write lock before the lists are read.
+    if dirty:
+        connection.execute(
+            dirty_table.delete().where(
+                (dirty_table.c.movie_id == bindparam("b_movie_id"))
+                & (dirty_table.c.version == bindparam("b_version"))
+            ),
+            [{"b_movie_id": movie_id, "b_version": version} for movie_id, version in dirty.items()],
+        )
+    if full:
+        connection.execute(similar_table.delete())
+        updated = lists
+    else:
+        affected = (set(candidates) | _referencing(connection, list(lists))) - set(lists)
+        current = _current_lists(connection, sorted(affected))
+        updated = dict(lists)
+        for movie_id in affected:
+            merged = [pair for pair in current.get(movie_id, []) if pair[0] not in lists]
+            merged += candidates.get(movie_id, [])
+            updated[movie_id] = sorted(merged, key=lambda pair: -pair[1])[:k]
+        delete_query = similar_table.delete().where(similar_table.c.movie_id.in_(bindparam("ids", expanding=True)))
+        for chunk in _in_chunks(sorted(updated)):
+            connection.execute(delete_query, {"ids": chunk})
+
+    pairs = [
+        {"movie_id": movie_id, "similar_movie_id": similar_id, "score": score}
+        for movie_id, neighbours in updated.items()
+        for similar_id, score in neighbours
+    ]
+    if pairs:
+        connection.execute(similar_table.insert(), pairs)
+    connection.commit()
+    return {"full": full, "movies": len(movie_ids), "recomputed": len(lists), "updated": len(updated),
+            "pairs": len(pairs)}
+
+
+async def refresh_similar(bind=None, **options) -> dict:
+    bind = bind if bind is not None else engine
+    if isinstance(bind, AsyncEngine):
+        async with bind.connect() as connection:
+            return await connection.run_sync(lambda sync_connection: refresh(sync_connection, **options))
+    with bind.connect() as connection:
+        return refresh(connection, **options)
@@ -1,10 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlite3 import IntegrityError
 import logging
 from sqlalchemy import select
 from app import models, schemas, utils
-from app.database import database
+from app.database import database, INTEGRITY_ERRORS
 
 router = APIRouter()
 
@@ -21,7 +20,7 @@ async def get_user(username: str):
 @router.post("/register", response_model=schemas.User)
 async def register(user: schemas.UserCreate):
     # Hash the password
-    hashed_password = utils.get_password_hash(user.password)
+    hashed_password = await utils.password_hasher.hash(user.password)
 
     # Create the SQLAlchemy insert query
     query = models.User.__table__.insert().values(
@@ -32,9 +31,10 @@ async def register(user: schemas.UserCreate):
 
     try:
         last_record_id = await database.execute(query)
+        utils.principal_cache.invalidate(user.username)
         return {**user.dict(), "id": last_record_id}
 
-    except IntegrityError as e:  # Change to the specific exception if necessary
+    except INTEGRITY_ERRORS as e:  # Change to the specific exception if necessary
         logger.error(f"IntegrityError: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -52,7 +52,7 @@ async def register(user: schemas.UserCreate):
 @router.post("/token", response_model=schemas.Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     user = await get_user(form_data.username)
-    if not user or not utils.verify_password(form_data.password, user["hashed_password"]):
+    if not user or not await utils.password_hasher.verify(form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -1,20 +1,35 @@
 # app/routes/comments.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select, insert, delete
-from app import models, schemas, utils
-from app.database import database
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import Integer, column, literal, select, insert, delete, table, update
+from app import conditional, export, models, schemas, trending, utils
+from app.database import database, dialect_name
+from app.pagination import paginate, set_next_cursor
+from app.serialization import COMMENT_DEFAULTS, FastJSONResponse, rows_to_dicts
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 import logging
 
 router = APIRouter()
 logger = logging.getLogger("uvicorn.error")
 
+MAX_TREE_DEPTH = 100
+MAX_TREE_NODES = 10000
+
 
 async def get_current_user(token: str = Depends(utils.oauth2_scheme)):
     return await utils.get_current_user(token)
 
 
+def bump_comments_version(movie_id: int, comment_delta: int):
+    """Invalidate the movie's comment pages and adjust its comment count in one row update."""
+    return (
+        update(models.Movie)
+        .where(models.Movie.id == movie_id)
+        .values(comments_version=models.Movie.comments_version + 1,
+                comment_count=models.Movie.comment_count + comment_delta)
+    )
+
+
 @router.post("/{movie_id}", response_model=schemas.Comment)
 async def create_comment(
         movie_id: int,
@@ -28,7 +43,10 @@ async def create_comment(
         parent_comment_id=comment.parent_comment_id
     )
 
-    last_record_id = await database.execute(query)
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        await database.execute(bump_comments_version(movie_id, 1))
+    trending.record_comment(movie_id)
 
     return schemas.Comment(
         id=last_record_id,
@@ -40,9 +58,33 @@ async def create_comment(
     )
 
 
+@router.get("/export")
+async def export_comments(fmt: str = Query("ndjson", alias="format"), after_id: int = 0,
+                          current_user: models.User = Depends(get_current_user)):
+    return export.export_response("comments", fmt, after_id)
+
+
+def comments_etag(movie_id: int, row, skip: int, limit: int, cursor: Optional[str]) -> str:
+    return conditional.make_etag("comments", movie_id, row["comments_version"],
+                                 conditional.stamp(row["movie_updated_at"]), skip, limit, cursor or "")
+
+
 @router.get("/{movie_id}", response_model=List[schemas.Comment])
-async def read_comments(movie_id: int, skip: int = 0, limit: int = 10):
+async def read_comments(request: Request, movie_id: int, skip: int = 0, limit: int = 10,
+                        cursor: Optional[str] = None):
     try:
+        etag = None
+        revalidating = conditional.is_conditional(request)
+        if revalidating:
+            movie = await database.fetch_one(
+                select(models.Movie.comments_version, models.Movie.updated_at.label("movie_updated_at"))
+                .where(models.Movie.id == movie_id)
+            )
+            if movie is not None:
+                etag = comments_etag(movie_id, movie, skip, limit, cursor)
+                if conditional.not_modified(request, etag):
+                    return conditional.not_modified_response(etag)
+
         query = select(
             models.Comment.id,
             models.Comment.content,
@@ -50,26 +92,109 @@ async def read_comments(movie_id: int, skip: int = 0, limit: int = 10):
             models.Comment.user_id,
             models.Comment.parent_comment_id,
             models.Comment.created_at
-        ).where(models.Comment.movie_id == movie_id).offset(skip).limit(limit)
+        ).where(models.Comment.movie_id == movie_id)
+        if not revalidating:
+            # Read the validators with the page rather than in a query of their own.
+            query = query.outerjoin(models.Movie, models.Movie.id == models.Comment.movie_id).add_columns(
+                models.Movie.comments_version, models.Movie.updated_at.label("movie_updated_at")
+            )
+        query = paginate(query, models.Comment.id, skip=skip, limit=limit, cursor=cursor)
 
         comments = await database.fetch_all(query)
-
-        return [
-            schemas.Comment(
-                id=comment["id"],
-                content=comment["content"],
-                movie_id=comment["movie_id"],
-                user_id=comment["user_id"],
-                parent_comment_id=comment["parent_comment_id"],
-                created_at=comment["created_at"] or datetime.utcnow()
-            )
-            for comment in comments
-        ]
+        items = rows_to_dicts(comments, COMMENT_DEFAULTS)
+        if not revalidating:
+            if comments and comments[0]["comments_version"] is not None:
+                etag = comments_etag(movie_id, comments[0], skip, limit, cursor)
+            for item in items:
+                del item["comments_version"], item["movie_updated_at"]
+
+        response = FastJSONResponse(items)
+        set_next_cursor(response, comments, limit)
+        if etag is not None:
+            response.headers["ETag"] = etag
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error occurred: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+def thread_query(movie_id: int, root_id: Optional[int], max_depth: int, max_nodes: int, dialect: str = "sqlite"):
+    """Recursive CTE that walks a movie's comment threads breadth first and stops after ``max_nodes`` rows."""
+    comments = models.Comment.__table__
+    columns = [comments.c.id, comments.c.content, comments.c.movie_id, comments.c.user_id,
+               comments.c.parent_comment_id, comments.c.created_at]
+
+    anchor = select(*columns, literal(0).label("depth")).where(comments.c.movie_id == movie_id)
+    if root_id is None:
+        anchor = anchor.where(comments.c.parent_comment_id.is_(None))
+    else:
+        anchor = anchor.where(comments.c.id == root_id)
+
+    # The recursive half names the CTE through a plain table, so the LIMIT can
+    # go on the CTE's own UNION ALL.
+    parent = table("thread", column("id", Integer), column("depth", Integer))
+    child = comments.alias("child")
+    walk = anchor.union_all(
+        select(*[child.c[source.name] for source in columns], (parent.c.depth + 1).label("depth"))
+        .where(child.c.parent_comment_id == parent.c.id, parent.c.depth < max_depth)
+    )
+    if dialect == "postgresql":
+        # PostgreSQL rejects a LIMIT inside a recursive CTE, but computes the CTE
+        # level by level and only as far as an unordered outer LIMIT reads it.
+        thread = walk.cte("thread", recursive=True)
+        thread = select(thread).limit(max_nodes).subquery("bounded")
+    else:
+        # SQLite stops recursing once the CTE's LIMIT is reached; its FIFO queue
+        # hands rows out level by level.
+        thread = walk.limit(max_nodes).cte("thread", recursive=True)
+    return select(thread).order_by(thread.c.depth, thread.c.id)
+
+
+def build_comment_tree(rows, max_children: int) -> List[dict]:
+    """Nest breadth-first rows in one pass; parents always precede their replies."""
+    nodes = {}
+    roots = []
+    for row in rows:
+        node = {
+            "id": row["id"],
+            "content": row["content"],
+            "movie_id": row["movie_id"],
+            "user_id": row["user_id"],
+            "parent_comment_id": row["parent_comment_id"],
+            "created_at": row["created_at"] or datetime.utcnow(),
+            "reply_count": 0,
+            "replies": [],
+        }
+        if row["depth"] == 0:
+            roots.append(node)
+            nodes[node["id"]] = node
+            continue
+        parent = nodes.get(row["parent_comment_id"])
+        if parent is None:
+            continue  # its parent was cut by the fan-out limit
+        parent["reply_count"] += 1
+        if len(parent["replies"]) < max_children:
+            parent["replies"].append(node)
+            nodes[node["id"]] = node
+    return roots
+
+
+@router.get("/{movie_id}/tree", response_model=List[schemas.CommentNode])
+async def read_comment_tree(
+        movie_id: int,
+        root_id: Optional[int] = None,
+        max_depth: int = Query(20, ge=0, le=MAX_TREE_DEPTH),
+        max_children: int = Query(100, ge=1),
+        max_nodes: int = Query(MAX_TREE_NODES, ge=1, le=MAX_TREE_NODES)
+):
+    rows = await database.fetch_all(thread_query(movie_id, root_id, max_depth, max_nodes, dialect_name()))
+    if root_id is not None and not rows:
+        raise HTTPException(status_code=404, detail="Comment not found")
+    return build_comment_tree(rows, max_children)
+
+
 @router.delete("/{comment_id}", response_model=dict)
 async def delete_comment(comment_id: int, current_user: models.User = Depends(get_current_user)):
     query = select(models.Comment).where(models.Comment.id == comment_id)
@@ -82,7 +207,9 @@ async def delete_comment(comment_id: int, current_user: models.User = Depends(ge
         raise HTTPException(status_code=403, detail="Not authorized to delete this comment")
 
     delete_query = delete(models.Comment).where(models.Comment.id == comment_id)
-    await database.execute(delete_query)
+    async with database.transaction():
+        await database.execute(delete_query)
+        await database.execute(bump_comments_version(db_comment["movie_id"], -1))
 
     # Return a success message
     return {"message": "Comment deleted successfully"}
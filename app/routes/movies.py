@@ -1,11 +1,18 @@
 # app/routes/movies.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy import select, delete, update
-from app import models, schemas, utils
-from app.database import database
+from app import (aggregates, bulk, conditional, counters, export, leaderboard, models, recommender, schemas,
+                 trending, utils)
+from app.database import database, dialect_name
+from app.cache import response_cache
+from app.content_index import content_index
+from app.pagination import NEXT_CURSOR_HEADER, next_cursor, paginate
+from app.search import search_statement
+from app.serialization import FastJSONResponse, row_to_dict, rows_to_dicts
 from datetime import datetime
-from typing import List
+from typing import List, Optional
+import asyncio
 import logging
 
 router = APIRouter()
@@ -17,7 +24,23 @@ async def get_current_user(token: str = Depends(utils.oauth2_scheme)):
     return await utils.get_current_user(token)
 
 
-@router.post("/", response_model=schemas.Movie)
+MOVIE_LISTS = "movies:list"
+MAX_BATCH_IDS = 500
+
+
+def movie_key(movie_id: int) -> str:
+    return f"movie:{movie_id}"
+
+
+async def invalidate_movie(movie_id: Optional[int] = None):
+    """Drop the cached movie (if any) and every cached movie list page; wake the content index's catch-up."""
+    if movie_id is not None:
+        await response_cache.invalidate(movie_key(movie_id))
+    await response_cache.bump(MOVIE_LISTS)
+    content_index.request_catch_up()
+
+
+@router.post("/", response_model=schemas.Movie, response_model_exclude_unset=True)
 async def create_movie(movie: schemas.MovieCreate, current_user: models.User = Depends(utils.get_current_user)):
     release_date = movie.release_date or datetime.utcnow()
 
@@ -39,9 +62,12 @@ async def create_movie(movie: schemas.MovieCreate, current_user: models.User = D
         description=movie.description,
         release_date=release_date,
         user_id=current_user.id,
+        version=1,
+        updated_at=datetime.utcnow(),
     )
     try:
         last_record_id = await database.execute(query)
+        await invalidate_movie()
         return {**movie.dict(), "id": last_record_id, "owner_id": current_user.id}
 
     except Exception as e:
@@ -53,58 +79,323 @@ async def create_movie(movie: schemas.MovieCreate, current_user: models.User = D
         )
 
 
+@router.post("/bulk", response_model=schemas.BulkImportReport)
+async def bulk_import_movies(request: Request, fmt: Optional[str] = Query(None, alias="format"),
+                             current_user: models.User = Depends(utils.get_current_user)):
+    fmt = fmt or bulk.format_for(request.headers.get("content-type"))
+    if fmt not in bulk.FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send NDJSON (application/x-ndjson, one JSON object per line; JSON arrays are not accepted) "
+                   "or CSV (text/csv), or pass ?format=ndjson|csv."
+        )
+
+    try:
+        report = await bulk.import_movies(bulk.iter_lines(request.stream()), fmt, current_user.id)
+    except Exception as e:
+        logger.error(f"Unexpected error while importing movies: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred while importing movies: {str(e)}"
+        )
+    finally:
+        # Chunks committed before a failure are visible too.
+        await invalidate_movie()
+    return report
+
+
+def batch_query(movie_ids: List[int], include_ratings: bool = False, include_comment_counts: bool = False):
+    """One query for every requested movie, with optional summaries joined in."""
+    query = select(
+        models.Movie.id,
+        models.Movie.title,
+        models.Movie.description,
+        models.Movie.release_date,
+        models.Movie.user_id.label("owner_id")
+    ).where(models.Movie.id.in_(movie_ids))
+    if include_ratings:
+        query = aggregates.with_rating_stats(query, models.Movie.id)
+    if include_comment_counts:
+        query = counters.with_comment_count(query)
+    return query
+
+
+@router.post("/batch", response_model=schemas.MovieBatch)
+async def read_movies_batch(batch: schemas.MovieBatchRequest):
+    if len(batch.ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {MAX_BATCH_IDS} ids can be read at once."
+        )
+    movie_ids = list(dict.fromkeys(batch.ids))
+    rows = await database.fetch_all(batch_query(movie_ids, batch.include_ratings, batch.include_comment_counts))
+    found = {
+        movie["id"]: {
+            "id": movie["id"],
+            "title": movie["title"],
+            "description": movie["description"],
+            "release_date": movie["release_date"],
+            "owner_id": movie["owner_id"],
+            **aggregates.summary_fields(movie["id"], movie, batch.include_ratings),
+            **counters.counts_dict(movie, batch.include_comment_counts, batch.include_ratings)
+        }
+        for movie in rows
+    }
+    return FastJSONResponse({
+        "items": [found[movie_id] for movie_id in movie_ids if movie_id in found],
+        "missing": [movie_id for movie_id in movie_ids if movie_id not in found],
+    })
+
+
 @router.get("/", response_model=List[schemas.Movie])
-async def read_movies(skip: int = 0, limit: int = 10):
+async def read_movies(skip: int = 0, limit: int = 10, cursor: Optional[str] = None,
+                      include_ratings: bool = False, include_comment_counts: bool = False):
+    if include_ratings or include_comment_counts:
+        page = await load_movies_page(skip, limit, cursor, include_ratings, include_comment_counts)
+    else:
+        # Rating summaries and comment counts change on every rating and comment, so only plain pages are cached.
+        generation = await response_cache.generation(MOVIE_LISTS)
+        key = f"{MOVIE_LISTS}:{generation}:{skip}:{limit}:{cursor or ''}"
+        page = await response_cache.get_or_load(key, lambda: load_movies_page(skip, limit, cursor))
+
+    response = FastJSONResponse(page["items"])
+    if page["next_cursor"] is not None:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+    return response
+
+
+async def load_movies_page(skip: int, limit: int, cursor: Optional[str], include_ratings: bool = False,
+                           include_comment_counts: bool = False) -> dict:
     query = select(
         models.Movie.id,
         models.Movie.title,
         models.Movie.description,
         models.Movie.release_date,
         models.Movie.user_id.label("owner_id")
-    ).offset(skip).limit(limit)
+    )
+    if include_ratings:
+        query = aggregates.with_rating_stats(query, models.Movie.id)
+    if include_comment_counts:
+        query = counters.with_comment_count(query)
+    query = paginate(query, models.Movie.id, skip=skip, limit=limit, cursor=cursor)
 
     movies = await database.fetch_all(query)
 
     # Log fetched movies for debugging
-    logger.info(f"Fetched movies: {movies}")
-
-    return [
-        schemas.Movie(
-            id=movie["id"],
-            title=movie["title"],
-            description=movie["description"],
-            release_date=movie["release_date"],
-            owner_id=movie["owner_id"]
-        )
+    logger.debug(f"Fetched {len(movies)} movies")
+
+    items = [
+        {
+            "id": movie["id"],
+            "title": movie["title"],
+            "description": movie["description"],
+            "release_date": movie["release_date"],
+            "owner_id": movie["owner_id"],
+            **aggregates.summary_fields(movie["id"], movie, include_ratings),
+            **counters.counts_dict(movie, include_comment_counts, include_ratings)
+        }
         for movie in movies
     ]
+    return {"items": items, "next_cursor": next_cursor(movies, limit)}
+
+
+@router.get("/search", response_model=List[schemas.MovieSearchResult])
+async def search_movies(q: str, skip: int = 0, limit: int = 10):
+    query, values = search_statement(q, skip, limit, dialect_name())
+    results = await database.fetch_all(query, values)
+    return [schemas.MovieSearchResult(**result._mapping) for result in results]
+
+
+@router.get("/top", response_model=List[schemas.LeaderboardEntry])
+async def top_movies(window: str = "all", skip: int = 0, limit: int = 10, cursor: Optional[str] = None):
+    if window not in leaderboard.WINDOWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"window must be one of {', '.join(leaderboard.WINDOWS)}"
+        )
+
+    columns = [
+        models.Movie.id,
+        models.Movie.title,
+        models.Movie.description,
+        models.Movie.release_date,
+        models.Movie.user_id.label("owner_id")
+    ]
+    query, first_rank = leaderboard.page_query(columns, leaderboard.WINDOWS[window], skip, limit, cursor)
+    items = [
+        {
+            "id": row["id"],
+            "title": row["title"],
+            "description": row["description"],
+            "release_date": row["release_date"],
+            "owner_id": row["owner_id"],
+            "rank": rank,
+            "score": row["score"],
+            "rating_count": row["rating_count"],
+            "mean": row["rating_sum"] / row["rating_count"],
+        }
+        for rank, row in enumerate(await database.fetch_all(query), start=first_rank)
+    ]
+
+    response = FastJSONResponse(items)
+    cursor = leaderboard.next_rank_cursor(items, limit)
+    if cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    return response
+
+
+@router.get("/trending", response_model=List[schemas.TrendingMovie])
+async def trending_movies(limit: int = Query(10, ge=1, le=trending.TRENDING_TOP_SIZE)):
+    # Ranking comes from memory; movie rows come from one cache read, with every miss loaded in one query.
+    top = trending.trending_scores.top(limit)
+    ids = {movie_key(movie_id): movie_id for movie_id, _ in top}
+
+    async def load_missing(keys: List[str]) -> dict:
+        movies = await load_movies([ids[key] for key in keys])
+        return {movie_key(movie_id): entry for movie_id, entry in movies.items()}
+
+    entries = await response_cache.get_or_load_many(list(ids), load_missing)
+    items = []
+    for (movie_id, score), entry in zip(top, entries):
+        if entry is None:
+            trending.trending_scores.forget(movie_id)  # deleted since it was last active
+            continue
+        items.append({**entry["movie"], "rank": len(items) + 1, "score": score})
+    return FastJSONResponse(items)
+
+
+@router.get("/export")
+async def export_movies(fmt: str = Query("ndjson", alias="format"), after_id: int = 0,
+                        current_user: models.User = Depends(get_current_user)):
+    return export.export_response("movies", fmt, after_id)
 
 
 @router.get("/{movie_id}", response_model=schemas.Movie)
-async def read_movie(movie_id: int):
+async def read_movie(request: Request, movie_id: int, include_ratings: bool = False,
+                     include_comment_counts: bool = False):
+    if include_ratings or include_comment_counts:
+        # Rating summaries and comment counts change independently of the movie
+        # row, so this representation is neither cached nor given validators.
+        movie = await load_movie(movie_id, include_ratings, include_comment_counts)
+        if movie is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
+        return FastJSONResponse(movie["movie"])
+
+    async def revalidate_or_load():
+        if conditional.is_conditional(request):
+            # Revalidate against the version columns only, without a full row fetch.
+            version_query = select(models.Movie.version, models.Movie.updated_at).where(models.Movie.id == movie_id)
+            current = await database.fetch_one(version_query)
+            if current is None:
+                return None
+            etag = conditional.make_etag("movie", movie_id, current["version"],
+                                         conditional.stamp(current["updated_at"]))
+            if conditional.not_modified(request, etag, current["updated_at"]):
+                raise conditional.NotModified(etag, current["updated_at"])
+        return await load_movie(movie_id)
+
+    key = movie_key(movie_id)
+    try:
+        entry = await response_cache.get_or_load(key, revalidate_or_load)
+    except conditional.NotModified as shortcut:
+        # Raised by this request's load, or by the one it was coalesced with.
+        if conditional.not_modified(request, shortcut.etag, shortcut.last_modified):
+            return conditional.not_modified_response(shortcut.etag, shortcut.last_modified)
+        entry = await response_cache.get_or_load(key, lambda: load_movie(movie_id))
+    if entry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
+
+    updated_at = datetime.fromisoformat(entry["updated_at"]) if entry["updated_at"] else None
+    etag = conditional.make_etag("movie", movie_id, entry["version"], conditional.stamp(updated_at))
+    if conditional.not_modified(request, etag, updated_at):
+        return conditional.not_modified_response(etag, updated_at)
+    return FastJSONResponse(entry["movie"], headers=conditional.validator_headers(etag, updated_at))
+
+
+def movie_query(include_ratings: bool = False, include_comment_counts: bool = False):
     query = select(
         models.Movie.id,
         models.Movie.title,
         models.Movie.description,
         models.Movie.release_date,
-        models.Movie.user_id.label("owner_id")
-    ).where(models.Movie.id == movie_id)
+        models.Movie.user_id.label("owner_id"),
+        models.Movie.version,
+        models.Movie.updated_at
+    )
+    if include_ratings:
+        query = aggregates.with_rating_stats(query, models.Movie.id)
+    if include_comment_counts:
+        query = counters.with_comment_count(query)
+    return query
+
+
+def movie_entry(movie, include_ratings: bool = False, include_comment_counts: bool = False) -> dict:
+    return {
+        "movie": {
+            "id": movie["id"],
+            "title": movie["title"],
+            "description": movie["description"],
+            "release_date": movie["release_date"],
+            "owner_id": movie["owner_id"],
+            **aggregates.summary_fields(movie["id"], movie, include_ratings),
+            **counters.counts_dict(movie, include_comment_counts, include_ratings)
+        },
+        "version": movie["version"],
+        "updated_at": movie["updated_at"].isoformat() if movie["updated_at"] else None,
+    }
+
+
+async def load_movie(movie_id: int, include_ratings: bool = False,
+                     include_comment_counts: bool = False) -> Optional[dict]:
+    movie = await database.fetch_one(
+        movie_query(include_ratings, include_comment_counts).where(models.Movie.id == movie_id)
+    )
+    if movie is None:
+        return None
+    return movie_entry(movie, include_ratings, include_comment_counts)
+
+
+async def load_movies(movie_ids: List[int]) -> dict:
+    """Cacheable entries for several movies in one query, keyed by id; deleted movies are left out."""
+    movies = await database.fetch_all(movie_query().where(models.Movie.id.in_(movie_ids)))
+    return {movie["id"]: movie_entry(movie) for movie in movies}
 
-    movie = await database.fetch_one(query)
 
+@router.get("/{movie_id}/similar", response_model=List[schemas.SimilarMovie])
+async def similar_movies(movie_id: int, limit: int = 10, mode: str = "ratings"):
+    if mode not in ("ratings", "content"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="mode must be 'ratings' or 'content'")
+    movie = await database.fetch_one(select(models.Movie.id).where(models.Movie.id == movie_id))
     if movie is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
 
-    return schemas.Movie(
-        id=movie["id"],
-        title=movie["title"],
-        description=movie["description"],
-        release_date=movie["release_date"],
-        owner_id=movie["owner_id"]
+    columns = [
+        models.Movie.id,
+        models.Movie.title,
+        models.Movie.description,
+        models.Movie.release_date,
+        models.Movie.user_id.label("owner_id")
+    ]
+    if mode == "content":
+        # Read-only: `python -m app.cli content-index` keeps the index current.
+        neighbours = await asyncio.get_running_loop().run_in_executor(None, content_index.similar, [movie_id], limit)
+        scores = dict(neighbours.get(movie_id, []))
+        rows = await database.fetch_all(select(*columns).where(models.Movie.id.in_(list(scores))))
+        items = [{**row_to_dict(row), "score": scores[row["id"]]} for row in rows]
+        return FastJSONResponse(sorted(items, key=lambda item: -item["score"]))
+
+    similar = recommender.similar_table
+    query = (
+        select(*columns, similar.c.score)
+        .join(similar, similar.c.similar_movie_id == models.Movie.id)
+        .where(similar.c.movie_id == movie_id)
+        .order_by(similar.c.score.desc())
+        .limit(limit)
     )
+    return FastJSONResponse(rows_to_dicts(await database.fetch_all(query)))
 
 
-@router.put("/{movie_id}", response_model=schemas.Movie)
+@router.put("/{movie_id}", response_model=schemas.Movie, response_model_exclude_unset=True)
 async def update_movie(movie_id: int, movie: schemas.MovieCreate,
                        current_user: models.User = Depends(get_current_user)):
     query = select(models.Movie).where(models.Movie.id == movie_id)
@@ -117,9 +408,11 @@ async def update_movie(movie_id: int, movie: schemas.MovieCreate,
     update_query = (
         update(models.Movie)
         .where(models.Movie.id == movie_id)
-        .values(title=movie.title, description=movie.description)
+        .values(title=movie.title, description=movie.description,
+                version=models.Movie.version + 1, updated_at=datetime.utcnow())
     )
     await database.execute(update_query)
+    await invalidate_movie(movie_id)
     return {**movie.dict(), "id": movie_id, "owner_id": current_user.id}
 
 
@@ -136,5 +429,7 @@ async def delete_movie(movie_id: int, current_user: models.User = Depends(utils.
 
     delete_query = delete(models.Movie).where(models.Movie.id == movie_id)
     await database.execute(delete_query)
+    await invalidate_movie(movie_id)
+    trending.trending_scores.forget(movie_id)
 
     return {"message": "Movie deleted successfully"}
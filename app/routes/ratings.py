@@ -1,9 +1,11 @@
 # app/routes/ratings.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select, insert
-from app import models, schemas, utils
-from app.database import database
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import delete, select
+from app import aggregates, export, leaderboard, models, recommender, schemas, trending, utils
+from app.database import database, dialect_name, upsert
+from app.pagination import paginate, set_next_cursor
+from datetime import datetime
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -12,19 +14,101 @@ async def get_current_user(token: str = Depends(utils.oauth2_scheme)):
     return await utils.get_current_user(token)
 
 
+def own_rating(movie_id: int, user_id: int):
+    return select(models.Rating).where(models.Rating.user_id == user_id, models.Rating.movie_id == movie_id)
+
+
+async def lock_own_rating(movie_id: int, user_id: int, db=None):
+    """Serialise one user's writes to one movie's rating until the transaction ends.
+
+    On SQLite every write already goes through the single writer connection,
+    so this is a no-op. On PostgreSQL the pool runs transactions concurrently;
+    an advisory lock also covers a first rating, where there is no row to lock.
+    """
+    db = database if db is None else db
+    if dialect_name(str(db.url)) == "postgresql":
+        await db.execute("SELECT pg_advisory_xact_lock(:user_id, :movie_id)",
+                         {"user_id": user_id, "movie_id": movie_id})
+
+
+def previous_day(previous) -> datetime:
+    # Ratings from before timestamps were recorded only count towards all time.
+    return previous["created_at"] or datetime.min
+
+
+async def save_rating(movie_id: int, value: float, user_id: int) -> dict:
+    """Insert the user's rating of a movie, or replace it, keeping every aggregate in step."""
+    created_at = datetime.utcnow()
+    ratings = models.Rating.__table__
+    query = upsert(ratings).values(rating=value, movie_id=movie_id, user_id=user_id, created_at=created_at)
+    query = query.on_conflict_do_update(
+        index_elements=[ratings.c.user_id, ratings.c.movie_id],
+        set_={"rating": value, "created_at": created_at},
+    )
+    async with database.transaction():
+        # The aggregates below subtract the previous rating read here, which is only
+        # right if nothing changes it before commit: the lock (or, on SQLite, the
+        # single writer connection) keeps this user's writes to the movie in order.
+        await lock_own_rating(movie_id, user_id)
+        previous = await database.fetch_one(own_rating(movie_id, user_id))
+        rating_id = await database.execute(query)
+        if previous is not None:
+            rating_id = previous["id"]
+        await database.execute(aggregates.rating_stats_delta(
+            movie_id, value, previous=previous["rating"] if previous is not None else None
+        ))
+        await database.execute(recommender.mark_dirty(movie_id))
+        if previous is not None:
+            await leaderboard.apply_rating(movie_id, previous["rating"], previous_day(previous), sign=-1)
+        await leaderboard.apply_rating(movie_id, value, created_at)
+    trending.record_rating(movie_id)
+    return {"rating": value, "id": rating_id, "movie_id": movie_id, "user_id": user_id}
+
+
 @router.post("/{movie_id}", response_model=schemas.Rating)
 async def create_rating(movie_id: int, rating: schemas.RatingCreate,
                         current_user: models.User = Depends(get_current_user)):
-    query = insert(models.Rating).values(
-        rating=rating.rating,
-        movie_id=movie_id,
-        user_id=current_user.id
-    )
-    last_record_id = await database.execute(query)
-    return {**rating.dict(), "id": last_record_id, "movie_id": movie_id, "user_id": current_user.id}
+    return await save_rating(movie_id, rating.rating, current_user.id)
+
+
+@router.put("/{movie_id}", response_model=schemas.Rating)
+async def update_rating(movie_id: int, rating: schemas.RatingCreate,
+                        current_user: models.User = Depends(get_current_user)):
+    return await save_rating(movie_id, rating.rating, current_user.id)
+
+
+@router.delete("/{movie_id}", response_model=dict)
+async def delete_rating(movie_id: int, current_user: models.User = Depends(get_current_user)):
+    async with database.transaction():
+        await lock_own_rating(movie_id, current_user.id)
+        previous = await database.fetch_one(own_rating(movie_id, current_user.id))
+        if previous is None:
+            raise HTTPException(status_code=404, detail="Rating not found")
+        await database.execute(delete(models.Rating).where(models.Rating.id == previous["id"]))
+        await database.execute(aggregates.rating_stats_delta(movie_id, previous["rating"], sign=-1))
+        await database.execute(recommender.mark_dirty(movie_id))
+        await leaderboard.apply_rating(movie_id, previous["rating"], previous_day(previous), sign=-1)
+    return {"message": "Rating deleted successfully"}
+
+
+@router.get("/export")
+async def export_ratings(fmt: str = Query("ndjson", alias="format"), after_id: int = 0,
+                         current_user: models.User = Depends(get_current_user)):
+    return export.export_response("ratings", fmt, after_id)
+
+
+@router.get("/{movie_id}/summary", response_model=schemas.RatingSummary)
+async def read_rating_summary(movie_id: int):
+    query = select(aggregates.stats_table).where(aggregates.stats_table.c.movie_id == movie_id)
+    stats = await database.fetch_one(query)
+    return aggregates.summary_from_row(movie_id, stats)
 
 
 @router.get("/{movie_id}", response_model=List[schemas.Rating])
-async def read_ratings(movie_id: int, skip: int = 0, limit: int = 10):
-    query = select(models.Rating).where(models.Rating.movie_id == movie_id).offset(skip).limit(limit)
-    return await database.fetch_all(query)
+async def read_ratings(response: Response, movie_id: int, skip: int = 0, limit: int = 10,
+                       cursor: Optional[str] = None):
+    query = select(models.Rating).where(models.Rating.movie_id == movie_id)
+    query = paginate(query, models.Rating.id, skip=skip, limit=limit, cursor=cursor)
+    ratings = await database.fetch_all(query)
+    set_next_cursor(response, ratings, limit)
+    return ratings
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 
@@ -37,15 +37,58 @@ class MovieCreate(MovieBase):
     release_date: Optional[datetime] = None
 
 
+class RatingSummary(BaseModel):
+    movie_id: int
+    count: int
+    mean: Optional[float] = None
+    histogram: Dict[int, int]
+
+
 class Movie(MovieBase):
     id: int
     owner_id: int
     release_date: Optional[datetime] = None
+    rating_summary: Optional[RatingSummary] = None
+    comment_count: Optional[int] = None
+    rating_count: Optional[int] = None
 
     class Config:
         orm_mode = True
 
 
+class MovieBatchRequest(BaseModel):
+    ids: List[int]
+    include_ratings: bool = False
+    include_comment_counts: bool = False
+
+
+class MovieBatch(BaseModel):
+    items: List[Movie]
+    missing: List[int]
+
+
+class MovieSearchResult(Movie):
+    rank: float
+    title_highlight: Optional[str] = None
+    snippet: Optional[str] = None
+
+
+class SimilarMovie(Movie):
+    score: float
+
+
+class LeaderboardEntry(Movie):
+    rank: int
+    score: float
+    rating_count: int
+    mean: float
+
+
+class TrendingMovie(Movie):
+    rank: int
+    score: float
+
+
 class RatingBase(BaseModel):
     rating: float
 
@@ -81,3 +124,20 @@ class Comment(CommentBase):
 
     class Config:
         orm_mode = True
+
+
+class CommentNode(Comment):
+    reply_count: int = 0
+    replies: List["CommentNode"] = []
+
+
+class BulkImportError(BaseModel):
+    line: int
+    error: str
+
+
+class BulkImportReport(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BulkImportError]
+    errors_truncated: bool = False
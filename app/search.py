@@ -0,0 +1,58 @@
+import re
+
+from fastapi import HTTPException, status
+
+# SQLite searches the movies_fts FTS5 table. PostgreSQL has no FTS5; a GIN
+# expression index over this weighted tsvector (ix_movies_search) gives the
+# same prefix search with ts_rank ordering. Migration 2 creates both.
+SEARCH_DOCUMENT = (
+    "(setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B'))"
+)
+
+# Title matches weigh ten times as much as description matches.
+SEARCH_QUERY = """
+    SELECT movies.id, movies.title, movies.description, movies.release_date,
+           movies.user_id AS owner_id,
+           bm25(movies_fts, 10.0, 1.0) AS rank,
+           highlight(movies_fts, 0, '<mark>', '</mark>') AS title_highlight,
+           snippet(movies_fts, 1, '<mark>', '</mark>', '…', 12) AS snippet
+    FROM movies_fts
+    JOIN movies ON movies.id = movies_fts.rowid
+    WHERE movies_fts MATCH :match
+    ORDER BY rank
+    LIMIT :limit OFFSET :skip
+"""
+
+
+POSTGRES_SEARCH_QUERY = f"""
+    SELECT movies.id, movies.title, movies.description, movies.release_date,
+           movies.user_id AS owner_id,
+           -ts_rank({SEARCH_DOCUMENT}, to_tsquery('simple', :match)) AS rank,
+           ts_headline('simple', coalesce(movies.title, ''), to_tsquery('simple', :match),
+                       'StartSel=<mark>, StopSel=</mark>, HighlightAll=true') AS title_highlight,
+           ts_headline('simple', coalesce(movies.description, ''), to_tsquery('simple', :match),
+                       'StartSel=<mark>, StopSel=</mark>, MaxWords=12, MinWords=3') AS snippet
+    FROM movies
+    WHERE {SEARCH_DOCUMENT} @@ to_tsquery('simple', :match)
+    ORDER BY rank
+    LIMIT :limit OFFSET :skip
+"""
+
+
+def match_expression(q: str, dialect: str = "sqlite") -> str:
+    """Turn free text into a full-text query where every word is a prefix term."""
+    tokens = re.findall(r"\w+", q)
+    if not tokens:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Search query must contain at least one word."
+        )
+    if dialect == "postgresql":
+        return " & ".join(f"{token}:*" for token in tokens)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search_statement(q: str, skip: int, limit: int, dialect: str = "sqlite"):
+    query = POSTGRES_SEARCH_QUERY if dialect == "postgresql" else SEARCH_QUERY
+    return query, {"match": match_expression(q, dialect), "limit": limit, "skip": skip}
@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import Any, Iterable, List, Mapping, Optional
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson-encoded response for handlers that build plain dicts from rows.
+
+    Returning it directly skips FastAPI's ``response_model`` validation, so it
+    is opt-in: only use it where the dicts already match the declared schema.
+    Naive datetimes are encoded the same way Pydantic does (ISO 8601, no
+    offset), and integer dict keys are allowed.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def row_to_dict(row, defaults: Optional[Mapping[str, Any]] = None) -> dict:
+    data = dict(row._mapping) if hasattr(row, "_mapping") else dict(row)
+    if defaults:
+        for key, value in defaults.items():
+            if data.get(key) is None:
+                data[key] = value() if callable(value) else value
+    return data
+
+
+def rows_to_dicts(rows: Iterable, defaults: Optional[Mapping[str, Any]] = None) -> List[dict]:
+    return [row_to_dict(row, defaults) for row in rows]
+
+
+COMMENT_DEFAULTS = {"created_at": datetime.utcnow}
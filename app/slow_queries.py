@@ -0,0 +1,189 @@
+"""Slow-query log with query plans.
+
+Statements slower than ``SLOW_QUERY_THRESHOLD_MS`` are written, one JSON
+object per line, to ``SLOW_QUERY_LOG_PATH`` together with their duration,
+their parameters (redacted to type and size; ``SLOW_QUERY_LOG_SCALARS`` keeps
+numbers, booleans and timestamps in clear) and the plan from ``EXPLAIN QUERY
+PLAN`` (SQLite) or ``EXPLAIN`` (PostgreSQL; never ``ANALYZE``, so the
+statement is not run again). The file rotates at ``SLOW_QUERY_LOG_MAX_BYTES``
+keeping ``SLOW_QUERY_LOG_BACKUPS`` older files, a ring buffer of the most
+recent offenders.
+
+Plans are fetched in a background task so the slow request is not delayed
+further; at most ``MAX_PENDING_PLANS`` run at once, and offenders beyond that
+are logged without a plan. The EXPLAIN statements themselves are hidden from
+the query listeners, so they do not count towards metrics or the request.
+
+``python -m app.cli slow-queries`` summarises the log by statement shape.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+from datetime import date, datetime
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql import ClauseElement
+
+from app.database import database, dialect_name
+from app.profiler import statement_shape
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_LOG_PATH = os.getenv("SLOW_QUERY_LOG_PATH", "./slow_queries.ndjson")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "4"))
+SLOW_QUERY_LOG_SCALARS = os.getenv("SLOW_QUERY_LOG_SCALARS", "false").lower() in ("1", "true", "yes")
+
+MAX_PENDING_PLANS = 4
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def redact(value: Any, keep_scalars: bool = False) -> Any:
+    """A parameter's type and size; ``keep_scalars`` leaves numbers, booleans and timestamps readable."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return f"<str:{len(value)}>"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<bytes:{len(value)}>"
+    if isinstance(value, (list, tuple)):
+        return [redact(item, keep_scalars) for item in value]
+    if keep_scalars and isinstance(value, (bool, int, float)):
+        return value
+    if keep_scalars and isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return f"<{type(value).__name__}>"
+
+
+def compile_statement(query, values, dialect: str):
+    """``(sql, params)`` with named placeholders, ready to be prefixed with EXPLAIN."""
+    if isinstance(values, list):  # a batch: explain its first row
+        values = values[0] if values else None
+    if not isinstance(query, ClauseElement):
+        return str(query), dict(values or {})
+    if values:
+        query = query.params(**values)
+    target = postgresql.dialect(paramstyle="named") if dialect == "postgresql" else sqlite.dialect(paramstyle="named")
+    compiled = query.compile(dialect=target, compile_kwargs={"render_postcompile": True})
+    return compiled.string, dict(compiled.params)
+
+
+class SlowQueryLog:
+    def __init__(self, path: str = SLOW_QUERY_LOG_PATH, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+                 max_bytes: int = SLOW_QUERY_LOG_MAX_BYTES, backups: int = SLOW_QUERY_LOG_BACKUPS, storage=None,
+                 keep_scalars: bool = SLOW_QUERY_LOG_SCALARS):
+        self.path = path
+        self.keep_scalars = keep_scalars
+        self.threshold = threshold_ms / 1000
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.storage = database if storage is None else storage
+        self.pending = set()
+        self._handler: Optional[RotatingFileHandler] = None
+
+    def observe(self, query, values, seconds: float):
+        """``Storage`` query listener."""
+        if seconds < self.threshold:
+            return
+        shape = statement_shape(query)
+        if shape.upper().startswith("EXPLAIN"):
+            return  # a plan of a plan says nothing
+        try:
+            sql, params = compile_statement(query, values, dialect_name(str(self.storage.url)))
+        except Exception as e:
+            sql, params = shape, {}
+            logger.debug(f"Could not compile slow query for EXPLAIN: {str(e)}")
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "ms": round(seconds * 1000, 3),
+            "shape": shape,
+            "params": {name: redact(value, self.keep_scalars) for name, value in params.items()},
+            "rows": len(values) if isinstance(values, list) else None,
+            "plan": None,
+        }
+        if not sql.lstrip().upper().startswith(EXPLAINABLE) or len(self.pending) >= MAX_PENDING_PLANS:
+            self.write(entry)
+            return
+        task = asyncio.get_running_loop().create_task(self._explain_and_write(entry, sql, params))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def explain(self, sql: str, params: dict) -> List[str]:
+        prefix = "EXPLAIN" if dialect_name(str(self.storage.url)) == "postgresql" else "EXPLAIN QUERY PLAN"
+        # The task copied the slow request's context; keep the lookup out of its
+        # query counts and out of the metrics.
+        with self.storage.unobserved():
+            rows = await self.storage.fetch_all(f"{prefix} {sql}", params)
+        return [str(list(row._mapping.values())[-1]) for row in rows]
+
+    async def _explain_and_write(self, entry: dict, sql: str, params: dict):
+        try:
+            entry["plan"] = await self.explain(sql, params)
+        except Exception as e:
+            entry["plan_error"] = str(e)
+        self.write(entry)
+
+    def write(self, entry: dict):
+        if self._handler is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            self._handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backups,
+                                                encoding="utf-8")
+        line = json.dumps(entry, default=str)
+        self._handler.handle(logging.makeLogRecord({"msg": line, "levelno": logging.WARNING}))
+
+    async def drain(self):
+        """Wait for outstanding plan lookups (tests, shutdown)."""
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+
+    def close(self):
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
+
+
+def log_files(path: str = SLOW_QUERY_LOG_PATH) -> List[str]:
+    """The rotated backups (``path.N`` is the oldest) and then the current file."""
+    numbered = []
+    for name in glob.glob(f"{glob.escape(path)}.*"):
+        suffix = name[len(path) + 1:]
+        if suffix.isdigit():
+            numbered.append((int(suffix), name))
+    return [name for _, name in sorted(numbered, reverse=True)] + [path]
+
+
+def read_entries(path: str = SLOW_QUERY_LOG_PATH):
+    for name in log_files(path):
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def summarize(path: str = SLOW_QUERY_LOG_PATH, top: int = 10) -> List[Dict[str, Any]]:
+    """Statement shapes ordered by total time spent in their slow runs."""
+    shapes: Dict[str, Dict[str, Any]] = {}
+    for entry in read_entries(path):
+        summary = shapes.setdefault(entry["shape"], {"shape": entry["shape"], "count": 0, "total_ms": 0.0,
+                                                     "max_ms": 0.0, "last_at": None, "plan": None})
+        summary["count"] += 1
+        summary["total_ms"] += entry["ms"]
+        summary["max_ms"] = max(summary["max_ms"], entry["ms"])
+        summary["last_at"] = entry["at"]
+        summary["plan"] = entry.get("plan") or summary["plan"]
+    ranked = sorted(shapes.values(), key=lambda summary: -summary["total_ms"])[:top]
+    for summary in ranked:
+        summary["mean_ms"] = round(summary["total_ms"] / summary["count"], 3)
+        summary["total_ms"] = round(summary["total_ms"], 3)
+    return ranked
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,39 @@
+import asyncio
+import os
+import tempfile
+import pytest
+import pytest_asyncio
+from sqlalchemy import create_engine
+
+# Keep the content similarity index out of the working tree.
+os.environ.setdefault("CONTENT_INDEX_PATH", tempfile.mkdtemp(prefix="content_index_"))
+os.environ.setdefault("SLOW_QUERY_LOG_PATH", os.path.join(tempfile.mkdtemp(prefix="slow_queries_"), "log.ndjson"))
+
+from ..database import Storage, create_tables, database_options  # noqa: E402
+from ..migrations import run_migrations  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def ensure_tables():
+    asyncio.run(create_tables())
+
+
+@pytest.fixture
+def migrated_url(tmp_path):
+    """URL of a fresh SQLite database migrated to the latest version."""
+    url = f"sqlite:///{tmp_path / 'migrated.db'}"
+    engine = create_engine(url)
+    run_migrations(engine)
+    engine.dispose()
+    return url
+
+
+@pytest_asyncio.fixture
+async def storage(migrated_url):
+    """A connected ``Storage`` on ``migrated_url``, with the app's connection options."""
+    db = Storage(migrated_url, **database_options(migrated_url))
+    await db.connect()
+    try:
+        yield db
+    finally:
+        await db.disconnect()
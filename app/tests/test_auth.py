@@ -50,3 +50,44 @@ async def test_login_with_invalid_credentials():
         response = await ac.post("/auth/token", data={"username": "nonexistent", "password": "wrongpassword"})
         assert response.status_code == 401
         assert response.json() == {"detail": "Incorrect username or password"}
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_rejects_when_saturated():
+    import asyncio
+    from fastapi import HTTPException
+    from ..utils import PasswordHasher
+
+    hasher = PasswordHasher(executor="thread", workers=1, max_pending=1)
+    try:
+        first = asyncio.ensure_future(hasher.hash("password"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc_info:
+            await hasher.hash("password")
+        assert exc_info.value.status_code == 429
+
+        hashed = await first
+        assert await hasher.verify("password", hashed)
+        assert hasher.pending == 0
+    finally:
+        hasher.shutdown()
+
+
+def test_principal_cache_lru_and_ttl():
+    from ..utils import PrincipalCache
+
+    cache = PrincipalCache(ttl=60, max_size=2)
+    cache.set("a", {"id": 1})
+    cache.set("b", {"id": 2})
+    assert cache.get("a") == {"id": 1}
+    cache.set("c", {"id": 3})  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert cache.get("c") == {"id": 3}
+
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] == 1
+
+    expired = PrincipalCache(ttl=-1)
+    expired.set("a", {"id": 1})
+    assert expired.get("a") is None
@@ -0,0 +1,72 @@
+from sqlalchemy import create_engine, text
+
+from benchmarks.bench_routes import compare
+from benchmarks.seed import seed
+
+from ..content_index import ContentIndex
+
+
+def report(**scenarios):
+    return {"scenarios": scenarios}
+
+
+def scenario(p95_ms=10.0, throughput_rps=100.0, errors=0):
+    return {"p95_ms": p95_ms, "throughput_rps": throughput_rps, "errors": errors}
+
+
+def regressions(rows):
+    return [(name, metric) for name, metric, _, _, _, regressed in rows if regressed]
+
+
+def test_compare_passes_unchanged_runs():
+    base = report(list=scenario(), detail=scenario())
+    assert regressions(compare(base, base, 0.10)) == []
+
+
+def test_compare_flags_a_missing_scenario():
+    rows = compare(report(list=scenario(), detail=scenario()), report(list=scenario()), 0.10)
+    assert ("detail", "missing", None, None, None, True) in rows
+    assert regressions(rows) == [("detail", "missing")]
+
+
+def test_compare_flags_new_errors():
+    rows = compare(report(list=scenario(errors=1)), report(list=scenario(errors=3)), 0.10)
+    assert ("list", "errors", 1, 3, None, True) in rows
+    assert regressions(compare(report(list=scenario(errors=3)), report(list=scenario(errors=1)), 0.10)) == []
+
+
+def test_compare_treats_lower_throughput_as_a_regression():
+    base = report(list=scenario(throughput_rps=100.0))
+    assert regressions(compare(base, report(list=scenario(throughput_rps=80.0)), 0.10)) == [
+        ("list", "throughput_rps")]
+    assert regressions(compare(base, report(list=scenario(throughput_rps=150.0)), 0.10)) == []
+    assert regressions(compare(base, report(list=scenario(throughput_rps=95.0)), 0.10)) == []
+
+
+def test_compare_ignores_latency_changes_below_min_delta():
+    base = report(fast=scenario(p95_ms=1.0), slow=scenario(p95_ms=10.0))
+    new = report(fast=scenario(p95_ms=1.4), slow=scenario(p95_ms=14.0))
+    # Both are 40% slower, but the fast endpoint only by 0.4 ms.
+    assert regressions(compare(base, new, 0.10)) == [("slow", "p95_ms")]
+    assert regressions(compare(base, new, 0.10, min_delta_ms=0.1)) == [("fast", "p95_ms"), ("slow", "p95_ms")]
+    assert regressions(compare(base, new, 0.50)) == []
+
+
+def test_seed_fills_the_content_index_and_trending_table(tmp_path):
+    url = f"sqlite:///{tmp_path / 'bench.db'}"
+    path = str(tmp_path / "content_index")
+    seed(url, users=5, movies=20, ratings=40, comments=30, content_index_path=path)
+
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        trending = connection.execute(text("SELECT COUNT(*) FROM movie_trending")).scalar()
+        rated = connection.execute(
+            text("SELECT COUNT(*) FROM (SELECT movie_id FROM ratings UNION SELECT movie_id FROM comments) AS active")
+        ).scalar()
+    engine.dispose()
+    assert trending == rated
+
+    index = ContentIndex(path)
+    index.refresh()
+    assert index.count == 20
+    assert index.similar([1], 3)[1]
@@ -0,0 +1,132 @@
+import asyncio
+import pytest
+from ..cache import LRUCacheBackend, RedisCacheBackend, ResponseCache
+
+
+async def serve_resp(reader, writer, store):
+    """Tiny Redis-protocol stand-in supporting the commands the cache uses."""
+    while True:
+        header = await reader.readline()
+        if not header:
+            break
+        args = []
+        for _ in range(int(header[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        command = args[0].upper()
+        if command == b"GET":
+            value = store.get(args[1])
+            writer.write(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value))
+        elif command == b"MGET":
+            writer.write(b"*%d\r\n" % (len(args) - 1))
+            for key in args[1:]:
+                value = store.get(key)
+                writer.write(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value))
+        elif command == b"SET":
+            store[args[1]] = args[2]
+            writer.write(b"+OK\r\n")
+        elif command == b"DEL":
+            writer.write(b":%d\r\n" % (store.pop(args[1], None) is not None))
+        elif command == b"INCR":
+            store[args[1]] = b"%d" % (int(store.get(args[1], b"0")) + 1)
+            writer.write(b":%s\r\n" % store[args[1]])
+        await writer.drain()
+    writer.close()
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_misses():
+    cache = ResponseCache(LRUCacheBackend(), ttl=60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"id": 1}
+
+    results = await asyncio.gather(*[cache.get_or_load("movie:1", loader) for _ in range(10)])
+    assert results == [{"id": 1}] * 10
+    assert calls == 1
+    assert await cache.get_or_load("movie:1", loader) == {"id": 1}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["coalesced"] == 9
+
+
+@pytest.mark.asyncio
+async def test_invalidation_during_load_discards_stale_value():
+    cache = ResponseCache(LRUCacheBackend(), ttl=60)
+
+    async def loader():
+        await cache.invalidate("movie:1")  # a write lands while the old row is being read
+        return {"title": "stale"}
+
+    assert await cache.get_or_load("movie:1", loader) == {"title": "stale"}
+    assert await cache.get("movie:1") is None
+    # Nothing is kept per key once no load for it is running.
+    await cache.invalidate("movie:2")
+    assert cache._epochs == {} and cache._loading == {}
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_many_loads_every_miss_at_once():
+    cache = ResponseCache(LRUCacheBackend(), ttl=60)
+    await cache.backend.set("movie:2", {"id": 2}, 60)
+    calls = []
+
+    async def loader(keys):
+        calls.append(keys)
+        await cache.invalidate("movie:3")  # written while loading: returned, but not cached
+        return {key: {"id": int(key.split(":")[1])} for key in keys if key != "movie:4"}
+
+    keys = ["movie:1", "movie:2", "movie:3", "movie:4"]
+    assert await cache.get_or_load_many(keys, loader) == [{"id": 1}, {"id": 2}, {"id": 3}, None]
+    assert calls == [["movie:1", "movie:3", "movie:4"]]
+    assert await cache.backend.get_many(keys) == [{"id": 1}, {"id": 2}, None, None]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+    assert cache._epochs == {} and cache._loading == {}
+
+
+@pytest.mark.asyncio
+async def test_lru_backend_evicts_least_recently_used():
+    backend = LRUCacheBackend(max_entries=2)
+    await backend.set("a", 1, 60)
+    await backend.set("b", 2, 60)
+    await backend.get("a")
+    await backend.set("c", 3, 60)
+    assert await backend.get("b") is None
+    assert await backend.get("a") == 1
+
+
+@pytest.mark.asyncio
+async def test_generation_survives_lru_eviction():
+    cache = ResponseCache(LRUCacheBackend(max_entries=3), ttl=60)
+    await cache.bump("movies:list")
+    await cache.bump("movies:list")
+    for page in range(10):
+        await cache.backend.set(f"movies:list:2:{page}", [page], 60)
+    assert await cache.generation("movies:list") == 2
+    assert len(cache.backend._entries) == 3
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_against_stand_in():
+    store = {}
+    server = await asyncio.start_server(lambda r, w: serve_resp(r, w, store), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    backend = RedisCacheBackend(f"redis://127.0.0.1:{port}/0")
+    cache = ResponseCache(backend, ttl=60)
+    try:
+        assert await cache.get_or_load("movie:7", lambda: asyncio.sleep(0, {"id": 7})) == {"id": 7}
+        assert await cache.get("movie:7") == {"id": 7}
+        assert await cache.generation("movies:list") == 0
+        await cache.bump("movies:list")
+        assert await cache.generation("movies:list") == 1
+        await cache.invalidate("movie:7")
+        assert await cache.get("movie:7") is None
+        await backend.set_many({"movie:8": {"id": 8}, "movie:9": {"id": 9}}, 60)
+        assert await backend.get_many(["movie:8", "movie:7", "movie:9"]) == [{"id": 8}, None, {"id": 9}]
+    finally:
+        await backend.close()
+        server.close()
+        await server.wait_closed()
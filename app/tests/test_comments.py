@@ -1,7 +1,10 @@
 import pytest
 from httpx import AsyncClient
+from sqlalchemy.dialects import postgresql, sqlite
 from ..main import app
 from ..database import database
+from ..profiler import query_budget
+from ..routes.comments import thread_query
 
 auth_token_value = None
 movie_rating_id = None
@@ -78,3 +81,73 @@ async def test_delete_comment(stored_auth_token, stored_movie_id):
         delete_response = await ac.delete(f"/comments/{comment_id}", headers=headers)
         assert delete_response.status_code == 200, "Failed to delete comment"
 
+
+
+@pytest.mark.asyncio
+async def test_read_comment_tree(stored_movie_id):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        root = await ac.post(f"/comments/{movie_rating_id}", json={"content": "Root"}, headers=headers)
+        root_id = root.json()["id"]
+        reply = await ac.post(f"/comments/{movie_rating_id}",
+                              json={"content": "Reply", "parent_comment_id": root_id}, headers=headers)
+        await ac.post(f"/comments/{movie_rating_id}",
+                      json={"content": "Nested reply", "parent_comment_id": reply.json()["id"]}, headers=headers)
+        await ac.post(f"/comments/{movie_rating_id}",
+                      json={"content": "Second reply", "parent_comment_id": root_id}, headers=headers)
+
+        response = await ac.get(f"/comments/{movie_rating_id}/tree", params={"root_id": root_id})
+        assert response.status_code == 200, f"Failed to read comment tree: {response.text}"
+        [tree] = response.json()
+        assert tree["reply_count"] == 2
+        assert [r["content"] for r in tree["replies"]] == ["Reply", "Second reply"]
+        assert tree["replies"][0]["replies"][0]["content"] == "Nested reply"
+
+        response = await ac.get(f"/comments/{movie_rating_id}/tree",
+                                params={"root_id": root_id, "max_depth": 1, "max_children": 1})
+        [tree] = response.json()
+        assert tree["reply_count"] == 2
+        assert len(tree["replies"]) == 1
+        assert tree["replies"][0]["replies"] == []
+
+        # The walk stops after max_nodes rows, shallowest first.
+        response = await ac.get(f"/comments/{movie_rating_id}/tree", params={"root_id": root_id, "max_nodes": 2})
+        [tree] = response.json()
+        assert [r["content"] for r in tree["replies"]] == ["Reply"]
+        assert tree["replies"][0]["replies"] == []
+
+
+def test_comment_tree_limit_bounds_the_recursion():
+    sqlite_sql = str(thread_query(1, None, 20, 50).compile(dialect=sqlite.dialect()))
+    # The LIMIT closes the CTE body, so SQLite stops recursing there.
+    assert sqlite_sql.index("LIMIT") < sqlite_sql.index(")\n SELECT")
+    postgres_sql = str(thread_query(1, None, 20, 50, "postgresql").compile(dialect=postgresql.dialect()))
+    assert postgres_sql.index("LIMIT") > postgres_sql.index(")\n SELECT")
+
+
+@pytest.mark.asyncio
+async def test_read_comments_matches_schema(stored_movie_id):
+    from ..schemas import Comment
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get(f"/comments/{movie_rating_id}")
+        assert response.status_code == 200, "Failed to read comments"
+        for comment in response.json():
+            assert Comment(**comment).model_dump(mode="json") == comment
+
+
+@pytest.mark.asyncio
+async def test_read_comments_conditional_get(stored_movie_id):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        with query_budget(1):  # the validators come with the page
+            response = await ac.get(f"/comments/{movie_rating_id}")
+        etag = response.headers["ETag"]
+
+        response = await ac.get(f"/comments/{movie_rating_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        await ac.post(f"/comments/{movie_rating_id}", json={"content": "Invalidates"}, headers=headers)
+        response = await ac.get(f"/comments/{movie_rating_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from ..content_index import ContentIndex
+
+
+def test_index_grows_persists_and_answers_batched_queries(tmp_path):
+    index = ContentIndex(str(tmp_path), dim=512)
+    for movie_id in range(1, 1101):
+        index.upsert(movie_id, f"Movie {movie_id}", f"filler words {movie_id % 7}", flush=False)
+    index.upsert(2000, "Haunted lighthouse", "A keeper and a ghost")
+    index.upsert(2001, "Haunted lighthouse II", "The ghost and the keeper return")
+    index.remove(5)
+
+    reopened = ContentIndex(str(tmp_path), dim=512)
+    reopened._open()
+    assert reopened.count == 1102
+    assert 5 not in reopened.rows
+
+    similar = reopened.similar([2000, 1], k=2)
+    assert similar[2000][0][0] == 2001
+    assert all(movie_id not in (1, 5) for movie_id, _ in similar[1])
+
+
+def test_readers_map_read_only_and_pick_up_new_writes(tmp_path):
+    writer = ContentIndex(str(tmp_path), dim=64)
+    reader = ContentIndex(str(tmp_path), dim=64)
+    assert reader.similar([1], k=2) == {}
+    assert not os.path.exists(tmp_path / "meta.json")
+
+    writer.upsert(1, "Haunted lighthouse", "A keeper and a ghost")
+    writer.upsert(2, "Haunted lighthouse II", "The ghost and the keeper return")
+    assert reader.similar([1], k=2)[1][0][0] == 2
+    assert not reader.writable and reader.vectors.mode == "r"
+
+    writer.upsert(3, "Lighthouse keeper", "A ghost haunts the keeper")
+    writer.remove(2)
+    assert [movie_id for movie_id, _ in reader.similar([1], k=2)[1]] == [3]
+
+
+def test_dimension_change_needs_a_rebuild(tmp_path):
+    ContentIndex(str(tmp_path), dim=64).upsert(1, "Title", "Description")
+    with pytest.raises(ValueError, match="rebuild"):
+        ContentIndex(str(tmp_path), dim=128).upsert(2, "Title", "Description")
+    assert ContentIndex(str(tmp_path), dim=128).similar([1], k=1) == {}
@@ -0,0 +1,16 @@
+import pytest
+
+from ..counters import reconcile
+
+
+@pytest.mark.asyncio
+async def test_reconcile_repairs_drifted_counts(storage):
+    await storage.execute(
+        "INSERT INTO movies (id, title, comment_count) VALUES (1, 'Right', 1), (2, 'Too many', 9), (3, 'Too few', 0)"
+    )
+    await storage.execute("INSERT INTO comments (movie_id, content) VALUES (1, 'a'), (3, 'b'), (3, 'c')")
+
+    assert await reconcile(batch_size=2, db=storage) == {"movies": 3, "repaired": 2, "last_id": 3}
+    rows = await storage.fetch_all("SELECT id, comment_count FROM movies ORDER BY id")
+    assert [(row["id"], row["comment_count"]) for row in rows] == [(1, 1), (2, 0), (3, 2)]
+    assert (await reconcile(db=storage))["repaired"] == 0
@@ -0,0 +1,47 @@
+import asyncio
+import sqlite3
+import pytest
+from sqlalchemy import select
+from .. import models
+
+
+@pytest.mark.asyncio
+async def test_storage_splits_reads_from_writes(storage):
+    insert = models.Movie.__table__.insert().values(title="Pooled", description="A pooled movie")
+    movie_id = await storage.execute(insert)
+
+    query = select(models.Movie.title).where(models.Movie.id == movie_id)
+    assert await storage.fetch_val(query) == "Pooled"
+    assert await storage.fetch_val("PRAGMA journal_mode") == "wal"
+    assert await storage.fetch_val("PRAGMA query_only") == 1
+
+    async with storage.transaction():
+        # Inside a transaction reads stay on the writer connection.
+        assert await storage.fetch_val("PRAGMA query_only") == 0
+
+    with pytest.raises(sqlite3.OperationalError):
+        await storage.reader.execute(insert)
+
+
+@pytest.mark.asyncio
+async def test_reads_in_a_transaction_see_its_uncommitted_writes(storage):
+    # Guards the reader routing, which relies on databases internals (pinned in requirements.txt).
+    transaction = await storage.transaction()
+    movie_id = await storage.execute(models.Movie.__table__.insert().values(title="Uncommitted"))
+    query = select(models.Movie.title).where(models.Movie.id == movie_id)
+    row = await storage.fetch_one(query)
+    assert row is not None and row["title"] == "Uncommitted"
+    await transaction.rollback()
+
+    assert await storage.fetch_one(query) is None
+
+
+@pytest.mark.asyncio
+async def test_iterate_times_the_query_not_the_consumer(storage):
+    timings = []
+    storage.query_listeners.append(lambda query, values, seconds: timings.append(seconds))
+    await storage.execute_many(models.Movie.__table__.insert(), [{"title": f"Movie {i}"} for i in range(3)])
+    timings.clear()
+    async for _ in storage.iterate(select(models.Movie.id)):
+        await asyncio.sleep(0.1)
+    assert len(timings) == 1 and timings[0] < 0.1
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from ..database import Storage
+from ..leaderboard import WINDOWS, roll, roll_statements
+
+
+def test_roll_drops_aged_out_ratings_and_rescores(migrated_url):
+    engine = create_engine(migrated_url)
+    today = 740000
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO movie_rating_daily (movie_id, day, rating_count, rating_sum) VALUES "
+            "(1, :old, 10, 50), (2, :recent, 1, 4), (2, :today, 1, 2), (3, :ancient, 1, 1)"
+        ), {"old": today - 10, "recent": today - 6, "today": today, "ancient": today - 40})
+        for sql, params in roll_statements(today, [7, 30], prior_weight=2):
+            connection.execute(text(sql), params)
+
+        rows = connection.execute(text(
+            "SELECT window_days, movie_id, rating_count, score FROM leaderboard ORDER BY window_days, movie_id"
+        )).all()
+        assert [(row.window_days, row.movie_id, row.rating_count) for row in rows] == [
+            (7, 2, 2), (30, 1, 10), (30, 2, 2)
+        ]
+        # Window 7 has only movie 2, so its prior is its own mean.
+        assert rows[0].score == 3
+        # Window 30: prior mean 56 / 12; movie 1 scores (2 * 56 / 12 + 50) / 12.
+        assert abs(rows[1].score - (2 * 56 / 12 + 50) / 12) < 1e-9
+        assert connection.execute(text("SELECT COUNT(*) FROM movie_rating_daily")).scalar() == 3
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_rolls_claim_each_window_once(storage, migrated_url):
+    # Two workers that both saw stale state race to roll the same day.
+    other = Storage(migrated_url, read_pool_size=1)
+    await other.connect()
+    try:
+        workers = [storage, other]
+        rolled = await asyncio.gather(*(roll(740000, worker) for worker in workers))
+        assert sorted(rolled) == [[], sorted(WINDOWS.values())]
+        assert await roll(740000, workers[0]) == []
+        assert await roll(740001, workers[1]) == sorted(WINDOWS.values())
+    finally:
+        await other.disconnect()
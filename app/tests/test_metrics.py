@@ -0,0 +1,69 @@
+import pytest
+from httpx import AsyncClient
+
+from ..database import database
+from ..main import app
+from ..metrics import Histogram, Registry, RequestQueries
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def setup_and_teardown():
+    await database.connect()
+    yield
+    await database.disconnect()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 5))
+    for value in (0.5, 1, 3, 7):
+        histogram.observe(value)
+    assert histogram.samples("x", 'route="/a"') == [
+        'x_bucket{route="/a",le="1"} 2',
+        'x_bucket{route="/a",le="5"} 3',
+        'x_bucket{route="/a",le="+Inf"} 4',
+        'x_sum{route="/a"} 11.5',
+        'x_count{route="/a"} 4',
+    ]
+
+
+def test_route_labels_are_escaped():
+    registry = Registry()
+    registry.record("GET", '/odd"route', 200, 0.01, 10, RequestQueries())
+    assert 'http_requests_total{method="GET",route="/odd\\"route",status="200"} 1' in registry.render()
+
+
+def sample(text: str, prefix: str) -> float:
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(prefix))
+
+
+@pytest.mark.asyncio
+async def test_metrics_use_route_templates_and_count_queries():
+    route = 'method="GET",route="/movies/{movie_id}"'
+    prefixes = {
+        "requests": f"http_requests_total{{{route},",
+        "not_found": f'http_requests_total{{{route},status="404"}}',
+        "unmatched": 'http_requests_total{method="GET",route="<unmatched>",status="404"}',
+        "no_queries": f'http_request_db_queries_bucket{{{route},le="0"}}',
+        "queries": f"http_request_db_queries_sum{{{route}}}",
+        "all_queries": "db_queries_total",
+    }
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        existing = (await ac.get("/movies/", params={"limit": 2})).json()
+        before = (await ac.get("/metrics")).text
+        for movie_id in [movie["id"] for movie in existing] + [999999]:
+            await ac.get(f"/movies/{movie_id}", params={"include_ratings": True})
+        await ac.get("/no/such/path")
+
+        response = await ac.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+
+    change = {name: sample(text, prefix) - sample(before, prefix) for name, prefix in prefixes.items()}
+    assert change["requests"] == 3 and change["not_found"] == 1 and change["unmatched"] == 1
+    # Reading a movie with its ratings is exactly one query.
+    assert change["no_queries"] == 0 and change["queries"] == 3
+    assert change["all_queries"] >= 3
+    assert "/movies/1" not in text and "/no/such/path" not in text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert "response_cache_hits_total" in text
@@ -0,0 +1,206 @@
+from typing import List
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import create_engine, inspect, text
+from ..cache import response_cache
+from ..database import Base, database
+from ..main import app
+from ..migrations import MIGRATIONS, current_version, run_migrations
+from ..pagination import encode_cursor
+from ..routes.movies import movie_key
+from ..slow_queries import EXPLAINABLE, compile_statement
+from .. import counters, leaderboard, trending
+
+
+@pytest.fixture(scope="module")
+def migrated_engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('migrations') / 'migrated.db'}")
+    run_migrations(engine)
+    yield engine
+    engine.dispose()
+
+
+def route_calls(movie_id: int, comment_id: int, headers: dict) -> dict:
+    """Requests whose statements must all be index lookups, as ``(method, url, httpx keyword arguments)``."""
+    cursor = encode_cursor(100)
+    revalidate = {"If-None-Match": '"stale"'}
+    return {
+        "get_current_user": ("PUT", f"/movies/{movie_id}", {"json": {"title": "Indexed", "description": "Plan"},
+                                                            "headers": headers}),
+        "read_movies": ("GET", "/movies/", {}),
+        "read_movies cursor": ("GET", "/movies/", {"params": {"cursor": cursor}}),
+        "read_movies counts": ("GET", "/movies/", {"params": {"include_ratings": True,
+                                                              "include_comment_counts": True}}),
+        "read_movie": ("GET", f"/movies/{movie_id}", {}),
+        "read_movie version": ("GET", f"/movies/{movie_id}", {"headers": revalidate}),
+        "read_movie counts": ("GET", f"/movies/{movie_id}", {"params": {"include_ratings": True,
+                                                                       "include_comment_counts": True}}),
+        "read_movies_batch": ("POST", "/movies/batch", {"json": {"ids": [1, 2, movie_id], "include_ratings": True,
+                                                                 "include_comment_counts": True}}),
+        "search_movies": ("GET", "/movies/search", {"params": {"q": "indexed plan"}}),
+        "top_movies": ("GET", "/movies/top", {"params": {"window": "7d"}}),
+        "top_movies cursor": ("GET", "/movies/top", {"params": {
+            "window": "7d", "cursor": leaderboard.encode_key_cursor(score=4.5, id=100, rank=10)}}),
+        "trending_movies": ("GET", "/movies/trending", {}),
+        "similar_movies": ("GET", f"/movies/{movie_id}/similar", {}),
+        "export_movies": ("GET", "/movies/export", {"params": {"after_id": 1}, "headers": headers}),
+        "read_comments": ("GET", f"/comments/{movie_id}", {}),
+        "read_comments cursor": ("GET", f"/comments/{movie_id}", {"params": {"cursor": cursor}}),
+        "read_comments version": ("GET", f"/comments/{movie_id}", {"headers": revalidate}),
+        "read_comment_tree": ("GET", f"/comments/{movie_id}/tree", {}),
+        "read_comment_subtree": ("GET", f"/comments/{movie_id}/tree", {"params": {"root_id": comment_id}}),
+        "export_comments": ("GET", "/comments/export", {"params": {"after_id": 1}, "headers": headers}),
+        "read_ratings": ("GET", f"/ratings/{movie_id}", {}),
+        "read_ratings cursor": ("GET", f"/ratings/{movie_id}", {"params": {"cursor": cursor}}),
+        "read_rating_summary": ("GET", f"/ratings/{movie_id}/summary", {}),
+        "rate_movie": ("PUT", f"/ratings/{movie_id}", {"json": {"rating": 4}, "headers": headers}),
+        "export_ratings": ("GET", "/ratings/export", {"params": {"after_id": 1}, "headers": headers}),
+        "delete_comment": ("DELETE", f"/comments/{comment_id}", {"headers": headers}),
+    }
+
+
+# A rowid range search is not enough for per-movie pages: it walks every later row.
+EXPECTED_INDEXES = {
+    "read_comments": "ix_comments_movie_id_id",
+    "read_comments cursor": "ix_comments_movie_id_id",
+    "read_ratings": "ix_ratings_movie_id",
+    "read_ratings cursor": "ix_ratings_movie_id",
+    "rate_movie": "ux_ratings_user_id_movie_id",
+    "top_movies": "ix_leaderboard_window_days_score_movie_id",
+    "top_movies cursor": "ix_leaderboard_window_days_score_movie_id",
+}
+
+
+# Walking a CTE, a subquery's result or the full-text index is not a table scan, and
+# leaderboard_state holds one row per window.
+NOT_TABLE_SCANS = ("SCAN (", "SCAN thread", "SCAN CONSTANT ROW", "SCAN leaderboard_state")
+
+
+def unindexed_scans(plan: List[str], sql: str) -> List[str]:
+    scans = [step for step in plan if step.startswith("SCAN") and "USING" not in step
+             and "VIRTUAL TABLE" not in step and not step.startswith(NOT_TABLE_SCANS)]
+    # A page in rowid order stops at its LIMIT; only a sort would read every row first.
+    if "LIMIT" in sql and not any("TEMP B-TREE" in step for step in plan):
+        scans = [step for step in scans if f"ORDER BY {step.split()[-1]}.id" not in sql]
+    return scans
+
+
+async def capture_statements() -> dict:
+    """Every statement each route call and ``counters.reconcile`` ran, by call name."""
+    captured = {}
+    current = []
+    database.query_listeners.append(lambda query, values, seconds: current.append((query, values)))
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            token = (await ac.post("/auth/token", data={"username": "tester", "password": "password"})).json()
+            headers = {"Authorization": f"Bearer {token['access_token']}"}
+            movie_id = (await ac.post("/movies/", json={"title": "Indexed", "description": "Plan"},
+                                      headers=headers)).json()["id"]
+            comment_id = (await ac.post(f"/comments/{movie_id}", json={"content": "Planned"},
+                                        headers=headers)).json()["id"]
+            trending.trending_scores.record(movie_id)
+            for name, (method, url, options) in route_calls(movie_id, comment_id, headers).items():
+                await response_cache.invalidate(movie_key(movie_id))
+                current.clear()
+                response = await ac.request(method, url, **options)
+                assert response.status_code < 400, f"{name}: {response.text}"
+                captured[name] = list(current)
+        current.clear()
+        await counters.reconcile(after_id=movie_id - 1)
+        captured["reconcile_counts"] = list(current)
+    finally:
+        database.query_listeners.pop()
+    return captured
+
+
+@pytest.mark.asyncio
+async def test_route_queries_use_an_index():
+    await database.connect()
+    try:
+        captured = await capture_statements()
+        problems = await unindexed_statements(captured)
+    finally:
+        await database.disconnect()
+    assert set(captured) == set(route_calls(1, 1, {})) | {"reconcile_counts"}
+    assert not problems, "\n".join(problems)
+
+
+async def unindexed_statements(captured: dict) -> List[str]:
+    problems = []
+    for name, statements in captured.items():
+        plans = []
+        for query, values in statements:
+            sql, params = compile_statement(query, values, "sqlite")
+            if not sql.lstrip().upper().startswith(EXPLAINABLE):
+                continue
+            with database.unobserved():
+                rows = await database.fetch_all(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = [str(list(row._mapping.values())[-1]) for row in rows]
+            plans.append(plan)
+            if unindexed_scans(plan, sql):
+                problems.append(f"{name} scans without an index: {plan}\n  {sql}")
+        if name in EXPECTED_INDEXES and not any(EXPECTED_INDEXES[name] in step for plan in plans for step in plan):
+            problems.append(f"{name} does not use {EXPECTED_INDEXES[name]}: {plans}")
+    return problems
+
+
+def test_migrations_reach_latest_version_and_are_idempotent(migrated_engine):
+    latest = MIGRATIONS[-1][0]
+    assert current_version(migrated_engine) == latest
+    assert run_migrations(migrated_engine) == latest
+
+
+def test_migrated_schema_has_every_model_index(migrated_engine):
+    inspector = inspect(migrated_engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            assert index.name in existing, f"{index.name} missing after migrations"
+
+
+def test_unique_ratings_migration_keeps_latest_rating(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'duplicates.db'}")
+    run_migrations(engine, target=8)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO ratings (id, user_id, movie_id, rating) VALUES "
+            "(1, 1, 1, 1), (2, 1, 1, 5), (3, 2, 1, 3), (4, 1, 2, 4)"
+        ))
+        connection.execute(text(
+            "INSERT INTO movie_rating_stats (movie_id, rating_count, rating_sum) VALUES (1, 3, 9), (2, 1, 4)"
+        ))
+    run_migrations(engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT id FROM ratings ORDER BY id")).scalars().all() == [2, 3, 4]
+        stats = connection.execute(text("SELECT rating_count, rating_sum FROM movie_rating_stats WHERE movie_id = 1"))
+        assert tuple(stats.one()) == (2, 8)
+        assert connection.execute(text("SELECT movie_id FROM movie_similar_dirty")).scalars().all() == [1]
+        with pytest.raises(Exception):
+            connection.execute(text("INSERT INTO ratings (user_id, movie_id, rating) VALUES (1, 1, 2)"))
+    engine.dispose()
+
+
+def test_leaderboard_migration_scores_existing_ratings(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ratings.db'}")
+    run_migrations(engine, target=6)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO ratings (id, user_id, movie_id, rating) VALUES (1, 1, 1, 5), (2, 2, 1, 3), (3, 1, 2, 1)"
+        ))
+        connection.execute(text("DELETE FROM movie_rating_stats"))
+        connection.execute(text(
+            "INSERT INTO movie_rating_stats (movie_id, rating_count, rating_sum) VALUES (1, 2, 8), (2, 1, 1)"
+        ))
+    run_migrations(engine)
+    with engine.connect() as connection:
+        board = connection.execute(text(
+            "SELECT window_days, movie_id, score FROM leaderboard ORDER BY window_days, movie_id"
+        )).all()
+        windows = connection.execute(text("SELECT window_days FROM leaderboard_state ORDER BY window_days"))
+        assert windows.scalars().all() == [0, 7, 30]
+    engine.dispose()
+    # Untimed ratings only count towards all time; the prior is their mean, 3.
+    assert [(window, movie) for window, movie, _ in board] == [(0, 1), (0, 2)]
+    assert board[0][2] == pytest.approx((10 * 3 + 8) / 12)
+    assert board[1][2] == pytest.approx((10 * 3 + 1) / 11)
@@ -1,7 +1,16 @@
+import asyncio
+import csv
+import io
+import json
+import numpy as np
 import pytest
 from httpx import AsyncClient
 from ..main import app
+from ..cache import response_cache
+from ..content_index import content_index
 from ..database import database
+from ..pagination import encode_cursor
+from ..routes.movies import movie_key
 
 auth_token_value = None
 
@@ -54,6 +63,7 @@ async def test_read_movie(stored_auth_token, test_create_movie):
         response = await ac.get(f"/movies/{movie_id}")
         assert response.status_code == 200, f"Failed to read movie: {response.text}"
         assert response.json()["id"] == movie_id
+        assert "rating_summary" not in response.json()
 
 
 @pytest.mark.asyncio
@@ -65,6 +75,7 @@ async def test_update_movie(test_create_movie):
         response = await ac.put(f"/movies/{movie_id}", json=updated_movie_data, headers=headers)
         assert response.status_code == 200, f"Failed to update movie: {response.text}"
         assert response.json()["title"] == updated_movie_data["title"]
+        assert "rating_summary" not in response.json()
 
 @pytest.mark.asyncio
 async def test_delete_movie(test_create_movie):
@@ -77,3 +88,296 @@ async def test_delete_movie(test_create_movie):
         # Try to get the deleted movie, expecting a 404
         get_response = await ac.get(f"/movies/{movie_id}")
         assert get_response.status_code == 404, f"Deleted movie still accessible: {get_response.text}"
+
+
+@pytest.mark.asyncio
+async def test_read_movies_with_cursor(test_create_movie):
+    await test_create_movie
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        first_page = await ac.get("/movies/", params={"limit": 1})
+        assert first_page.status_code == 200, f"Failed to read movies: {first_page.text}"
+        cursor = first_page.headers["X-Next-Cursor"]
+
+        second_page = await ac.get("/movies/", params={"limit": 1, "cursor": cursor})
+        assert second_page.status_code == 200, f"Failed to read movies: {second_page.text}"
+        assert second_page.json()[0]["id"] > first_page.json()[0]["id"]
+
+        bad_cursor = await ac.get("/movies/", params={"cursor": "not-a-cursor"})
+        assert bad_cursor.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_search_movies():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        movie_data = {"title": "Zanzibar Nights", "description": "A searchable test movie"}
+        response = await ac.post("/movies/", json=movie_data, headers=headers)
+        assert response.status_code == 200, f"Failed to create movie: {response.text}"
+        movie_id = response.json()["id"]
+
+        response = await ac.get("/movies/search", params={"q": "zanzib"})
+        assert response.status_code == 200, f"Failed to search movies: {response.text}"
+        results = {result["id"]: result for result in response.json()}
+        assert movie_id in results
+        assert "<mark>Zanzibar</mark>" in results[movie_id]["title_highlight"]
+
+        await ac.delete(f"/movies/{movie_id}", headers=headers)
+        response = await ac.get("/movies/search", params={"q": "zanzib"})
+        assert movie_id not in [result["id"] for result in response.json()]
+
+
+@pytest.mark.asyncio
+async def test_read_movie_conditional_get():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        response = await ac.post("/movies/", json={"title": "Cached", "description": "An ETag test"}, headers=headers)
+        movie_id = response.json()["id"]
+
+        response = await ac.get(f"/movies/{movie_id}")
+        etag = response.headers["ETag"]
+        assert "Last-Modified" in response.headers
+
+        response = await ac.get(f"/movies/{movie_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+
+        # A "-0000" zone parses as a naive datetime; it still means UTC.
+        last_modified = response.headers["Last-Modified"]
+        for since in (last_modified, last_modified.replace("GMT", "-0000"), "Mon, 01 Jan 2001 00:00:00 -0000"):
+            response = await ac.get(f"/movies/{movie_id}", headers={"If-Modified-Since": since})
+            assert response.status_code == (200 if since.startswith("Mon, 01 Jan 2001") else 304), since
+
+        await ac.put(f"/movies/{movie_id}", json={"title": "Changed", "description": "An ETag test"},
+                     headers=headers)
+        response = await ac.get(f"/movies/{movie_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json()["title"] == "Changed"
+        etag = response.headers["ETag"]
+
+        await ac.delete(f"/movies/{movie_id}", headers=headers)
+        # SQLite hands the highest id out again; the new row must not match the old tag.
+        response = await ac.post("/movies/", json={"title": "Reused", "description": "An ETag test"}, headers=headers)
+        assert response.json()["id"] == movie_id
+        await ac.put(f"/movies/{movie_id}", json={"title": "Reused", "description": "An ETag test"}, headers=headers)
+        response = await ac.get(f"/movies/{movie_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        await ac.delete(f"/movies/{movie_id}", headers=headers)
+
+
+@pytest.mark.asyncio
+async def test_movie_cache_is_invalidated_by_writes():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        response = await ac.post("/movies/", json={"title": "Before", "description": "Cache test"}, headers=headers)
+        movie_id = response.json()["id"]
+
+        assert (await ac.get(f"/movies/{movie_id}")).json()["title"] == "Before"
+        await ac.put(f"/movies/{movie_id}", json={"title": "After", "description": "Cache test"}, headers=headers)
+        assert (await ac.get(f"/movies/{movie_id}")).json()["title"] == "After"
+
+        listed = await ac.get("/movies/", params={"cursor": encode_cursor(movie_id - 1), "limit": 1})
+        assert listed.json()[0]["title"] == "After"
+        await ac.delete(f"/movies/{movie_id}", headers=headers)
+        assert (await ac.get(f"/movies/{movie_id}")).status_code == 404
+        listed = await ac.get("/movies/", params={"cursor": encode_cursor(movie_id - 1), "limit": 1})
+        assert all(movie["id"] != movie_id for movie in listed.json())
+
+
+@pytest.mark.asyncio
+async def test_movie_reads_hit_the_cache_backend_once(monkeypatch):
+    reads = []
+    backend_get = response_cache.backend.get
+
+    async def counted_get(key):
+        reads.append(key)
+        return await backend_get(key)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        movie_id = (await ac.post("/movies/", json={"title": "Once", "description": "Cache reads"},
+                                  headers=headers)).json()["id"]
+        etag = (await ac.get(f"/movies/{movie_id}")).headers["ETag"]
+        monkeypatch.setattr(response_cache.backend, "get", counted_get)
+
+        for validators, expected in (({"If-None-Match": '"stale"'}, 200), ({"If-None-Match": etag}, 304), ({}, 200)):
+            await response_cache.invalidate(movie_key(movie_id))
+            reads.clear()
+            stats = response_cache.stats()
+            response = await ac.get(f"/movies/{movie_id}", headers=validators)
+            assert response.status_code == expected
+            assert reads == [movie_key(movie_id)]
+            assert response_cache.stats()["misses"] == stats["misses"] + 1
+
+        # A plain read coalesced with a revalidation that short-cut to 304 still gets the movie.
+        await response_cache.invalidate(movie_key(movie_id))
+        coalesced = response_cache.stats()["coalesced"]
+        revalidated, plain = await asyncio.gather(
+            ac.get(f"/movies/{movie_id}", headers={"If-None-Match": etag}), ac.get(f"/movies/{movie_id}"))
+        assert revalidated.status_code == 304
+        assert plain.status_code == 200 and plain.json()["title"] == "Once"
+        assert response_cache.stats()["coalesced"] == coalesced + 1
+        await ac.delete(f"/movies/{movie_id}", headers=headers)
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_movies():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        ndjson = (
+            '{"title": "Bulk One", "description": "First"}\n'
+            '{"title": "Bulk Two", "description": "Second", "release_date": "2020-05-01T00:00:00"}\n'
+            'not json\n'
+            '{"title": "No description"}\n'
+        )
+        response = await ac.post("/movies/bulk", content=ndjson,
+                                 headers={**headers, "Content-Type": "application/x-ndjson"})
+        assert response.status_code == 200, f"Failed to import movies: {response.text}"
+        report = response.json()
+        assert report["inserted"] == 2
+        assert [error["line"] for error in report["errors"]] == [3, 4]
+
+        csv_body = 'title,description\n"Bulk, Three","Spans\ntwo lines"\nBulk Four,\n'
+        response = await ac.post("/movies/bulk", content=csv_body, headers={**headers, "Content-Type": "text/csv"})
+        report = response.json()
+        assert report["inserted"] == 1
+        assert report["errors"][0]["line"] == 4
+
+        response = await ac.get("/movies/search", params={"q": "bulk"})
+        titles = {result["title"] for result in response.json()}
+        assert {"Bulk One", "Bulk Two", "Bulk, Three"} <= titles
+
+        response = await ac.post("/movies/bulk", content="x", headers={**headers, "Content-Type": "text/plain"})
+        assert response.status_code == 415
+        response = await ac.post("/movies/bulk", json=[{"title": "Array", "description": "Not NDJSON"}],
+                                 headers=headers)
+        assert response.status_code == 415 and "JSON arrays are not accepted" in response.json()["detail"]
+        response = await ac.post("/movies/bulk", params={"format": "ndjson"}, headers=headers,
+                                 content='{"title": "Bulk Five", "description": "Fifth"}\n')
+        assert response.json()["inserted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_export_movies():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        assert (await ac.get("/movies/export")).status_code == 401
+        ac.headers["Authorization"] = f"Bearer {auth_token_value}"
+        response = await ac.get("/movies/export")
+        assert response.status_code == 200, f"Failed to export movies: {response.text}"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        ids = [row["id"] for row in rows]
+        assert ids == sorted(ids) and len(ids) > 1
+
+        resumed = await ac.get("/movies/export", params={"after_id": ids[0]})
+        assert [json.loads(line)["id"] for line in resumed.text.splitlines()] == ids[1:]
+
+        response = await ac.get("/movies/export", params={"format": "csv"})
+        assert response.headers["content-type"].startswith("text/csv")
+        csv_rows = list(csv.reader(io.StringIO(response.text)))
+        assert csv_rows[0] == ["id", "title", "description", "release_date", "owner_id"]
+        assert [int(row[0]) for row in csv_rows[1:]] == ids
+
+        assert (await ac.get("/movies/export", params={"format": "xml"})).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_export_movies_parquet():
+    parquet = pytest.importorskip("pyarrow.parquet")
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        ac.headers["Authorization"] = f"Bearer {auth_token_value}"
+        expected = [json.loads(line) for line in (await ac.get("/movies/export")).text.splitlines()]
+        response = await ac.get("/movies/export", params={"format": "parquet"})
+        assert response.status_code == 200, f"Failed to export movies: {response.text}"
+        table = parquet.read_table(io.BytesIO(response.content))
+        assert table.column_names == ["id", "title", "description", "release_date", "owner_id"]
+        assert table.column("id").to_pylist() == [row["id"] for row in expected]
+        assert table.column("title").to_pylist() == [row["title"] for row in expected]
+
+
+@pytest.mark.asyncio
+async def test_similar_movies_by_content():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        ids = []
+        for movie_data in [
+            {"title": "Galactic Pirates", "description": "Space pirates raid a galactic freighter"},
+            {"title": "Galactic Pirates Return", "description": "The space pirates raid again"},
+            {"title": "Garden Party", "description": "A quiet afternoon among roses"},
+        ]:
+            response = await ac.post("/movies/", json=movie_data, headers=headers)
+            ids.append(response.json()["id"])
+
+        # The background catch-up picks new movies up; requests themselves never write the index.
+        catch_ups = asyncio.create_task(content_index.catch_up_periodically(interval=3600))
+        try:
+            for _ in range(100):
+                response = await ac.get(f"/movies/{ids[0]}/similar", params={"mode": "content", "limit": 3})
+                if response.json():
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            catch_ups.cancel()
+            await asyncio.gather(catch_ups, return_exceptions=True)
+        assert response.status_code == 200, f"Failed to read similar movies: {response.text}"
+        results = response.json()
+        assert results[0]["id"] == ids[1]
+        assert ids[0] not in [movie["id"] for movie in results]
+        assert results == sorted(results, key=lambda movie: -movie["score"])
+
+        # Catch-ups write a copy and swap it in; a reader's existing mapping is left untouched.
+        mapped = content_index.vectors
+        before = np.array(mapped)
+        await ac.put(f"/movies/{ids[2]}", json={"title": "Galactic Pirates III", "description": "Space pirates"},
+                     headers=headers)
+        await ac.delete(f"/movies/{ids[1]}", headers=headers)
+        stats = await content_index.catch_up()
+        assert stats["removed"] == 1 and stats["updated"] >= 1
+        assert np.array_equal(np.array(mapped), before)
+        response = await ac.get(f"/movies/{ids[0]}/similar", params={"mode": "content", "limit": 3})
+        assert response.json()[0]["id"] == ids[2]
+
+        await content_index.catch_up(rebuild=True)
+        response = await ac.get(f"/movies/{ids[0]}/similar", params={"mode": "content", "limit": 3})
+        assert response.json()[0]["id"] == ids[2]
+
+        assert (await ac.get(f"/movies/{ids[0]}/similar", params={"mode": "bogus"})).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_read_movies_batch():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        ids = []
+        for title in ("Batch A", "Batch B"):
+            response = await ac.post("/movies/", json={"title": title, "description": "Batched"}, headers=headers)
+            ids.append(response.json()["id"])
+        await ac.post(f"/comments/{ids[1]}", json={"content": "One"}, headers=headers)
+        await ac.post(f"/comments/{ids[1]}", json={"content": "Two"}, headers=headers)
+        await ac.post(f"/ratings/{ids[1]}", json={"rating": 4}, headers=headers)
+        await ac.delete(f"/movies/{ids[0]}", headers=headers)
+
+        requested = [ids[1], ids[0], ids[1] + 100000]
+        response = await ac.post("/movies/batch", json={"ids": requested})
+        assert response.status_code == 200, f"Failed to read movies: {response.text}"
+        batch = response.json()
+        assert [movie["id"] for movie in batch["items"]] == [ids[1]]
+        assert batch["missing"] == requested[1:]
+        assert not {"rating_summary", "comment_count", "rating_count"} & set(batch["items"][0])
+
+        response = await ac.post("/movies/batch", json={"ids": [ids[1]], "include_ratings": True,
+                                                         "include_comment_counts": True})
+        movie = response.json()["items"][0]
+        assert movie["comment_count"] == 2 and movie["rating_count"] == 1
+        assert movie["rating_summary"]["count"] == 1 and movie["rating_summary"]["mean"] == 4
+
+        # Comment counts have their own flag on single and list reads too.
+        movie = (await ac.get(f"/movies/{ids[1]}", params={"include_comment_counts": True})).json()
+        assert movie["comment_count"] == 2 and not {"rating_summary", "rating_count"} & set(movie)
+        movie = (await ac.get(f"/movies/{ids[1]}", params={"include_ratings": True})).json()
+        assert movie["rating_count"] == 1 and "comment_count" not in movie
+        page = (await ac.get("/movies/", params={"cursor": encode_cursor(ids[1] - 1), "limit": 1,
+                                                 "include_comment_counts": True})).json()
+        assert page[0]["id"] == ids[1] and page[0]["comment_count"] == 2 and "rating_count" not in page[0]
+
+        response = await ac.post("/movies/batch", json={"ids": list(range(1, 1000))})
+        assert response.status_code == 422
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import pytest
+from sqlalchemy import select
+from ..database import Storage, create_tables, database_options, make_engine
+from ..search import search_statement
+from .. import aggregates, models
+from ..routes.ratings import lock_own_rating
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def postgres_url(tmp_path_factory):
+    """TEST_POSTGRES_URL if set, otherwise a throwaway local cluster started with initdb/pg_ctl."""
+    pytest.importorskip("asyncpg")
+    if os.getenv("TEST_POSTGRES_URL"):
+        yield os.environ["TEST_POSTGRES_URL"]
+        return
+
+    initdb, pg_ctl = shutil.which("initdb"), shutil.which("pg_ctl")
+    if not (initdb and pg_ctl):
+        pytest.skip("PostgreSQL is not installed; set TEST_POSTGRES_URL to run these tests")
+
+    data_dir = tmp_path_factory.mktemp("postgres")
+    port = free_port()
+    subprocess.run([initdb, "-D", str(data_dir), "-U", "postgres", "-A", "trust"],
+                   check=True, capture_output=True)
+    subprocess.run([pg_ctl, "-D", str(data_dir), "-w", "-l", str(data_dir / "server.log"),
+                    "-o", f"-p {port} -k {data_dir} -c listen_addresses=127.0.0.1", "start"],
+                   check=True, capture_output=True)
+    try:
+        yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run([pg_ctl, "-D", str(data_dir), "-w", "-m", "fast", "stop"], capture_output=True)
+
+
+@pytest.mark.asyncio
+async def test_postgres_backend(postgres_url):
+    engine = make_engine(postgres_url)
+    await create_tables(engine)
+    await engine.dispose()
+
+    storage = Storage(postgres_url, **database_options(postgres_url))
+    await storage.connect()
+    try:
+        user_id = await storage.execute(models.User.__table__.insert().values(
+            username="pg_tester", email="pg_tester@example.com", hashed_password="x"))
+        movie_id = await storage.execute(models.Movie.__table__.insert().values(
+            title="Postgres Pictures", description="A movie stored in PostgreSQL", user_id=user_id))
+
+        async with storage.transaction():
+            await storage.execute(models.Rating.__table__.insert().values(
+                rating=4.0, movie_id=movie_id, user_id=user_id))
+            await storage.execute(aggregates.rating_stats_delta(movie_id, 4.0, dialect="postgresql"))
+
+        stats = await storage.fetch_one(
+            select(aggregates.stats_table).where(aggregates.stats_table.c.movie_id == movie_id))
+        summary = aggregates.summary_from_row(movie_id, stats)
+        assert summary.count == 1 and summary.histogram[4] == 1
+
+        query, values = search_statement("postgre pict", 0, 10, "postgresql")
+        results = await storage.fetch_all(query, values)
+        assert [result["id"] for result in results] == [movie_id]
+    finally:
+        await storage.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_postgres_rating_writes_are_serialised(postgres_url):
+    storage = Storage(postgres_url, **database_options(postgres_url))
+    await storage.connect()
+    events = []
+
+    async def write(name: str, delay: float, hold: float):
+        await asyncio.sleep(delay)
+        async with storage.transaction():
+            await lock_own_rating(1, 1, storage)
+            events.append(f"{name} locked")
+            await asyncio.sleep(hold)
+            events.append(f"{name} done")
+
+    try:
+        # Separate tasks get separate pool connections, so only the lock orders them.
+        await asyncio.gather(write("first", 0, 0.2), write("second", 0.05, 0))
+        assert events == ["first locked", "first done", "second locked", "second done"]
+    finally:
+        await storage.disconnect()
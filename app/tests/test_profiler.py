@@ -0,0 +1,95 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from .. import models, trending
+from ..cache import response_cache
+from ..database import database
+from ..main import app
+from ..profiler import ProfilerMiddleware, QueryProfile, observe_query, query_budget, statement_shape
+from ..routes.movies import movie_key
+
+auth_token_value = None
+
+
+@pytest.fixture(scope="module", autouse=True)
+async def setup_and_teardown():
+    await database.connect()
+    yield
+    await database.disconnect()
+
+
+@pytest.fixture(scope="module")
+async def get_auth_token():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        login_response = await ac.post("/auth/token", data={"username": "testuser", "password": "testpassword"})
+        assert login_response.status_code == 200, f"Failed to login user: {login_response.text}"
+        return login_response.json()["access_token"]
+
+
+@pytest.fixture(scope="module")
+async def stored_auth_token(get_auth_token):
+    global auth_token_value
+    auth_token_value = await get_auth_token
+
+
+def test_repeated_statement_shapes_are_flagged():
+    profile = QueryProfile()
+    for movie_id in (1, 2, 3):
+        profile.record(select(models.Movie).where(models.Movie.id == movie_id), None, 0.001)
+    profile.record("SELECT  1", None, 0.001)
+    assert statement_shape("SELECT\n  1") == "SELECT 1"
+    assert profile.repeated() == [(statement_shape(select(models.Movie).where(models.Movie.id == 1)), 3)]
+    assert profile.queries[0].params == "id_1: int"
+    assert '4 queries, 3x one shape"' in profile.server_timing()
+    # Shapes are compiled as the storage compiles them, with its placeholders.
+    assert "movies.id = ?" in statement_shape(select(models.Movie).where(models.Movie.id == 1), database.dialect)
+
+
+@pytest.mark.asyncio
+async def test_endpoint_query_budgets(stored_auth_token):
+    await stored_auth_token
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        response = await ac.post("/movies/", json={"title": "Budgeted", "description": "Few queries"},
+                                 headers=headers)
+        movie_id = response.json()["id"]
+        response = await ac.post(f"/comments/{movie_id}", json={"content": "Cheap"}, headers=headers)
+        comment_id = response.json()["id"]
+
+        with query_budget(1):
+            await ac.get(f"/movies/{movie_id}", params={"include_ratings": True})
+        with query_budget(1):
+            await ac.post("/movies/batch", json={"ids": list(range(1, 200)), "include_ratings": True,
+                                                 "include_comment_counts": True})
+        # Every trending movie missing from the cache is loaded by one query.
+        for trending_id in (1, 2, 3, movie_id):
+            trending.trending_scores.record(trending_id)
+            await response_cache.invalidate(movie_key(trending_id))
+        with query_budget(1):
+            response = await ac.get("/movies/trending", params={"limit": 100})
+        assert movie_id in [movie["id"] for movie in response.json()]
+        with query_budget(0):
+            await ac.get("/movies/trending", params={"limit": 100})
+        # Select, then write; the user comes from the principal cache.
+        with query_budget(2):
+            await ac.put(f"/movies/{movie_id}", json={"title": "Budgeted", "description": "Still few"},
+                         headers=headers)
+        with query_budget(3, max_repeats=1):
+            await ac.delete(f"/comments/{comment_id}", headers=headers)
+
+        with pytest.raises(AssertionError, match="expected at most 0 queries"):
+            with query_budget(0):
+                await ac.get(f"/movies/{movie_id}", params={"include_ratings": True})
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header():
+    database.query_listeners.append(observe_query)
+    try:
+        async with AsyncClient(app=ProfilerMiddleware(app), base_url="http://test") as ac:
+            response = await ac.get("/movies/1", params={"include_ratings": True})
+    finally:
+        database.query_listeners.remove(observe_query)
+    assert response.headers["server-timing"].startswith("db;dur=")
+    assert 'desc="1 queries"' in response.headers["server-timing"]
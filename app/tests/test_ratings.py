@@ -1,7 +1,9 @@
+import asyncio
 import pytest
 from httpx import AsyncClient
 from ..main import app
 from ..database import database
+from .. import leaderboard, recommender
 
 auth_token_value = None
 movie_rating_id = None
@@ -64,3 +66,121 @@ async def test_read_ratings():
         response = await ac.get(f"/ratings/{movie_rating_id}")
         assert response.status_code == 200, f"Failed to read ratings: {response.text}"
         assert len(response.json()) > 0, "No ratings found"
+
+
+@pytest.mark.asyncio
+async def test_read_rating_summary():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get(f"/ratings/{movie_rating_id}/summary")
+        assert response.status_code == 200, f"Failed to read rating summary: {response.text}"
+        summary = response.json()
+        assert summary["count"] == 1
+        assert summary["mean"] == 4.5
+        assert summary["histogram"]["5"] == 1
+
+        response = await ac.get(f"/movies/{movie_rating_id}", params={"include_ratings": True})
+        assert response.status_code == 200, f"Failed to read movie: {response.text}"
+        assert response.json()["rating_summary"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_similar_movies():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        response = await ac.post("/movies/", json={"title": "Sequel", "description": "More of it"}, headers=headers)
+        sequel_id = response.json()["id"]
+        await ac.post(f"/ratings/{sequel_id}", json={"rating": 5}, headers=headers)
+
+        await recommender.refresh_similar(adjusted=False)
+        response = await ac.get(f"/movies/{movie_rating_id}/similar")
+        assert response.status_code == 200, f"Failed to read similar movies: {response.text}"
+        similar = {movie["id"]: movie for movie in response.json()}
+        assert similar[sequel_id]["title"] == "Sequel"
+        assert similar[sequel_id]["score"] > 0
+
+        assert (await ac.get("/movies/999999999/similar")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_rating_is_one_per_user_and_movie():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        response = await ac.post("/movies/", json={"title": "Rerated", "description": "Mixed"}, headers=headers)
+        rerated_id = response.json()["id"]
+
+        first = await ac.post(f"/ratings/{rerated_id}", json={"rating": 2}, headers=headers)
+        second = await ac.put(f"/ratings/{rerated_id}", json={"rating": 4}, headers=headers)
+        assert second.status_code == 200, f"Failed to update rating: {second.text}"
+        assert second.json()["id"] == first.json()["id"] and second.json()["rating"] == 4
+        assert [rating["rating"] for rating in (await ac.get(f"/ratings/{rerated_id}")).json()] == [4]
+        summary = (await ac.get(f"/ratings/{rerated_id}/summary")).json()
+        assert summary["count"] == 1 and summary["mean"] == 4
+        assert summary["histogram"] == {"1": 0, "2": 0, "3": 0, "4": 1, "5": 0}
+
+        response = await ac.delete(f"/ratings/{rerated_id}", headers=headers)
+        assert response.status_code == 200, f"Failed to delete rating: {response.text}"
+        assert (await ac.get(f"/ratings/{rerated_id}/summary")).json()["count"] == 0
+        assert (await ac.get(f"/ratings/{rerated_id}")).json() == []
+        movie = (await ac.get(f"/movies/{rerated_id}", params={"include_ratings": True,
+                                                               "include_comment_counts": True})).json()
+        assert movie["rating_count"] == 0 and movie["comment_count"] == 0
+        assert (await ac.delete(f"/ratings/{rerated_id}", headers=headers)).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_top_movies_leaderboard():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        response = await ac.post("/movies/", json={"title": "Chart Topper", "description": "Loved"}, headers=headers)
+        topper_id = response.json()["id"]
+        # Re-rating replaces the earlier rating rather than adding to it.
+        for rating in (1, 3, 5):
+            await ac.post(f"/ratings/{topper_id}", json={"rating": rating}, headers=headers)
+        # Force the daily roll, which rebuilds the windows from their day buckets.
+        # Requests never roll; the startup and periodic checks do.
+        await database.execute("UPDATE leaderboard_state SET rolled_day = 0")
+        rolls = await asyncio.gather(leaderboard.ensure_rolled(), leaderboard.ensure_rolled())
+        assert sorted(rolls) == [[], sorted(leaderboard.WINDOWS.values())]
+
+        # The test database holds older, unbounded ratings, so only the
+        # windows (which start empty) are checked for the exact top entry.
+        for window in ("7d", "30d"):
+            response = await ac.get("/movies/top", params={"window": window, "limit": 2})
+            assert response.status_code == 200, f"Failed to read leaderboard: {response.text}"
+            top = response.json()
+            assert top[0]["id"] == topper_id
+            assert top[0]["rank"] == 1 and top[0]["rating_count"] == 1 and top[0]["mean"] == 5
+            # The prior pulls the score below the raw mean.
+            assert top[0]["score"] < 5
+
+        response = await ac.get("/movies/top", params={"limit": 1000})
+        ranks = {entry["id"]: entry["rank"] for entry in response.json()}
+        assert ranks[topper_id] < ranks[movie_rating_id]
+
+        first_page = await ac.get("/movies/top", params={"limit": 1})
+        second_page = await ac.get("/movies/top", params={"limit": 1, "cursor": first_page.headers["X-Next-Cursor"]})
+        by_skip = await ac.get("/movies/top", params={"limit": 1, "skip": 1})
+        assert second_page.json() == by_skip.json()
+        assert second_page.json()[0]["rank"] == 2
+
+        assert (await ac.get("/movies/top", params={"window": "1y"})).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_trending_movies():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Authorization": f"Bearer {auth_token_value}"}
+        response = await ac.post("/movies/", json={"title": "Buzzing", "description": "Talked about"}, headers=headers)
+        buzzing_id = response.json()["id"]
+        for _ in range(50):
+            await ac.post(f"/ratings/{buzzing_id}", json={"rating": 3}, headers=headers)
+        await ac.post(f"/comments/{buzzing_id}", json={"content": "Everyone is watching this"}, headers=headers)
+
+        response = await ac.get("/movies/trending", params={"limit": 3})
+        assert response.status_code == 200, f"Failed to read trending movies: {response.text}"
+        top = response.json()
+        assert top[0]["id"] == buzzing_id and top[0]["title"] == "Buzzing"
+        assert top[0]["rank"] == 1 and top[0]["score"] == pytest.approx(51, rel=1e-3)
+        assert all(entry["score"] <= top[0]["score"] for entry in top)
+
+        assert (await ac.get("/movies/trending", params={"limit": 0})).status_code == 422
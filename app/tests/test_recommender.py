@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+
+from ..migrations import run_migrations
+from ..recommender import compute_neighbours, item_vectors, refresh
+
+
+def test_compute_neighbours_ranks_by_cosine():
+    # Users 1 and 2 rate movies 10 and 20 alike; movie 30 is rated oppositely.
+    users = np.array([1, 1, 1, 2, 2, 2, 3, 3])
+    movies = np.array([10, 20, 30, 10, 20, 30, 10, 30])
+    ratings = np.array([5, 5, 1, 4, 4, 2, 2, 5], dtype=float)
+    movie_ids, matrix = item_vectors(users, movies, ratings)
+
+    rows = np.arange(len(movie_ids))
+    lists, _ = compute_neighbours(movie_ids, matrix, rows, k=2, block_cells=2)
+    assert lists[10][0][0] == 20
+    assert all(similar != 30 for similar, _ in lists[20])
+    assert all(score > 0 for neighbours in lists.values() for _, score in neighbours)
+
+
+@pytest.fixture
+def ratings_engine():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'recommender.db')}")
+        run_migrations(engine)
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO users (id, username) VALUES (1, 'a'), (2, 'b'), (3, 'c')"))
+            connection.execute(text("INSERT INTO movies (id, title) VALUES (1, 'w'), (2, 'x'), (3, 'y'), (4, 'z')"))
+        yield engine
+        engine.dispose()
+
+
+def add_ratings(engine, ratings):
+    with engine.begin() as connection:
+        for user_id, movie_id, rating in ratings:
+            connection.execute(text("INSERT INTO ratings (user_id, movie_id, rating) VALUES (:u, :m, :r)"),
+                               {"u": user_id, "m": movie_id, "r": rating})
+            connection.execute(text(
+                "INSERT INTO movie_similar_dirty (movie_id) VALUES (:m) "
+                "ON CONFLICT (movie_id) DO UPDATE SET version = version + 1"
+            ), {"m": movie_id})
+
+
+def stored_lists(engine):
+    with engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT movie_id, similar_movie_id FROM movie_similar ORDER BY movie_id, score DESC"
+        )).all()
+    lists = {}
+    for movie_id, similar_id in rows:
+        lists.setdefault(movie_id, []).append(similar_id)
+    return lists
+
+
+def test_incremental_refresh_matches_full_rebuild(ratings_engine):
+    add_ratings(ratings_engine, [(1, 1, 5), (1, 2, 4), (1, 3, 1), (2, 1, 4), (2, 3, 2), (3, 2, 2), (3, 3, 5)])
+    with ratings_engine.connect() as connection:
+        assert refresh(connection, k=3, adjusted=False)["full"]
+
+    add_ratings(ratings_engine, [(2, 4, 5), (3, 4, 1), (1, 4, 4)])
+    with ratings_engine.connect() as connection:
+        result = refresh(connection, k=3, adjusted=False)
+    assert not result["full"]
+    incremental = stored_lists(ratings_engine)
+
+    with ratings_engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM movie_similar_dirty")).scalar() == 0
+        refresh(connection, k=3, adjusted=False, full=True)
+    # Without mean-centring, scores between clean movies do not drift.
+    assert incremental == stored_lists(ratings_engine)
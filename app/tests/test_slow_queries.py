@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from .. import models
+from ..slow_queries import SlowQueryLog, log_files, read_entries, redact, summarize
+
+
+@pytest.mark.asyncio
+async def test_slow_queries_are_logged_with_plan_and_redacted_params(storage, tmp_path):
+    path = str(tmp_path / "slow.ndjson")
+    log = SlowQueryLog(path, threshold_ms=0, storage=storage)
+    seen = []
+    storage.query_listeners += [log.observe, lambda query, values, seconds: seen.append(str(query))]
+    try:
+        await storage.fetch_all(select(models.User).where(models.User.username == "secret-name"))
+        await storage.fetch_all("SELECT COUNT(*) FROM movies WHERE id > :after", {"after": 5})
+        await log.drain()
+        # The plan lookups stay out of the listeners (metrics, the request's query count).
+        assert len(seen) == 2
+    finally:
+        log.close()
+
+    # Plans are looked up concurrently, so entries may be written in either order.
+    by_count, by_user = sorted(read_entries(path), key=lambda entry: "users" in entry["shape"])
+    assert by_user["params"] == {"username_1": "<str:11>"}
+    assert "secret-name" not in open(path).read()
+    assert any("ix_users_username" in step for step in by_user["plan"])
+    assert by_count["params"] == {"after": "<int>"} and by_count["plan"]
+    assert by_count["shape"] == "SELECT COUNT(*) FROM movies WHERE id > :after"
+
+
+def test_log_rotates_and_summary_ranks_by_total_time(tmp_path):
+    path = str(tmp_path / "slow.ndjson")
+    log = SlowQueryLog(path, max_bytes=300, backups=2)
+    for index in range(12):
+        log.write({"at": f"2024-01-01T00:00:{index:02d}", "ms": 10.0 if index % 3 else 100.0,
+                   "shape": "SELECT a" if index % 3 else "SELECT b", "params": {}, "plan": None})
+    log.close()
+
+    assert log_files(path) == [f"{path}.2", f"{path}.1", path]
+    entries = list(read_entries(path))
+    assert 0 < len(entries) < 12
+    assert [entry["at"] for entry in entries] == sorted(entry["at"] for entry in entries)
+    top = summarize(path, top=1)
+    assert len(top) == 1 and top[0]["shape"] == "SELECT b"
+    assert top[0]["total_ms"] == 100.0 * top[0]["count"] and top[0]["mean_ms"] == 100.0
+
+
+def test_redaction_keeps_only_types_and_sizes_unless_asked():
+    values = ["secret", b"\x00\x01", 42, 2.5, True, datetime(2024, 1, 2), None, [1, "ab"]]
+    assert [redact(value) for value in values] == [
+        "<str:6>", "<bytes:2>", "<int>", "<float>", "<bool>", "<datetime>", None, ["<int>", "<str:2>"]
+    ]
+    assert [redact(value, keep_scalars=True) for value in values] == [
+        "<str:6>", "<bytes:2>", 42, 2.5, True, "2024-01-02T00:00:00", None, [1, "<str:2>"]
+    ]
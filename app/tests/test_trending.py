@@ -0,0 +1,93 @@
+import pytest
+
+from ..trending import REBASE_HALF_LIVES, REFERENCE_HALF_LIVES, TrendingScores, checkpoint, restore
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_scores_halve_every_half_life():
+    clock = Clock()
+    scores = TrendingScores(half_life_hours=1, top_size=2, clock=clock)
+    scores.record(1, 4)
+    clock.now += 3600
+    scores.record(2, 3)
+    assert scores.score(1) == pytest.approx(2)
+    assert scores.top(2) == [(2, pytest.approx(3)), (1, pytest.approx(2))]
+
+    # A movie outside the top list enters it once it overtakes the last entry.
+    scores.record(3, 1)
+    assert [movie_id for movie_id, _ in scores.top(2)] == [2, 1]
+    scores.record(3, 3)
+    assert [movie_id for movie_id, _ in scores.top(2)] == [3, 2]
+
+    scores.forget(3)
+    assert [movie_id for movie_id, _ in scores.top(2)] == [2, 1]
+    assert len(scores) == 2
+
+
+def test_rebase_keeps_scores_and_drops_negligible_ones():
+    clock = Clock()
+    scores = TrendingScores(half_life_hours=1, clock=clock)
+    scores.record(1, 1)
+    clock.now += (REBASE_HALF_LIVES + 1) * 3600
+    scores.record(2, 5)
+    assert scores.epoch == clock.now
+    assert len(scores) == 1
+    assert scores.top(10) == [(2, pytest.approx(5))]
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_survives_restart(storage):
+    clock = Clock()
+    scores = TrendingScores(half_life_hours=1, clock=clock)
+    scores.record(1, 8)
+    scores.record(2, 2)
+    scores.record(3, 1)
+    assert await checkpoint(scores, storage) == 3
+    assert await checkpoint(scores, storage) == 0  # nothing changed since
+
+    scores.record(2, 1)
+    scores.forget(3)
+    assert await checkpoint(scores, storage) == 2
+
+    clock.now += 3600
+    restarted = TrendingScores(half_life_hours=1, clock=clock)
+    await restore(restarted, storage)
+    assert restarted.top(10) == [(1, pytest.approx(4)), (2, pytest.approx(1.5))]
+
+
+@pytest.mark.asyncio
+async def test_checkpoints_from_several_workers_add_up(storage):
+    clock = Clock()
+    workers = [TrendingScores(half_life_hours=1, clock=clock) for _ in range(2)]
+    workers[0].record(1, 4)
+    workers[1].record(1, 2)
+    workers[1].record(2, 1)
+    for worker in workers:
+        await checkpoint(worker, storage)
+
+    # A later reference time carries the older rows over, decayed.
+    clock.now += REFERENCE_HALF_LIVES * 3600
+    workers[0].record(1, 1)
+    await checkpoint(workers[0], storage)
+    restarted = TrendingScores(half_life_hours=1, clock=clock)
+    await restore(restarted, storage)
+    assert restarted.top(10) == [(1, pytest.approx(1 + 6 * 2.0 ** -REFERENCE_HALF_LIVES)),
+                                 (2, pytest.approx(2.0 ** -REFERENCE_HALF_LIVES))]
+
+    # Movies dropped as negligible by a rebase lose their rows, unless another worker kept them alive.
+    clock.now += (REBASE_HALF_LIVES + 1) * 3600
+    workers[1].record(1, 3)
+    await checkpoint(workers[1], storage)
+    workers[0].record(3, 1)
+    assert 1 not in workers[0]._index and 2 not in workers[0]._index
+    await checkpoint(workers[0], storage)
+    restarted = TrendingScores(half_life_hours=1, clock=clock)
+    await restore(restarted, storage)
+    assert restarted.top(10) == [(1, pytest.approx(3)), (3, pytest.approx(1))]
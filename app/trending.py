@@ -0,0 +1,266 @@
+"""Trending movies: exponentially decayed activity counters kept in memory.
+
+Every comment or rating adds ``weight`` to its movie's score, and scores
+halve every ``TRENDING_HALF_LIFE_HOURS``. Instead of decaying every counter
+as time passes, increments are scaled *up* by ``2 ** (age / half_life)``
+relative to a fixed epoch; all stored values then share one decay factor,
+so their order never changes with time and the top list only moves when an
+event arrives. Reads scale the stored values back down.
+
+Scores live in two parallel arrays (8 bytes per movie each) plus an id
+index, and the best ``TRENDING_TOP_SIZE`` are kept sorted, so reading the
+top is a slice. Every ``TRENDING_CHECKPOINT_SECONDS`` and on shutdown each
+worker adds the increments it has seen since its last checkpoint to
+``movie_trending`` (``score = score + delta``), so checkpoints from several
+workers add up; all of them are restored at startup. Events since the last
+checkpoint are lost on a crash, and between restarts each worker's top list
+only sees its own events.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, not_, or_, select, true
+
+from app import models
+from app.database import database, upsert
+
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24"))
+TRENDING_TOP_SIZE = int(os.getenv("TRENDING_TOP_SIZE", "100"))
+TRENDING_CHECKPOINT_SECONDS = float(os.getenv("TRENDING_CHECKPOINT_SECONDS", "60"))
+TRENDING_COMMENT_WEIGHT = float(os.getenv("TRENDING_COMMENT_WEIGHT", "1"))
+TRENDING_RATING_WEIGHT = float(os.getenv("TRENDING_RATING_WEIGHT", "1"))
+
+# Rebase before the scaled values can lose precision or overflow.
+REBASE_HALF_LIVES = 64
+# Scores below this (after decay) are dropped when rebasing.
+NEGLIGIBLE_SCORE = 1e-6
+# Checkpointed rows are kept as of a reference time shared by every worker,
+# which moves forward this many half-lives at a time.
+REFERENCE_HALF_LIVES = 32
+
+logger = logging.getLogger("uvicorn.error")
+
+trending_table = models.MovieTrending.__table__
+
+
+def to_timestamp(moment: datetime) -> float:
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+def to_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def reference_time(at: float, half_life: float) -> float:
+    span = REFERENCE_HALF_LIVES * half_life
+    return at // span * span
+
+
+class TrendingScores:
+    def __init__(self, half_life_hours: float = TRENDING_HALF_LIFE_HOURS, top_size: int = TRENDING_TOP_SIZE,
+                 clock=time.time):
+        self.half_life = half_life_hours * 3600
+        self.top_size = top_size
+        self.clock = clock
+        self.epoch = clock()
+        self._index: Dict[int, int] = {}
+        self._ids = array("q")
+        self._scores = array("d")
+        self._top: List[Tuple[float, int]] = []  # (-scaled score, movie id), best first
+        self._pending: Dict[int, float] = {}  # scaled increments since the last checkpoint
+        self._forgotten = set()
+        self._dropped = set()  # negligible at a rebase; their rows may be negligible too
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _growth(self, at: float) -> float:
+        return 2 ** ((at - self.epoch) / self.half_life)
+
+    def _set(self, movie_id: int, scaled: float):
+        position = self._index.get(movie_id)
+        if position is None:
+            self._index[movie_id] = len(self._ids)
+            self._ids.append(movie_id)
+            self._scores.append(scaled)
+        else:
+            self._scores[position] = scaled
+        self._place(movie_id, scaled)
+
+    def _place(self, movie_id: int, scaled: float):
+        # Scaled scores only grow, so a movie never has to move down the list.
+        for position, (_, top_id) in enumerate(self._top):
+            if top_id == movie_id:
+                del self._top[position]
+                break
+        else:
+            if len(self._top) >= self.top_size and -self._top[-1][0] >= scaled:
+                return
+        bisect.insort(self._top, (-scaled, movie_id))
+        del self._top[self.top_size:]
+
+    def _rebuild_top(self):
+        best = sorted(zip(self._scores, self._ids), reverse=True)[:self.top_size]
+        self._top = [(-scaled, movie_id) for scaled, movie_id in best]
+
+    def _rebase(self, at: float):
+        factor = self._growth(at)
+        kept = [(movie_id, scaled / factor) for movie_id, scaled in zip(self._ids, self._scores)
+                if scaled / factor >= NEGLIGIBLE_SCORE]
+        self._dropped.update(set(self._index) - {movie_id for movie_id, _ in kept})
+        self._pending = {movie_id: scaled / factor for movie_id, scaled in self._pending.items()
+                         if movie_id not in self._dropped}
+        self.epoch = at
+        self._index = {movie_id: position for position, (movie_id, _) in enumerate(kept)}
+        self._ids = array("q", [movie_id for movie_id, _ in kept])
+        self._scores = array("d", [scaled for _, scaled in kept])
+        self._rebuild_top()
+
+    def record(self, movie_id: int, weight: float = 1.0, at: Optional[float] = None):
+        at = self.clock() if at is None else at
+        if at - self.epoch > REBASE_HALF_LIVES * self.half_life:
+            self._rebase(at)
+        position = self._index.get(movie_id)
+        current = self._scores[position] if position is not None else 0.0
+        increment = weight * self._growth(at)
+        self._set(movie_id, current + increment)
+        self._pending[movie_id] = self._pending.get(movie_id, 0.0) + increment
+        self._forgotten.discard(movie_id)
+        self._dropped.discard(movie_id)
+
+    def forget(self, movie_id: int):
+        position = self._index.pop(movie_id, None)
+        if position is None:
+            return
+        # Swap the last entry into the hole to keep the arrays dense.
+        last_id, last_score = self._ids.pop(), self._scores.pop()
+        if position < len(self._ids):
+            self._ids[position], self._scores[position] = last_id, last_score
+            self._index[last_id] = position
+        self._pending.pop(movie_id, None)
+        self._dropped.discard(movie_id)
+        self._forgotten.add(movie_id)
+        if any(top_id == movie_id for _, top_id in self._top):
+            self._rebuild_top()
+
+    def score(self, movie_id: int, at: Optional[float] = None) -> float:
+        position = self._index.get(movie_id)
+        if position is None:
+            return 0.0
+        return self._scores[position] / self._growth(self.clock() if at is None else at)
+
+    def top(self, limit: int, at: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Best ``limit`` movies (at most ``top_size``) with their current scores."""
+        factor = self._growth(self.clock() if at is None else at)
+        return [(movie_id, -negative / factor) for negative, movie_id in self._top[:limit]]
+
+    def load(self, rows: Iterable[Tuple[int, float, float]]):
+        """Restore ``(movie_id, score, timestamp the score was taken at)`` rows."""
+        for movie_id, score, taken_at in rows:
+            position = self._index.get(movie_id)
+            current = self._scores[position] if position is not None else 0.0
+            self._set(movie_id, current + score * self._growth(taken_at))
+
+    def take_changes(self, at: Optional[float] = None) -> Tuple[List[Tuple[int, float]], List[int], List[int]]:
+        """Increments since the last call as of ``at``, and movies forgotten and dropped since."""
+        factor = self._growth(self.clock() if at is None else at)
+        changes = ([(movie_id, scaled / factor) for movie_id, scaled in self._pending.items()],
+                   list(self._forgotten), list(self._dropped))
+        self._pending = {}
+        self._forgotten = set()
+        self._dropped = set()
+        return changes
+
+    def put_back(self, changed: List[Tuple[int, float]], forgotten: List[int], dropped: List[int], at: float):
+        """Undo ``take_changes`` after a failed checkpoint."""
+        for movie_id, delta in changed:
+            if movie_id in self._index:
+                self._pending[movie_id] = self._pending.get(movie_id, 0.0) + delta * self._growth(at)
+        self._forgotten.update(movie_id for movie_id in forgotten if movie_id not in self._index)
+        self._dropped.update(movie_id for movie_id in dropped if movie_id not in self._index)
+
+
+trending_scores = TrendingScores()
+
+
+def record_comment(movie_id: int):
+    trending_scores.record(movie_id, TRENDING_COMMENT_WEIGHT)
+
+
+def record_rating(movie_id: int):
+    trending_scores.record(movie_id, TRENDING_RATING_WEIGHT)
+
+
+async def restore(scores: TrendingScores = trending_scores, db=None):
+    db = database if db is None else db
+    rows = await db.fetch_all(select(trending_table))
+    scores.load((row["movie_id"], row["score"], to_timestamp(row["updated_at"])) for row in rows)
+
+
+async def checkpoint(scores: TrendingScores = trending_scores, db=None) -> int:
+    """Add the increments since the last checkpoint; returns how many movies' rows were touched.
+
+    Rows hold scores as of ``reference_time``, the same for every worker, so
+    adding is plain arithmetic. A row left at the previous reference is decayed
+    on the way; anything older is negligible and replaced.
+    """
+    db = database if db is None else db
+    now = scores.clock()
+    reference = reference_time(now, scores.half_life)
+    previous = reference - REFERENCE_HALF_LIVES * scores.half_life
+    changed, forgotten, dropped = scores.take_changes(reference)
+    if not changed and not forgotten and not dropped:
+        return 0
+    table = trending_table
+    reference_at, previous_at = to_datetime(reference), to_datetime(previous)
+    # Other workers may still be adding to a movie this one dropped, so only negligible rows go.
+    reference_floor = NEGLIGIBLE_SCORE * 2 ** ((now - reference) / scores.half_life)
+    negligible = or_(
+        and_(table.c.updated_at == reference_at, table.c.score < reference_floor),
+        and_(table.c.updated_at == previous_at, table.c.score < reference_floor * 2 ** REFERENCE_HALF_LIVES),
+        # Not in_(): expanding parameters skip the DateTime bind processor on SQLite.
+        not_(or_(table.c.updated_at == reference_at, table.c.updated_at == previous_at)),
+    )
+    try:
+        async with db.transaction():
+            for stale, condition in ((forgotten, true()), (dropped, negligible)):
+                for start in range(0, len(stale), 500):
+                    await db.execute(table.delete().where(table.c.movie_id.in_(stale[start:start + 500]), condition))
+            for movie_id, delta in changed:
+                await db.execute(
+                    upsert(table)
+                    .values(movie_id=movie_id, score=delta, updated_at=reference_at)
+                    .on_conflict_do_update(
+                        index_elements=[table.c.movie_id],
+                        set_={
+                            "score": case(
+                                (table.c.updated_at == reference_at, table.c.score + delta),
+                                (table.c.updated_at == previous_at,
+                                 table.c.score * 2.0 ** -REFERENCE_HALF_LIVES + delta),
+                                else_=delta,
+                            ),
+                            "updated_at": reference_at,
+                        },
+                    )
+                )
+    except BaseException:
+        # Try again at the next checkpoint.
+        scores.put_back(changed, forgotten, dropped, reference)
+        raise
+    return len(changed) + len(forgotten) + len(dropped)
+
+
+async def checkpoint_periodically(scores: TrendingScores = trending_scores,
+                                  interval: float = TRENDING_CHECKPOINT_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await checkpoint(scores)
+        except Exception as e:
+            logger.error(f"Trending checkpoint failed: {str(e)}")
@@ -0,0 +1,77 @@
+"""Movie import throughput: one INSERT per row against app.bulk.import_movies.
+
+    python -m benchmarks.bench_import --rows 100000 --chunk-size 1000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import orjson
+from sqlalchemy import create_engine
+
+from app import bulk, models
+from app.database import Storage
+from app.migrations import run_migrations
+
+
+def make_lines(count):
+    for i in range(count):
+        yield orjson.dumps({
+            "title": f"Movie {i}",
+            "description": f"Description for movie number {i}",
+            "release_date": "2024-01-01T00:00:00",
+        }).decode()
+
+
+async def row_at_a_time(db, count):
+    for line in make_lines(count):
+        record = orjson.loads(line)
+        await db.execute(models.Movie.__table__.insert().values(
+            title=record["title"], description=record["description"],
+            release_date=datetime.fromisoformat(record["release_date"]), user_id=1,
+            version=1, updated_at=datetime.utcnow(),
+        ))
+
+
+async def bulk_import(db, count, chunk_size):
+    report = await bulk.import_movies(bulk.iter_text_lines(make_lines(count)), "ndjson", 1, db=db,
+                                      chunk_size=chunk_size)
+    assert report["inserted"] == count, report
+
+
+async def measure(label, path, rows, func):
+    engine = create_engine(f"sqlite:///{path}")
+    run_migrations(engine)
+    engine.dispose()
+    db = Storage(f"sqlite:///{path}")
+    await db.connect()
+    start = time.perf_counter()
+    await func(db)
+    elapsed = time.perf_counter() - start
+    await db.disconnect()
+    print(f"{label:<22} {rows / elapsed:12,.0f} rows/s")
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory() as directory:
+        await measure("one insert per row", os.path.join(directory, "rows.db"), args.baseline_rows,
+                      lambda db: row_at_a_time(db, args.baseline_rows))
+        await measure(f"bulk (chunks of {args.chunk_size})", os.path.join(directory, "bulk.db"), args.rows,
+                      lambda db: bulk_import(db, args.rows, args.chunk_size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--baseline-rows", type=int, default=5000,
+                        help="rows for the one-insert-per-row baseline, which is much slower")
+    parser.add_argument("--chunk-size", type=int, default=bulk.IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Measure GET /movies/ latency while logins are hammering the API.
+
+Run once with the bcrypt work on the event loop and once with the worker
+pool to see the difference:
+
+    python -m benchmarks.bench_login_latency --executor inline
+    python -m benchmarks.bench_login_latency --executor thread
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+from app import utils
+from app.database import database
+from app.main import app
+
+USER = {"username": "bench_login", "email": "bench_login@example.com", "password": "bench-password"}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def login_loop(client, stop):
+    while not stop.is_set():
+        await client.post("/auth/token", data={"username": USER["username"], "password": USER["password"]})
+
+
+async def read_loop(client, stop, samples):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/movies/")
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+
+
+async def run(args):
+    utils.password_hasher.shutdown()
+    utils.password_hasher = utils.PasswordHasher(
+        executor=args.executor, workers=args.workers, max_pending=args.max_pending
+    )
+    await database.connect()
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+            await client.post("/auth/register", json=USER)
+
+            stop = asyncio.Event()
+            samples = []
+            tasks = [asyncio.create_task(login_loop(client, stop)) for _ in range(args.logins)]
+            tasks.append(asyncio.create_task(read_loop(client, stop, samples)))
+            await asyncio.sleep(args.duration)
+            stop.set()
+            await asyncio.gather(*tasks)
+    finally:
+        await database.disconnect()
+        utils.password_hasher.shutdown()
+
+    print(f"executor={args.executor} concurrent_logins={args.logins} reads={len(samples)}")
+    print(f"GET /movies/ p50={statistics.median(samples):.1f}ms "
+          f"p99={percentile(samples, 99):.1f}ms max={max(samples):.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--executor", choices=["inline", "thread", "process"], default="thread")
+    parser.add_argument("--workers", type=int, default=utils.PASSWORD_HASH_WORKERS)
+    parser.add_argument("--max-pending", type=int, default=utils.PASSWORD_HASH_MAX_PENDING)
+    parser.add_argument("--logins", type=int, default=8, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to run")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
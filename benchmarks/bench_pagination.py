@@ -0,0 +1,70 @@
+"""Compare time per page for offset and cursor paging over a large movies table.
+
+    python -m benchmarks.bench_pagination --rows 1000000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite
+
+from app import models
+from app.pagination import encode_cursor, paginate
+
+PAGE_SIZE = 10
+
+
+def compile_query(query):
+    compiled = query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True})
+    return str(compiled)
+
+
+def movies_query(skip=0, cursor=None):
+    query = select(models.Movie.id, models.Movie.title, models.Movie.description,
+                   models.Movie.release_date, models.Movie.user_id)
+    return compile_query(paginate(query, models.Movie.id, skip=skip, limit=PAGE_SIZE, cursor=cursor))
+
+
+def seed(conn, rows):
+    conn.execute("CREATE TABLE movies (id INTEGER PRIMARY KEY, title VARCHAR, description VARCHAR, "
+                 "release_date DATETIME, user_id INTEGER)")
+    batch = 50000
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO movies (title, description, release_date, user_id) VALUES (?, ?, '2024-01-01', 1)",
+            ((f"Movie {i}", f"Description {i}") for i in range(start, min(rows, start + batch))),
+        )
+    conn.commit()
+
+
+def time_page(conn, sql, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        seed(conn, args.rows)
+        print(f"{'depth':>10} {'offset ms':>10} {'cursor ms':>10}")
+        depths = [10 ** power for power in range(len(str(args.rows))) if 10 ** power < args.rows]
+        for depth in depths + [args.rows - PAGE_SIZE]:
+            offset_ms = time_page(conn, movies_query(skip=depth))
+            cursor_ms = time_page(conn, movies_query(cursor=encode_cursor(depth)))
+            print(f"{depth:>10} {offset_ms:>10.3f} {cursor_ms:>10.3f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Item-item similarity build time on synthetic ratings (app.recommender).
+
+    python -m benchmarks.bench_recommender --ratings 10000000 --users 500000 --movies 50000
+
+Movie popularity follows a Zipf-like curve, as real catalogues do, so a few
+movies share raters with almost everything. Reports the matrix build, a full
+top-k pass and an incremental pass over --dirty changed movies.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.recommender import SIMILAR_TOP_K, SIMILARITY_BLOCK_CELLS, compute_neighbours, item_vectors
+
+
+def synthetic_ratings(count, users, movies, seed=0):
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, movies + 1) ** 0.8
+    movie_ids = rng.choice(movies, size=count, p=popularity / popularity.sum()) + 1
+    user_ids = rng.integers(1, users + 1, size=count)
+    ratings = np.clip(np.round(rng.normal(3.5, 1.1, size=count) * 2) / 2, 0.5, 5)
+    return user_ids, movie_ids, ratings
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<28} {time.perf_counter() - start:8.2f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ratings", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=500_000)
+    parser.add_argument("--movies", type=int, default=50_000)
+    parser.add_argument("--dirty", type=int, default=100)
+    parser.add_argument("--k", type=int, default=SIMILAR_TOP_K)
+    parser.add_argument("--block-cells", type=int, default=SIMILARITY_BLOCK_CELLS)
+    args = parser.parse_args()
+
+    users, movies, ratings = timed("generate ratings", lambda: synthetic_ratings(args.ratings, args.users,
+                                                                                args.movies))
+    movie_ids, matrix = timed("build matrix", lambda: item_vectors(users, movies, ratings))
+    print(f"{len(movie_ids):,} movies, {matrix.shape[1]:,} users, {matrix.nnz:,} ratings")
+
+    rng = np.random.default_rng(1)
+    dirty = np.sort(rng.choice(len(movie_ids), size=min(args.dirty, len(movie_ids)), replace=False))
+    _, candidates = timed(f"incremental ({len(dirty)} movies)", lambda: compute_neighbours(
+        movie_ids, matrix, dirty, args.k, args.block_cells, collect_candidates=True))
+    print(f"{len(candidates):,} other movies to merge")
+
+    lists, _ = timed("full top-k", lambda: compute_neighbours(
+        movie_ids, matrix, np.arange(len(movie_ids)), args.k, args.block_cells))
+    print(f"{sum(len(neighbours) for neighbours in lists.values()):,} neighbour pairs")
+
+
+if __name__ == "__main__":
+    main()
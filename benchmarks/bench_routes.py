@@ -0,0 +1,379 @@
+"""Load-test every endpoint and report throughput, latency percentiles and allocations as JSON.
+
+    python -m benchmarks.bench_routes run --movies 5000 --requests 200 --concurrency 8 --output base.json
+    python -m benchmarks.bench_routes run --url http://localhost:8000 --movies 5000 --output live.json
+    python -m benchmarks.bench_routes compare base.json new.json --threshold 0.10
+
+``run`` seeds a fresh database in a temporary directory (see benchmarks.seed)
+and drives the app in-process through httpx's ASGI transport. With --url it
+drives a running server instead; seed that server's database with
+benchmarks.seed using the same sizes. ``compare`` exits non-zero when any
+scenario regressed by more than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+import httpx
+
+# Latency and allocations: lower is better. Throughput: higher is better.
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "mean_ms", "alloc_peak_kib", "alloc_retained_kib")
+HIGHER_IS_BETTER = ("throughput_rps",)
+DEFAULT_METRICS = ("p95_ms", "throughput_rps")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Context:
+    """What scenarios need to build requests: dataset sizes, auth and ids created along the way."""
+
+    def __init__(self, seeding, users: int, movies: int, ratings: int, comments: int, seed: int):
+        self.rng = random.Random(seed)
+        self.username = seeding.BENCH_USERNAME
+        self.password = seeding.BENCH_PASSWORD
+        self.words = seeding.WORDS
+        self.users = users
+        self.movies = movies
+        self.ratings = ratings
+        self.comments = comments
+        self.headers = {}
+        self.created_movies = []
+        self.created_comments = []
+        self.rated_movies = []
+        self.registered = 0
+
+    def movie_id(self) -> int:
+        return self.rng.randint(1, self.movies)
+
+    def word(self) -> str:
+        return self.rng.choice(self.words)
+
+    def new_movie(self) -> dict:
+        return {"title": f"Bench {self.word()} {self.word()}", "description": " ".join(self.word() for _ in range(12))}
+
+
+def created_movie(context, response):
+    context.created_movies.append(response.json()["id"])
+
+
+def created_comment(context, response):
+    context.created_comments.append(response.json()["id"])
+
+
+def rated_movie(context, response):
+    movie_id = response.json()["movie_id"]
+    if movie_id not in context.rated_movies:  # re-rating replaces, so delete each movie once
+        context.rated_movies.append(movie_id)
+
+
+def pop_or(pool: list, fallback: int) -> int:
+    # An empty pool means the matching create scenario was filtered out; the request then 404s.
+    return pool.pop() if pool else fallback
+
+
+def bulk_body(context) -> bytes:
+    lines = (json.dumps(context.new_movie()) for _ in range(10))
+    return "\n".join(lines).encode()
+
+
+def register_body(context) -> dict:
+    context.registered += 1
+    name = f"bench_{os.getpid()}_{time.time_ns()}_{context.registered}"
+    return {"username": name, "email": f"{name}@example.com", "password": context.password}
+
+
+def tail(total: int) -> int:
+    return max(total - 200, 0)
+
+
+# (name, share of --requests, request builder, response hook). Deletes follow
+# the creates that fill their pools; names are stable keys for compare.
+SCENARIOS = [
+    ("GET /movies/", 1, lambda c: ("GET", "/movies/", {"params": {"skip": c.rng.randint(0, 50) * 10}}), None),
+    ("GET /movies/?include_ratings", 1, lambda c: (
+        "GET", "/movies/", {"params": {"skip": c.rng.randint(0, 50) * 10, "include_ratings": True}}), None),
+    ("GET /movies/{id}", 1, lambda c: ("GET", f"/movies/{c.movie_id()}", {}), None),
+    ("GET /movies/{id}?include_ratings", 1, lambda c: (
+        "GET", f"/movies/{c.movie_id()}", {"params": {"include_ratings": True}}), None),
+    ("GET /movies/search", 1, lambda c: ("GET", "/movies/search", {"params": {"q": c.word()}}), None),
+    ("GET /movies/top", 1, lambda c: ("GET", "/movies/top", {}), None),
+    ("GET /movies/top?window=7d", 1, lambda c: ("GET", "/movies/top", {"params": {"window": "7d"}}), None),
+    ("GET /movies/trending", 1, lambda c: ("GET", "/movies/trending", {}), None),
+    ("GET /movies/{id}/similar", 1, lambda c: ("GET", f"/movies/{c.movie_id()}/similar", {}), None),
+    ("GET /movies/{id}/similar?mode=content", 1, lambda c: (
+        "GET", f"/movies/{c.movie_id()}/similar", {"params": {"mode": "content"}}), None),
+    ("POST /movies/batch", 1, lambda c: ("POST", "/movies/batch", {"json": {
+        "ids": [c.movie_id() for _ in range(50)], "include_ratings": True, "include_comment_counts": True}}), None),
+    ("GET /movies/export", 0.2, lambda c: ("GET", "/movies/export", {
+        "params": {"after_id": tail(c.movies)}, "headers": c.headers}), None),
+    ("GET /comments/{id}", 1, lambda c: ("GET", f"/comments/{c.movie_id()}", {}), None),
+    ("GET /comments/{id}/tree", 1, lambda c: ("GET", f"/comments/{c.movie_id()}/tree", {}), None),
+    ("GET /comments/export", 0.2, lambda c: (
+        "GET", "/comments/export", {"params": {"after_id": tail(c.comments)}, "headers": c.headers}), None),
+    ("GET /ratings/{id}", 1, lambda c: ("GET", f"/ratings/{c.movie_id()}", {}), None),
+    ("GET /ratings/{id}/summary", 1, lambda c: ("GET", f"/ratings/{c.movie_id()}/summary", {}), None),
+    ("GET /ratings/export", 0.2, lambda c: (
+        "GET", "/ratings/export", {"params": {"after_id": tail(c.ratings)}, "headers": c.headers}), None),
+    ("POST /movies/", 1, lambda c: ("POST", "/movies/", {"json": c.new_movie(), "headers": c.headers}),
+     created_movie),
+    ("PUT /movies/{id}", 1, lambda c: (
+        "PUT", f"/movies/{c.rng.choice(c.created_movies or [0])}", {"json": c.new_movie(), "headers": c.headers}),
+     None),
+    ("DELETE /movies/{id}", 1, lambda c: (
+        "DELETE", f"/movies/{pop_or(c.created_movies, 0)}", {"headers": c.headers}), None),
+    ("POST /movies/bulk", 0.2, lambda c: ("POST", "/movies/bulk", {
+        "content": bulk_body(c), "headers": {**c.headers, "Content-Type": "application/x-ndjson"}}), None),
+    ("POST /comments/{id}", 1, lambda c: ("POST", f"/comments/{c.movie_id()}", {
+        "json": {"content": " ".join(c.word() for _ in range(10))}, "headers": c.headers}), created_comment),
+    ("DELETE /comments/{id}", 1, lambda c: (
+        "DELETE", f"/comments/{pop_or(c.created_comments, 0)}", {"headers": c.headers}), None),
+    ("POST /ratings/{id}", 1, lambda c: ("POST", f"/ratings/{c.movie_id()}", {
+        "json": {"rating": c.rng.randint(1, 5)}, "headers": c.headers}), rated_movie),
+    ("PUT /ratings/{id}", 1, lambda c: ("PUT", f"/ratings/{c.movie_id()}", {
+        "json": {"rating": c.rng.randint(1, 5)}, "headers": c.headers}), rated_movie),
+    ("DELETE /ratings/{id}", 1, lambda c: (
+        "DELETE", f"/ratings/{pop_or(c.rated_movies, 0)}", {"headers": c.headers}), None),
+    # Both hash a password with bcrypt, so they run far fewer requests.
+    ("POST /auth/register", 0.05, lambda c: ("POST", "/auth/register", {"json": register_body(c)}), None),
+    ("POST /auth/token", 0.05, lambda c: ("POST", "/auth/token", {
+        "data": {"username": c.username, "password": c.password}}), None),
+    ("GET /metrics", 0.2, lambda c: ("GET", "/metrics", {}), None),
+]
+
+
+async def send(client, context, build, after):
+    method, url, kwargs = build(context)
+    started = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    await response.aread()
+    elapsed = time.perf_counter() - started
+    if response.status_code < 400 and after is not None:
+        after(context, response)
+    return response.status_code, elapsed
+
+
+async def measure_allocations(client, context, build, after, requests: int) -> dict:
+    """Python heap growth over ``requests`` sequential requests (client and, in-process, the app)."""
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for _ in range(requests):
+            await send(client, context, build, after)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"alloc_peak_kib": round((peak - baseline) / 1024, 1),
+            "alloc_retained_kib": round((current - baseline) / 1024 / requests, 3)}
+
+
+async def run_scenario(client, context, build, after, requests: int, concurrency: int, warmup: int,
+                       alloc_requests: int) -> dict:
+    for _ in range(warmup):
+        await send(client, context, build, after)
+    allocations = {"alloc_peak_kib": None, "alloc_retained_kib": None}
+    if alloc_requests:
+        allocations = await measure_allocations(client, context, build, after, alloc_requests)
+
+    latencies = []
+    statuses = Counter()
+    remaining = iter(range(requests))  # shared by the workers
+
+    async def worker():
+        for _ in remaining:
+            status, elapsed = await send(client, context, build, after)
+            statuses[status] += 1
+            latencies.append(elapsed * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    wall = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": round(requests / wall, 1),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        **allocations,
+    }
+
+
+async def drive(client, args, context) -> dict:
+    response = await client.post("/auth/token", data={"username": context.username, "password": context.password})
+    response.raise_for_status()
+    context.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    results = {}
+    for name, share, build, after in SCENARIOS:
+        if args.only and not any(pattern in name for pattern in args.only):
+            continue
+        requests = max(int(args.requests * share), 5)
+        results[name] = await run_scenario(client, context, build, after, requests, args.concurrency,
+                                           args.warmup, 0 if args.url else args.alloc_requests)
+        print(f"{name:<40} {results[name]['p50_ms']:>9.2f} ms p50 {results[name]['p95_ms']:>9.2f} ms p95 "
+              f"{results[name]['throughput_rps']:>9.1f} req/s  errors={results[name]['errors']}", file=sys.stderr)
+    return results
+
+
+async def run_in_process(args, context) -> dict:
+    from app.main import app
+
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            return await drive(client, args, context)
+    finally:
+        await app.router.shutdown()
+
+
+async def run_remote(args, context) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        return await drive(client, args, context)
+
+
+def run(args) -> dict:
+    dataset = {"users": args.users, "movies": args.movies, "ratings": args.ratings, "comments": args.comments,
+               "seed": args.seed}
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.url:
+            # Before anything imports app: its modules read these at import time.
+            os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            os.environ["CONTENT_INDEX_PATH"] = os.path.join(tmp, "content_index")
+            os.environ["SLOW_QUERY_LOG_PATH"] = os.path.join(tmp, "slow_queries.ndjson")
+        from benchmarks import seed as seeding
+
+        if args.url:
+            target = args.url
+            context = Context(seeding, args.users, args.movies, args.ratings, args.comments, args.seed)
+            scenarios = asyncio.run(run_remote(args, context))
+        else:
+            target = "asgi"
+            dataset = seeding.seed(os.environ["DATABASE_URL"], users=args.users, movies=args.movies,
+                                   ratings=args.ratings, comments=args.comments, seed=args.seed)
+            print(f"seeded {dataset}", file=sys.stderr)
+            context = Context(seeding, dataset["users"], dataset["movies"], dataset["ratings"], dataset["comments"],
+                              args.seed)
+            scenarios = asyncio.run(run_in_process(args, context))
+    return {
+        "meta": {
+            "target": target,
+            "dataset": dataset,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "alloc_requests": 0 if args.url else args.alloc_requests,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": datetime.utcnow().isoformat(),
+        },
+        "scenarios": scenarios,
+    }
+
+
+def compare(base: dict, new: dict, threshold: float, metrics=DEFAULT_METRICS, min_delta_ms: float = 0.5) -> list:
+    """One row per scenario and metric: ``(scenario, metric, base, new, change, regressed)``.
+
+    Latencies must also move by at least ``min_delta_ms``, so sub-millisecond
+    noise on fast endpoints does not count. A scenario missing from ``new``,
+    or newly returning errors, is a regression.
+    """
+    rows = []
+    for name, before in base["scenarios"].items():
+        after = new["scenarios"].get(name)
+        if after is None:
+            rows.append((name, "missing", None, None, None, True))
+            continue
+        if after["errors"] > before["errors"]:
+            rows.append((name, "errors", before["errors"], after["errors"], None, True))
+        for metric in metrics:
+            old, current = before.get(metric), after.get(metric)
+            if old is None or current is None:
+                continue
+            change = (current - old) / old if old else 0.0
+            if metric in HIGHER_IS_BETTER:
+                regressed = change < -threshold
+            else:
+                regressed = change > threshold and not (metric.endswith("_ms") and current - old < min_delta_ms)
+            rows.append((name, metric, old, current, change, regressed))
+    return rows
+
+
+def run_command(args):
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(text + "\n")
+    else:
+        print(text)
+
+
+def compare_command(args):
+    with open(args.base) as handle:
+        base = json.load(handle)
+    with open(args.new) as handle:
+        new = json.load(handle)
+    rows = compare(base, new, args.threshold, args.metric or DEFAULT_METRICS, args.min_delta_ms)
+    print(f"{'scenario':<40} {'metric':<18} {'base':>10} {'new':>10} {'change':>8}")
+    for name, metric, old, current, change, regressed in rows:
+        shown = [f"{value:>10.2f}" if isinstance(value, (int, float)) else f"{'-':>10}" for value in (old, current)]
+        delta = f"{change:>+8.1%}" if change is not None else f"{'-':>8}"
+        print(f"{name:<40} {metric:<18} {shown[0]} {shown[1]} {delta}{'  REGRESSED' if regressed else ''}")
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"{regressions} regression(s) over {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="seed a dataset, drive every route and write JSON results")
+    run_parser.add_argument("--users", type=int, default=1000)
+    run_parser.add_argument("--movies", type=int, default=5000)
+    run_parser.add_argument("--ratings", type=int, default=50000)
+    run_parser.add_argument("--comments", type=int, default=20000)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--requests", type=int, default=200, help="requests per scenario (before its share)")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--warmup", type=int, default=5, help="untimed requests per scenario")
+    run_parser.add_argument("--alloc-requests", type=int, default=20,
+                            help="sequential requests traced with tracemalloc per scenario (0 skips)")
+    run_parser.add_argument("--only", action="append", help="run scenarios whose name contains this (repeatable)")
+    run_parser.add_argument("--url", help="drive a running server instead of the app in-process")
+    run_parser.add_argument("--output", help="write JSON here instead of stdout")
+    run_parser.set_defaults(handler=run_command)
+
+    compare_parser = commands.add_parser("compare", help="diff two runs; exit 1 on regressions")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative change")
+    compare_parser.add_argument("--metric", action="append",
+                                choices=LOWER_IS_BETTER + HIGHER_IS_BETTER, help="metrics to check (repeatable)")
+    compare_parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                                help="ignore latency changes smaller than this")
+    compare_parser.set_defaults(handler=compare_command)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Serialization cost per 1,000 movie rows: Pydantic + response_model + json versus dicts + orjson.
+
+    python -m benchmarks.bench_serialization
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app import schemas
+from app.serialization import FastJSONResponse, rows_to_dicts
+
+
+def make_rows(count):
+    start = datetime(2024, 1, 1, 12, 30, 15, 123456)
+    return [
+        {
+            "id": i,
+            "title": f"Movie {i}",
+            "description": f"Description for movie number {i}",
+            "release_date": start + timedelta(days=i),
+            "owner_id": i % 50,
+        }
+        for i in range(count)
+    ]
+
+
+def pydantic_path(rows, adapter):
+    # What the handlers used to do: build a model per row, then FastAPI
+    # validates against response_model, dumps to JSON types and json-encodes.
+    models = [schemas.Movie(**row) for row in rows]
+    validated = adapter.validate_python(models)
+    return json.dumps(adapter.dump_python(validated, mode="json"), separators=(",", ":")).encode()
+
+
+def fast_path(rows):
+    return FastJSONResponse(rows_to_dicts(rows)).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    adapter = TypeAdapter(List[schemas.Movie])
+    for label, func in [("pydantic + json", lambda: pydantic_path(rows, adapter)),
+                        ("dicts + orjson", lambda: fast_path(rows))]:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{label:<16} {best * 1000 / args.rows * 1000:8.3f} ms per 1,000 rows")
+
+
+if __name__ == "__main__":
+    main()
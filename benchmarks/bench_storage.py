@@ -0,0 +1,79 @@
+"""Concurrent read/write throughput of the stock SQLite setup against app.database.Storage.
+
+    python -m benchmarks.bench_storage --readers 8 --writers 2 --duration 5
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from databases import Database
+from sqlalchemy import create_engine, select
+
+from app import models
+from app.database import Storage
+from app.migrations import run_migrations
+
+
+def prepare(path, movies):
+    engine = create_engine(f"sqlite:///{path}")
+    run_migrations(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.executemany(
+        "INSERT INTO movies (title, description, release_date, user_id) VALUES (?, ?, '2024-01-01', 1)",
+        ((f"Movie {i}", f"Description {i}") for i in range(movies)),
+    )
+    conn.commit()
+    conn.close()
+
+
+async def reader(db, stop, counts):
+    query = select(models.Movie.id, models.Movie.title).order_by(models.Movie.id).limit(10)
+    while not stop.is_set():
+        await db.fetch_all(query)
+        counts["reads"] += 1
+
+
+async def writer(db, stop, counts):
+    while not stop.is_set():
+        await db.execute(models.Comment.__table__.insert().values(content="bench", movie_id=1, user_id=1))
+        counts["writes"] += 1
+
+
+async def run(db, args):
+    await db.connect()
+    stop = asyncio.Event()
+    counts = {"reads": 0, "writes": 0}
+    tasks = [asyncio.create_task(reader(db, stop, counts)) for _ in range(args.readers)]
+    tasks += [asyncio.create_task(writer(db, stop, counts)) for _ in range(args.writers)]
+    start = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    await db.disconnect()
+    return {name: count / elapsed for name, count in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--movies", type=int, default=10000)
+    args = parser.parse_args()
+
+    for label, factory in [("stock databases.Database", Database), ("Storage (WAL + pools)", Storage)]:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            prepare(path, args.movies)
+            rates = asyncio.run(run(factory(f"sqlite:///{path}"), args))
+        print(f"{label:<26} reads/s={rates['reads']:>9.0f} writes/s={rates['writes']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Seed a reproducible synthetic dataset: users, movies, ratings and threaded comments.
+
+    python -m benchmarks.seed --database bench.db --users 1000 --movies 5000 --ratings 50000 --comments 20000
+
+The same --seed always produces the same rows (timestamps are relative to
+now). Every derived table is filled too: rating stats, counters, leaderboards,
+trending scores and, unless --no-similar, the similar-movie neighbours and the
+content index (at CONTENT_INDEX_PATH), so no benchmark pays for building them.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import create_engine, text, update
+
+from app import counters, leaderboard, models, recommender, trending
+from app.aggregates import backfill_rating_stats
+from app.content_index import CONTENT_INDEX_PATH, ContentIndex
+from app.database import Storage, database_options
+from app.migrations import run_migrations
+from app.utils import get_password_hash
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench-password"
+
+CHUNK_SIZE = 10000
+RATING_DAYS = 60  # spread over more than the longest leaderboard window
+REPLY_SHARE = 0.6  # share of comments that answer an earlier comment
+MAX_REPLY_DEPTH = 8
+
+# A small vocabulary, so searches and content similarity find matches.
+WORDS = (
+    "space station dragon river night city winter storm garden empire ghost island summer train "
+    "detective robot queen ocean desert forest secret mirror silver shadow journey machine heart "
+    "song war peace family escape return fire glass moon star road house dream last first"
+).split()
+
+
+def sentence(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def popular(rng: random.Random, count: int) -> int:
+    """An id in 1..count, skewed towards low ids like real popularity."""
+    return int(count * rng.random() ** 2) + 1
+
+
+def insert_chunks(connection, sql: str, rows: list):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        connection.execute(text(sql), rows[start:start + CHUNK_SIZE])
+
+
+def make_users(rng: random.Random, count: int, hashed_password: str) -> list:
+    # User 1 is the account benchmarks log in as; the rest share its hash,
+    # since hashing one password per user would dominate seeding time.
+    rows = [{"username": BENCH_USERNAME, "email": f"{BENCH_USERNAME}@example.com", "hashed_password": hashed_password}]
+    rows += [{"username": f"user{i}", "email": f"user{i}@example.com", "hashed_password": hashed_password}
+             for i in range(2, count + 1)]
+    return rows
+
+
+def make_movies(rng: random.Random, count: int, users: int, now: datetime) -> list:
+    return [
+        {"title": sentence(rng, 2, 4).title(), "description": sentence(rng, 8, 20),
+         "release_date": now - timedelta(days=rng.randint(0, 20000)), "user_id": rng.randint(1, users),
+         "updated_at": now}
+        for _ in range(count)
+    ]
+
+
+def make_ratings(rng: random.Random, count: int, users: int, movies: int, now: datetime) -> list:
+    seen = set()
+    rows = []
+    while len(rows) < count:
+        pair = (rng.randint(1, users), popular(rng, movies))
+        if pair in seen:
+            continue
+        seen.add(pair)
+        rows.append({"user_id": pair[0], "movie_id": pair[1], "rating": float(rng.randint(1, 5)),
+                     "created_at": now - timedelta(seconds=rng.uniform(0, RATING_DAYS * 86400))})
+    return rows
+
+
+def make_comments(rng: random.Random, count: int, users: int, movies: int, now: datetime) -> list:
+    """Comments in id order; replies point at an earlier comment on the same movie."""
+    by_movie = {}
+    depth = {}
+    rows = []
+    for comment_id in range(1, count + 1):
+        movie_id = popular(rng, movies)
+        earlier = by_movie.setdefault(movie_id, [])
+        parent_id = None
+        if earlier and rng.random() < REPLY_SHARE:
+            parent_id = rng.choice(earlier)
+            if depth[parent_id] >= MAX_REPLY_DEPTH:
+                parent_id = None
+        depth[comment_id] = depth[parent_id] + 1 if parent_id else 0
+        earlier.append(comment_id)
+        rows.append({"content": sentence(rng, 5, 30), "movie_id": movie_id, "user_id": rng.randint(1, users),
+                     "parent_comment_id": parent_id, "created_at": now - timedelta(seconds=count - comment_id)})
+    return rows
+
+
+def daily_buckets(ratings: list, today: int) -> list:
+    buckets = {}
+    for rating in ratings:
+        day = leaderboard.day_number(rating["created_at"])
+        if day > today - leaderboard.KEEP_DAYS:
+            bucket = buckets.setdefault((rating["movie_id"], day), [0, 0.0])
+            bucket[0] += 1
+            bucket[1] += rating["rating"]
+    return [{"movie_id": movie_id, "day": day, "rating_count": count, "rating_sum": total}
+            for (movie_id, day), (count, total) in buckets.items()]
+
+
+async def fill_async_derived(url: str, events: list, content_index_path: Optional[str]):
+    """The content index and trending scores, which are built through the app's async code."""
+    db = Storage(url, **database_options(url))
+    await db.connect()
+    try:
+        if content_index_path:
+            await ContentIndex(content_index_path).catch_up(rebuild=True, db=db)
+        scores = trending.TrendingScores()
+        for movie_id, weight, at in sorted(events, key=lambda event: event[2]):
+            scores.record(movie_id, weight, trending.to_timestamp(at))
+        await trending.checkpoint(scores, db)
+    finally:
+        await db.disconnect()
+
+
+def seed(url: str, users: int = 1000, movies: int = 5000, ratings: int = 50000, comments: int = 20000,
+         seed: int = 0, similar: bool = True, content_index_path: str = CONTENT_INDEX_PATH) -> dict:
+    """Migrate an empty database at ``url`` and fill it; returns the row counts actually written."""
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    users = max(users, 1)
+    movies = max(movies, 1)
+    # Each user rates a movie at most once; leave room so sampling pairs stays quick.
+    ratings = min(ratings, users * movies // 2)
+    now = datetime.utcnow()
+    today = leaderboard.day_number(now)
+
+    engine = create_engine(url)
+    run_migrations(engine)
+    with engine.begin() as connection:
+        if connection.execute(text("SELECT COUNT(*) FROM users")).scalar():
+            raise ValueError(f"{url} already has data; seed needs an empty database")
+        # Rows are inserted in order into empty tables, so ids run from 1.
+        insert_chunks(connection, "INSERT INTO users (username, email, hashed_password) "
+                                  "VALUES (:username, :email, :hashed_password)",
+                      make_users(rng, users, get_password_hash(BENCH_PASSWORD)))
+        insert_chunks(connection, "INSERT INTO movies (title, description, release_date, user_id, updated_at) "
+                                  "VALUES (:title, :description, :release_date, :user_id, :updated_at)",
+                      make_movies(rng, movies, users, now))
+        rating_rows = make_ratings(rng, ratings, users, movies, now)
+        insert_chunks(connection, "INSERT INTO ratings (rating, movie_id, user_id, created_at) "
+                                  "VALUES (:rating, :movie_id, :user_id, :created_at)", rating_rows)
+        comment_rows = make_comments(rng, comments, users, movies, now)
+        insert_chunks(connection, "INSERT INTO comments (content, movie_id, user_id, parent_comment_id, created_at) "
+                                  "VALUES (:content, :movie_id, :user_id, :parent_comment_id, :created_at)",
+                      comment_rows)
+
+        backfill_rating_stats(connection)
+        insert_chunks(connection, "INSERT INTO movie_rating_daily (movie_id, day, rating_count, rating_sum) "
+                                  "VALUES (:movie_id, :day, :rating_count, :rating_sum)",
+                      daily_buckets(rating_rows, today))
+        for sql, params in leaderboard.roll_statements(today, rebuild_all_time=True):
+            connection.execute(text(sql), params)
+        connection.execute(update(models.Movie).values(comment_count=counters.actual_comment_count()))
+
+    if similar:
+        with engine.connect() as connection:
+            recommender.refresh(connection, full=True)
+    engine.dispose()
+    events = [(row["movie_id"], trending.TRENDING_RATING_WEIGHT, row["created_at"]) for row in rating_rows]
+    events += [(row["movie_id"], trending.TRENDING_COMMENT_WEIGHT, row["created_at"]) for row in comment_rows]
+    asyncio.run(fill_async_derived(url, events, content_index_path if similar else None))
+    return {"users": users, "movies": movies, "ratings": ratings, "comments": comments, "seed": seed,
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True, help="SQLite file to create")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--movies", type=int, default=5000)
+    parser.add_argument("--ratings", type=int, default=50000)
+    parser.add_argument("--comments", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-similar", action="store_true",
+                        help="skip computing similar movies and the content index")
+    args = parser.parse_args()
+    report = seed(f"sqlite:///{args.database}", users=args.users, movies=args.movies, ratings=args.ratings,
+                  comments=args.comments, seed=args.seed, similar=not args.no_similar)
+    print(f"seeded {args.database}: {report}")
+
+
+if __name__ == "__main__":
+    main()